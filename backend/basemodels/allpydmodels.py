@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, conlist
+from typing import List, Optional, Union
 from datetime import datetime
 
 class UserLogin(BaseModel):
@@ -18,6 +18,30 @@ class InfoDict(BaseModel):
     language: str
     username: str
 
+class LeaderboardQuery(BaseModel):
+    language: str
+    username: str
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+
+class LeaderboardAround(BaseModel):
+    language: str
+    username: str
+    window: int = 5
+
+class ReviewResult(BaseModel):
+    concept: str
+    #SM-2 recall quality: 0 (blackout) .. 5 (perfect); below 3 counts as forgotten
+    quality: int = Field(ge=0, le=5)
+    #memory game words are not always stored yet; these let them be added
+    pronunciation: Optional[str] = None
+    english: Optional[str] = None
+
+class ReviewResults(BaseModel):
+    language: str
+    username: str
+    results: List[ReviewResult]
+
 class ScoreDict(BaseModel):
     language: str
     username: str
@@ -31,6 +55,9 @@ class StoryNarrate(BaseModel):
     transcription: str
     username: str
 
+class StoryFeedbackQuery(BaseModel):
+    username: str
+
 class NarrationFeedback(BaseModel):
     accuracy_score: float
     pronunciation_feedback: str
@@ -64,7 +91,82 @@ class LanguageTeaching(BaseModel):
 class TongueTwister(BaseModel):
     language: str
 
+class LexiconSearch(BaseModel):
+    language: str
+    query: str
+    limit: int = Field(default=20, ge=1, le=100)
+
 class AnalyzeSpeech(BaseModel):
     language: str
     transcription: str
-    username: str
\ No newline at end of file
+    username: str
+
+
+#shapes of the JSON replies Gemini is asked for, checked by utils.llm.invoke_json
+class Flashcard(BaseModel):
+    new_concept: str
+    concept_pronunciation: str
+    english: str
+    meaning: str
+    example: str
+    example_pronunciation: str
+    translation: str
+
+class DailiesResponse(BaseModel):
+    cards: List[Flashcard]
+
+class MemoryPairsResponse(BaseModel):
+    #each pair is [word, english, pronunciation]
+    pairs: List[conlist(str, min_length=3, max_length=3)]
+
+class LanguageTeachingResponse(BaseModel):
+    response: str
+    examples: Union[str, List[str]]
+    interesting_facts: Union[str, List[str]]
+
+class TongueTwisterItem(BaseModel):
+    text: str
+    pronunciation: str
+    translation: str
+
+class TongueTwistersResponse(BaseModel):
+    tongue_twisters: List[TongueTwisterItem]
+
+class SpeechAnalysisResponse(BaseModel):
+    original: str
+    correct_form: str
+    alternatives: List[str]
+    score: Union[str, float]
+
+class GeneratedStoryPart(BaseModel):
+    part_number: int
+    content: str
+    translation: str
+    description: str
+
+class GeneratedStory(BaseModel):
+    title: str
+    title_english: str
+    parts: List[GeneratedStoryPart] = Field(min_length=5, max_length=5)
+
+class StoryOpening(BaseModel):
+    title: str
+    title_english: str
+    part: GeneratedStoryPart
+
+class StoryContinuation(BaseModel):
+    parts: List[GeneratedStoryPart]
+
+class NarrationEvaluation(BaseModel):
+    accuracy_score: Union[str, float]
+    pronunciation_feedback: str
+    grammar_feedback: str
+    vocabulary_feedback: str
+    improvement_areas: List[str]
+    positive_points: List[str]
+
+class FinalFeedback(BaseModel):
+    overall_score: Union[str, float]
+    key_strengths: List[str]
+    main_improvement_areas: List[str]
+    learning_recommendations: List[str]
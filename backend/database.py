@@ -1,24 +1,426 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne
 from pymongo.server_api import ServerApi
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import dotenv
 import os
 from fastapi.security import OAuth2PasswordBearer
 import google.generativeai as genai
 import json
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from basemodels.allpydmodels import *
 from utils.all_helper import *
+from utils.metrics import MONGO_LATENCY
+from utils.llm_providers import get_provider
 
 # MongoDB connection
-dotenv.load_dotenv()
 uri = os.getenv('MONGO_URI')
-client = MongoClient(uri, server_api=ServerApi('1'))
-db = client["auth_db"]
-users_collection = db["users"]
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', '300000'))
+# threads that may wait on Mongo at once; more than the socket pool would only queue inside pymongo
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', str(MONGO_MAX_POOL_SIZE)))
+
+AUTH_DB = "auth_db"
+STORY_DB = "story_db"
+LEXICON_DB = "lexicon_db"
+
+
+class Resources:
+    """The process's one Mongo client, its repositories and the LLM provider.
+
+    Nothing connects at import time: the lifespan opens the clients in each
+    worker, after any pre-fork, and closes them on shutdown. A client
+    inherited across a fork is never reused; the child builds its own.
+    The login, register, leaderboard, /storyfeedback and /stats routes
+    receive it through Depends(get_resources). Every other route, the
+    generation helpers and the background workers use the same container
+    through the module-level repositories below, and the LLM provider
+    through get_provider().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mongo = None
+        self._pid = None
+        # repositories resolve their collections through this container at call time
+        self.users = UsersRepository(AsyncCollection(self, AUTH_DB, "users"))
+        self.stories = ActiveStoriesRepository(AsyncCollection(self, STORY_DB, "active_stories"))
+        self.story_feedback = StoryFeedbackRepository(AsyncCollection(self, STORY_DB, "story_feedback"))
+        self.review_cards = ReviewCardsRepository(AsyncCollection(self, AUTH_DB, "review_cards"))
+        self.lexicon = LexiconRepository(self)
+
+    @property
+    def mongo(self):
+        with self._lock:
+            if self._mongo is None or self._pid != os.getpid():
+                self._mongo = MongoClient(
+                    uri,
+                    server_api=ServerApi('1'),
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
+                    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                )
+                self._pid = os.getpid()
+            return self._mongo
+
+    @property
+    def llm(self):
+        return get_provider()
+
+    def collection(self, database: str, name: str):
+        return self.mongo[database][name]
+
+    def open(self):
+        self.mongo
+        self.llm
+
+    def close(self):
+        with self._lock:
+            if self._mongo is not None and self._pid == os.getpid():
+                self._mongo.close()
+            self._mongo = None
+            self._pid = None
+
+
+db_executor = ThreadPoolExecutor(max_workers=DB_MAX_CONCURRENCY, thread_name_prefix="mongo")
+
+
+class AsyncCollection:
+    """Awaitable facade over a pymongo collection.
+
+    Each call runs on the Mongo thread pool, so a slow round trip only holds a
+    pool thread and never the event loop.
+    """
+
+    def __init__(self, resources: Resources, database: str, name: str):
+        self.resources = resources
+        self.database = database
+        self.name = name
+
+    @property
+    def collection(self):
+        return self.resources.collection(self.database, self.name)
+
+    async def _run(self, operation: str, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+        finally:
+            MONGO_LATENCY.labels(self.name, operation).observe(time.perf_counter() - started)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run("find_one", self.collection.find_one, *args, **kwargs)
+
+    async def find(self, *args, **kwargs) -> list:
+        # cursors are lazy, so materialise them on the pool thread as well
+        return await self._run("find", lambda: list(self.collection.find(*args, **kwargs)))
+
+    async def aggregate(self, pipeline: list) -> list:
+        return await self._run("aggregate", lambda: list(self.collection.aggregate(pipeline)))
+
+    async def count_documents(self, *args, **kwargs) -> int:
+        return await self._run("count_documents", self.collection.count_documents, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run("insert_one", self.collection.insert_one, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run("update_one", self.collection.update_one, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run("delete_many", self.collection.delete_many, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run("bulk_write", self.collection.bulk_write, *args, **kwargs)
+
+    async def replace_one(self, *args, **kwargs):
+        return await self._run("replace_one", self.collection.replace_one, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run("find_one_and_update", self.collection.find_one_and_update, *args, **kwargs)
+
+
+class UsersRepository:
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def get_by_username(self, username: str, projection: dict = None):
+        return await self.collection.find_one({"username": username}, projection)
+
+    async def get_by_id(self, user_id, projection: dict = None):
+        return await self.collection.find_one({"_id": user_id}, projection)
+
+    async def create(self, user_doc: dict):
+        return await self.collection.insert_one(user_doc)
+
+    async def set_password(self, user_id, hashed_password: str):
+        return await self.collection.update_one(
+            {"_id": user_id},
+            {"$set": {"password": hashed_password}}
+        )
+
+    async def increment_score(self, username: str, language: str, amount: int):
+        return await self.collection.update_one(
+            {"username": username},
+            {"$inc": {f"languages.{language}": amount}}
+        )
+
+    async def bulk_increment(self, deltas: dict):
+        """Apply {(username, language): amount} increments in one unordered bulk_write."""
+        operations = [
+            UpdateOne({"username": username}, {"$inc": {f"languages.{language}": amount}})
+            for (username, language), amount in deltas.items()
+            if amount
+        ]
+        if operations:
+            return await self.collection.bulk_write(operations, ordered=False)
+
+    async def find(self, query: dict, projection: dict = None, sort: list = None, limit: int = 0) -> list:
+        return await self.collection.find(query, projection, sort=sort, limit=limit)
+
+    async def count(self, query: dict) -> int:
+        return await self.collection.count_documents(query)
+
+
+class ActiveStoriesRepository:
+    """Story documents per user.
+
+    A user has at most one active story and at most one prefetched story with
+    status "pending"; documents without a status predate prefetching and
+    count as active.
+    """
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    @staticmethod
+    def _active(user_id) -> dict:
+        return {"user_id": user_id, "status": {"$ne": "pending"}}
+
+    @staticmethod
+    def _pending(user_id) -> dict:
+        return {"user_id": user_id, "status": "pending"}
+
+    async def get_for_user(self, user_id):
+        return await self.collection.find_one(self._active(user_id))
+
+    async def delete_for_user(self, user_id):
+        return await self.collection.delete_many(self._active(user_id))
+
+    async def create(self, story_doc: dict):
+        return await self.collection.insert_one(story_doc)
+
+    async def update_for_user(self, user_id, update: dict):
+        return await self.collection.update_one(self._active(user_id), update)
+
+    async def append_part(self, story_id, part: dict, lease_until: datetime = None):
+        # by _id: the user may have moved on to another story meanwhile; and only into an
+        # empty slot, so a late writer never adds a part that was already filled in
+        update = {"$push": {"parts": part}}
+        if lease_until is not None:
+            update["$set"] = {"completing_until": lease_until}
+        return await self.collection.update_one(
+            {"_id": story_id, f"parts.{part['part_number'] - 1}": {"$exists": False}}, update
+        )
+
+    async def extend_lease(self, story_id, lease_until: datetime):
+        # only while the story is still being completed: fill_parts clears the lease when it is done
+        return await self.collection.update_one(
+            {"_id": story_id, "completing_until": {"$exists": True}},
+            {"$set": {"completing_until": lease_until}}
+        )
+
+    async def fill_parts(self, story_id, parts: list):
+        """Append parts in one write, only if the story still ends right before the first of them."""
+        if not parts:
+            return None
+        return await self.collection.update_one(
+            {
+                "_id": story_id,
+                f"parts.{parts[0]['part_number'] - 2}": {"$exists": True},
+                f"parts.{parts[0]['part_number'] - 1}": {"$exists": False},
+            },
+            {"$push": {"parts": {"$each": parts}}, "$unset": {"completing_until": ""}}
+        )
+
+    async def set_part_feedback(self, story_id, index: int, feedback: dict):
+        return await self.collection.update_one(
+            {"_id": story_id},
+            {"$set": {f"parts.{index}.user_narration.feedback": feedback}}
+        )
+
+    async def has_pending(self, user_id) -> bool:
+        return await self.collection.find_one(self._pending(user_id), {"_id": 1}) is not None
+
+    async def save_pending(self, user_id, story_doc: dict):
+        return await self.collection.replace_one(self._pending(user_id), story_doc, upsert=True)
+
+    async def promote_pending(self, user_id, language: str, level: str):
+        # a single write turns a matching prefetched story into the active one
+        return await self.collection.find_one_and_update(
+            {**self._pending(user_id), "language": language, "level": level},
+            {"$set": {"status": "active", "created_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def discard_pending(self, user_id):
+        return await self.collection.delete_many(self._pending(user_id))
+
+
+class StoryFeedbackRepository:
+    """Latest finished-story summary per user."""
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def save(self, user_id, feedback: dict):
+        doc = {"user_id": user_id, "updated_at": datetime.utcnow(), **feedback}
+        return await self.collection.replace_one({"user_id": user_id}, doc, upsert=True)
+
+    async def get_for_user(self, user_id):
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+
+
+class ReviewCardsRepository:
+    """Flashcards a user has been served, one document per (user, language, concept).
+
+    Documents carry the card itself and its SM-2 state (repetitions,
+    interval_days, ease, due_at). Deck queries are range scans on the
+    {user_id, language, due_at} index.
+    """
+
+    def __init__(self, collection: AsyncCollection):
+        self.collection = collection
+
+    async def due(self, user_id, language: str, now: datetime, limit: int) -> list:
+        return await self.collection.find(
+            {"user_id": user_id, "language": language, "due_at": {"$lte": now}},
+            {"_id": 0, "concept": 1, "card": 1},
+            sort=[("due_at", ASCENDING)],
+            limit=limit
+        )
+
+    async def get_many(self, user_id, language: str, concepts: list) -> list:
+        return await self.collection.find({"user_id": user_id, "language": language, "concept": {"$in": concepts}})
+
+    async def add(self, user_id, language: str, cards: list, state: dict):
+        # upserts: two requests racing to add the same new card store it once
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "language": language, "concept": card["new_concept"]},
+                {"$setOnInsert": {"card": card, **state}},
+                upsert=True
+            )
+            for card in cards
+        ]
+        if operations:
+            return await self.collection.bulk_write(operations, ordered=False)
+
+    async def save_states(self, states: dict):
+        """Write {_id: sm2 state} in one unordered bulk_write."""
+        operations = [UpdateOne({"_id": card_id}, {"$set": state}) for card_id, state in states.items()]
+        if operations:
+            return await self.collection.bulk_write(operations, ordered=False)
+
+
+def lexicon_collection_name(language: str) -> str:
+    return f"lexicon_{language.lower()}"
+
+
+class LexiconRepository:
+    """Deduplicated words and tongue twisters per language, one collection per language.
+
+    Entries are keyed by their normalised text (unique index); "seen" counts
+    how often generation produced them again. The identity fields are fixed
+    by the first sighting, the rest is refreshed by every later one, so a
+    word first met in a memory pair gains its meaning and example once a
+    flashcard for it comes along.
+    """
+
+    IDENTITY_FIELDS = ("key", "kind", "level", "concept")
+
+    def __init__(self, resources: Resources):
+        self.resources = resources
+        self._collections = {}
+
+    def collection(self, language: str) -> AsyncCollection:
+        name = lexicon_collection_name(language)
+        if name not in self._collections:
+            self._collections[name] = AsyncCollection(self.resources, LEXICON_DB, name)
+        return self._collections[name]
+
+    async def upsert_many(self, language: str, entries: list):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"key": entry["key"]},
+                {
+                    "$setOnInsert": {
+                        **{field: entry[field] for field in self.IDENTITY_FIELDS},
+                        "first_seen_at": now,
+                    },
+                    "$set": {field: value for field, value in entry.items() if field not in self.IDENTITY_FIELDS},
+                    "$addToSet": {"sources": source},
+                    "$inc": {"seen": 1},
+                },
+                upsert=True
+            )
+            for source, entry in entries
+        ]
+        if operations:
+            return await self.collection(language).bulk_write(operations, ordered=False)
+
+    async def count(self, language: str, query: dict) -> int:
+        return await self.collection(language).count_documents(query)
+
+    async def sample(self, language: str, query: dict, size: int) -> list:
+        # $match on the {kind, level} index, then a random pick among the matches
+        return await self.collection(language).aggregate([
+            {"$match": query},
+            {"$sample": {"size": size}},
+            {"$project": {"_id": 0}},
+        ])
+
+    async def search(self, language: str, text: str, limit: int) -> list:
+        return await self.collection(language).find(
+            {"$text": {"$search": text}},
+            {"_id": 0, "score": {"$meta": "textScore"}},
+            sort=[("score", {"$meta": "textScore"})],
+            limit=limit
+        )
+
+
+resources = Resources()
+#aliases for code that is not handed the container by Depends: background workers and the story,
+#score, review and lexicon helpers. They resolve the same per-process client at call time
+users_repo = resources.users
+stories_repo = resources.stories
+story_feedback_repo = resources.story_feedback
+review_cards_repo = resources.review_cards
+lexicon_repo = resources.lexicon
+
+
+#dependencies for routers: the lifespan puts the container on app.state
+def get_resources(request: Request) -> Resources:
+    return request.app.state.resources
+
+def get_users_repo(resources: Resources = Depends(get_resources)) -> UsersRepository:
+    return resources.users
+
+def get_story_feedback_repo(resources: Resources = Depends(get_resources)) -> StoryFeedbackRepository:
+    return resources.story_feedback
 
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
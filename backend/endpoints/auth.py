@@ -1,40 +1,31 @@
 from fastapi import *
+from pymongo.errors import DuplicateKeyError
 from basemodels.allpydmodels import *
 from database import *
 from utils.all_helper import *
 from utils.story_helper import *
-import hashlib
+from utils.user_cache import user_profiles
+from utils.password_pool import check_login_password_async, hash_password_async
 
 router = APIRouter()
 
 @router.post("/login")
-async def login(user_data: UserLogin):
-    user = users_collection.find_one({"username": user_data.username})
+async def login(user_data: UserLogin, users_repo: UsersRepository = Depends(get_users_repo)):
+    user = await users_repo.get_by_username(user_data.username)
     password_valid = False
     migrated = False
 
     if user:
-        # Pre-hash with SHA256 to support long passwords and handle migration
-        input_hash = hashlib.sha256(user_data.password.encode('utf-8')).hexdigest()
-        
-        # Try verifying with new method (SHA256 pre-hash)
-        if verify_password(input_hash, user["password"]):
-            password_valid = True
-        # Fallback: Try verifying with legacy method (raw password) if length permits
-        elif len(user_data.password.encode('utf-8')) <= 72:
-            try:
-                if verify_password(user_data.password, user["password"]):
-                    password_valid = True
-                    # Migrate to new method
-                    new_hashed = get_password_hash(input_hash)
-                    users_collection.update_one(
-                        {"_id": user["_id"]}, 
-                        {"$set": {"password": new_hashed}}
-                    )
-            except Exception:
-                pass # Fallback failed or error during legacy check
+        # SHA256 pre-hash check, legacy raw-password fallback and re-hash all run
+        # in one call on the password process pool, off the event loop
+        password_valid, new_hashed = await check_login_password_async(user_data.password, user["password"])
+        if new_hashed:
+            # Migrate legacy hash to the SHA256 pre-hash method
+            await users_repo.set_password(user["_id"], new_hashed)
 
     if password_valid:
+        # the user is about to hit the game endpoints; have their profile ready
+        user_profiles.put(user_data.username, user)
         access_token = create_access_token(
             data={"sub": user_data.username}
         )
@@ -50,8 +41,8 @@ async def login(user_data: UserLogin):
     )
 
 @router.post("/register")
-async def register(user_data: UserRegister):
-    existing_user = users_collection.find_one({"username": user_data.username})
+async def register(user_data: UserRegister, users_repo: UsersRepository = Depends(get_users_repo)):
+    existing_user = await users_repo.get_by_username(user_data.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -60,23 +51,32 @@ async def register(user_data: UserRegister):
     
     # 2025-UPDATE: Pre-hash password with SHA256 to bypass bcrypt 72-byte limit
     # This allows passwords of any length to be securely stored.
-    sha256_password = hashlib.sha256(user_data.password.encode('utf-8')).hexdigest()
-    hashed_password = get_password_hash(sha256_password)
+    hashed_password = await hash_password_async(user_data.password)
     
     access_token = create_access_token(
         data={"sub": user_data.username}
     )
 
-    users_collection.insert_one({
+    new_user = {
         "username": user_data.username,
         "password": hashed_password,
-        "languages": {"SPANISH":0, "FRENCH":0, "GERMAN":0, "ITALIAN":0, "GUJARATI":0, "TELUGU":0, "JAPANESE":0},
-    })
+        "languages": {language: 0 for language in SUPPORTED_LANGUAGES},
+    }
+    try:
+        result = await users_repo.create(new_user)
+    except DuplicateKeyError:
+        # another registration took the name between the check above and this insert
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already exists"
+        )
+    # write-through: the profile is exactly what was inserted, no need to read it back
+    user_profiles.put(user_data.username, {**new_user, "_id": result.inserted_id})
     return {
         "status": "success",
         "message": "Registration successful",
         "username": user_data.username,
-        "languages": users_collection.find_one({"username": user_data.username})["languages"],
+        "languages": new_user["languages"],
         "access_token": access_token,
     }
 
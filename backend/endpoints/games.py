@@ -3,45 +3,50 @@ from basemodels.allpydmodels import *
 from utils.all_helper import *
 from utils.story_helper import *
 from database import *
+from utils.leaderboard import top_page, around_user
+from utils.user_cache import get_user_profile
+from utils.score_buffer import score_buffer
+from utils.streaming import sse_event
+from fastapi.responses import StreamingResponse
 import traceback
 
 router = APIRouter()
 
 @router.post("/leaderboard")
-async def leaderboard(info_dict: InfoDict):
+async def leaderboard(info_dict: LeaderboardQuery, users_repo: UsersRepository = Depends(get_users_repo)):
     language = info_dict.language.upper()
 
-    try:    
-        # Find users who have points in the specified language
-        pipeline = [
-            {"$match": {f"languages.{language}": {"$exists": True}}},
-            {"$project": {
-                "_id": 0,
-                "username": 1,
-                "points": f"$languages.{language}"
-            }},
-            {"$sort": {"points": -1}},
-            {"$group": {
-                "_id": None,
-                "users": {"$push": "$$ROOT"}
-            }},
-            {"$unwind": {"path": "$users", "includeArrayIndex": "rank"}},
-            {"$project": {
-                "_id": 0,
-                "username": "$users.username",
-                "points": "$users.points",
-                "rank": {"$add": ["$rank", 1]}
-            }}
-        ]
-    
-        leaderboard_users = list(users_collection.aggregate(pipeline))
+    try:
+        # One page of the top-K, ranked by points then username
+        page = await top_page(users_repo, language, info_dict.limit, info_dict.cursor)
         return {
             "language": language,
-            "leaderboard": leaderboard_users
+            "leaderboard": page["leaderboard"],
+            "next_cursor": page["next_cursor"]
         }
     except:
         return{
             "language": language,
+            "leaderboard": [],
+            "next_cursor": None
+        }
+
+#the user's rank plus a window of neighbours above and below
+@router.post("/leaderboard/around")
+async def leaderboard_around(info_dict: LeaderboardAround, users_repo: UsersRepository = Depends(get_users_repo)):
+    language = info_dict.language.upper()
+
+    try:
+        around = await around_user(users_repo, language, info_dict.username, info_dict.window)
+        return {
+            "language": language,
+            **around
+        }
+    except:
+        return {
+            "language": language,
+            "rank": None,
+            "points": None,
             "leaderboard": []
         }
 
@@ -51,17 +56,14 @@ async def update_score(info_dict: ScoreDict):
     language = info_dict.language.upper()
     score = info_dict.score
     current_user = info_dict.username
-    #update the current user's points in the database
-    users_collection.update_one(
-        {"username": current_user},
-        {"$inc": {f"languages.{language}": score}}
-    )
+    #buffer the increment; it is merged with others and written in the next flush
+    score_buffer.add(current_user, language, score)
 
 @router.post("/getscores")
 async def get_scores(info_dict: InfoDict):
     #get the languages dict from the database of the current user
     current_user = info_dict.username
-    user_languages = users_collection.find_one({"username": current_user})["languages"]
+    user_languages = (await get_user_profile(current_user))["languages"]
     try:
         return {
             "languages": user_languages
@@ -77,8 +79,9 @@ async def start_story(info_dict: StoryStart):
     language = info_dict.language.upper()
     current_user = info_dict.username
     #get points of the user with the current_user username for language from the database
-    user_points = users_collection.find_one({"username": current_user})["languages"][language]
-    user_id = users_collection.find_one({"username": current_user})["_id"]
+    profile = await get_user_profile(current_user)
+    user_points = profile["languages"][language]
+    user_id = profile["_id"]
     level = determine_user_level(user_points)
     try:
         return await generate_and_start_story(user_id, language, level)
@@ -87,9 +90,36 @@ async def start_story(info_dict: StoryStart):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Error generating story")
 
+#streaming variant of /storystart: Server-Sent Events, part 1 arrives before part 5 is generated
+@router.post("/storystart/stream")
+async def start_story_stream(info_dict: StoryStart):
+    language = info_dict.language.upper()
+    profile = await get_user_profile(info_dict.username)
+    level = determine_user_level(profile["languages"][language])
+
+    async def events():
+        try:
+            async for event, data in stream_and_start_story(profile["_id"], language, level):
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"Error streaming story: {e}")
+            traceback.print_exc()
+            yield sse_event("error", {"detail": "Error generating story"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+#background Gemini summary of the last finished story (when FINAL_FEEDBACK_LLM is on)
+@router.post("/storyfeedback")
+async def story_feedback(info_dict: StoryFeedbackQuery, story_feedback_repo: StoryFeedbackRepository = Depends(get_story_feedback_repo)):
+    user_id = (await get_user_profile(info_dict.username))["_id"]
+    feedback = await story_feedback_repo.get_for_user(user_id)
+    if not feedback:
+        return {"status": "none", "summary": None}
+    return feedback
+
 @router.post("/storynarrate")
 async def submit_narration(info_dict: StoryNarrate):
     transcription = info_dict.transcription
     current_user = info_dict.username
-    user_id = users_collection.find_one({"username": current_user})["_id"]
+    user_id = (await get_user_profile(current_user))["_id"]
     return await save_part_narration(user_id,  transcription)
@@ -3,6 +3,18 @@ from basemodels.allpydmodels import *
 from utils.all_helper import *
 from utils.story_helper import *
 from database import *
+from utils.genai_executor import stream_genai
+from utils.single_flight import run_genai_shared
+from utils.streaming import IncrementalJSONFields, sse_event
+from fastapi.responses import StreamingResponse
+from utils.content_pool import dailies_pool, memory_pairs_pool
+from utils.user_cache import get_user_profile
+from utils.review_deck import review_deck
+from utils.lexicon import lexicon, entries_from_twisters
+from utils.content_pool import is_generated
+from utils.semantic_cache import semantic_cache
+from utils.score_buffer import score_buffer
+from pydantic import ValidationError
 import traceback
 
 router = APIRouter()
@@ -12,10 +24,10 @@ async def dailies(info_dict: InfoDict):
     language = info_dict.language.upper()
     current_user = info_dict.username
     #get points of the user with the current_user username for language from the database
-    user_points = users_collection.find_one({"username": current_user})["languages"][language]
+    user_points = (await get_user_profile(current_user))["languages"][language]
     level = determine_user_level(user_points)
     try:
-        dailies_data = generate_dailies(language, level)
+        dailies_data = await dailies_pool.get(language, level)
         return {
             "dailies": dailies_data
         }
@@ -24,15 +36,36 @@ async def dailies(info_dict: InfoDict):
         traceback.print_exc()
         return {"dailies": {"cards": []}}
 
+#today's deck from the user's stored cards: due reviews first, new generated cards only to fill the gap
+@router.post("/dailies/deck")
+async def dailies_deck(info_dict: InfoDict):
+    language = info_dict.language.upper()
+    profile = await get_user_profile(info_dict.username)
+    level = determine_user_level(profile["languages"][language])
+    try:
+        return {"dailies": await review_deck.build(profile["_id"], language, level)}
+    except Exception as e:
+        print(f"Error building review deck: {e}")
+        traceback.print_exc()
+        return {"dailies": {"cards": [], "due": 0, "new": 0}}
+
+#results of the daily cards or the memory game, fed into the SM-2 schedule
+@router.post("/dailies/review")
+async def dailies_review(info_dict: ReviewResults):
+    language = info_dict.language.upper()
+    profile = await get_user_profile(info_dict.username)
+    updated = await review_deck.record(profile["_id"], language, info_dict.results)
+    return {"status": "success", "updated": updated}
+
 @router.post("/memorypairs")
 async def memory_pairs(info_dict: InfoDict):
     language = info_dict.language.upper()
     current_user = info_dict.username
-    user_points = users_collection.find_one({"username": current_user})["languages"][language]
+    user_points = (await get_user_profile(current_user))["languages"][language]
     level = determine_user_level(user_points)
     
     try:
-        pairs_data = generate_memory_pairs(language, level)
+        pairs_data = await memory_pairs_pool.get(language, level)
         return {
             "words": pairs_data
         }
@@ -44,32 +77,82 @@ async def memory_pairs(info_dict: InfoDict):
         }
 
 
+def _cacheable(response) -> bool:
+    #a streamed reply is only parsed field by field, so it is checked against the model before it is shared
+    if not is_generated(response):
+        return False
+    try:
+        LanguageTeachingResponse.model_validate(response)
+    except ValidationError:
+        return False
+    return True
+
+
 @router.post("/language_teacher")
 async def chat_with_language_teacher(
     info_dict: LanguageTeaching,
 ):
+    cached = semantic_cache.get(info_dict.language, info_dict.query)
+    if cached is not None:
+        return {"data": cached}
     try:
-        response = language_teaching_chat(info_dict.language, info_dict.query)
+        response = await run_genai_shared(language_teaching_chat, info_dict.language, info_dict.query)
+        if _cacheable(response):
+            semantic_cache.put(info_dict.language, info_dict.query, response)
         return {"data": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+#streaming variant of /language_teacher: each field is sent as soon as it is complete
+@router.post("/language_teacher/stream")
+async def chat_with_language_teacher_stream(
+    info_dict: LanguageTeaching,
+):
+    cached = semantic_cache.get(info_dict.language, info_dict.query)
+
+    async def events():
+        if cached is not None:
+            for name, value in cached.items():
+                yield sse_event("field", {"name": name, "value": value})
+            yield sse_event("done", cached)
+            return
+        parser = IncrementalJSONFields()
+        try:
+            async for chunk in stream_genai(stream_language_teaching_chat, info_dict.language, info_dict.query):
+                for _, name, value in parser.feed(chunk):
+                    yield sse_event("field", {"name": name, "value": value})
+            if _cacheable(parser.result):
+                semantic_cache.put(info_dict.language, info_dict.query, parser.result)
+            yield sse_event("done", parser.result)
+        except Exception as e:
+            print(f"GenAI Error (Chat stream): {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @router.post("/tongue_twisters")
 async def get_tongue_twisters(
     info_dict: TongueTwister,
 ):
     try:
-        twisters = generate_tongue_twisters(language=info_dict.language)
+        twisters = await run_genai_shared(generate_tongue_twisters, info_dict.language)
+        if is_generated(twisters):
+            lexicon.harvest(info_dict.language, "tongue_twisters", entries_from_twisters(twisters))
         return {"data": twisters}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+#full-text lookup over every word and twister generated so far for a language
+@router.post("/lexicon/search")
+async def lexicon_search(info_dict: LexiconSearch):
+    return {"entries": await lexicon.search(info_dict.language, info_dict.query, info_dict.limit)}
+
 @router.post("/speech_analysis")
 async def analyze_speech(info_dict: AnalyzeSpeech):
     language = info_dict.language.upper()
     transcript = info_dict.transcription
     current_user = info_dict.username
-    analysis_result = analyze_speech_transcript(language, transcript)
+    analysis_result = await run_genai_shared(analyze_speech_transcript, language, transcript)
     
     # Update user's points based on the speech score
     score_to_add = int(analysis_result["score"])
@@ -77,9 +160,6 @@ async def analyze_speech(info_dict: AnalyzeSpeech):
         score_to_add = 0
     elif score_to_add >= 8 and score_to_add <= 10:
         score_to_add = 2
-    users_collection.update_one(
-        {"username": current_user},
-        {"$inc": {f"languages.{language}": score_to_add}}
-    )
+    score_buffer.add(current_user, language, score_to_add)
     
     return analysis_result
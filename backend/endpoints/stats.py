@@ -0,0 +1,82 @@
+from fastapi import *
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, generate_latest
+from utils.genai_executor import genai_executor
+from utils.genai_scheduler import genai_scheduler, PRIORITIES
+from utils.content_pool import dailies_pool, memory_pairs_pool
+from utils.story_helper import story_prefetcher, progressive_stories, final_feedback_summaries, narration_feedback
+from utils.narration_scorer import narration_scorer
+from utils.user_cache import user_profiles
+from utils.password_pool import password_pool
+from utils.score_buffer import score_buffer
+from utils.review_deck import review_deck
+from utils.lexicon import lexicon
+from utils.semantic_cache import semantic_cache
+from utils.llm import llm_stats
+from database import Resources, get_resources
+from utils.single_flight import genai_flights
+from utils import profiling
+
+router = APIRouter()
+
+# point-in-time values, read when /metrics is scraped
+Gauge("langstar_genai_inflight", "Gemini calls running on the GenAI pool").set_function(
+    lambda: genai_executor.stats()["inflight"]
+)
+_queue_depth = Gauge("langstar_genai_queue_depth", "Gemini calls waiting for quota", ["priority"])
+for _priority in PRIORITIES:
+    _queue_depth.labels(_priority).set_function(lambda p=_priority: genai_scheduler.stats()["queue_depth"][p])
+Gauge("langstar_score_buffer_pending_keys", "Buffered score increments not yet written").set_function(
+    lambda: score_buffer.stats()["pending_keys"]
+)
+
+#runtime stats for the background/concurrency machinery
+@router.get("/stats")
+async def runtime_stats(resources: Resources = Depends(get_resources)):
+    return {
+        "genai": genai_executor.stats(),
+        "genai_scheduler": genai_scheduler.stats(),
+        "llm": llm_stats.snapshot(),
+        "llm_provider": resources.llm.usage(),
+        "single_flight": genai_flights.stats(),
+        "content_pool": {
+            "dailies": dailies_pool.stats(),
+            "memorypairs": memory_pairs_pool.stats(),
+        },
+        "story_prefetch": story_prefetcher.stats(),
+        "progressive_stories": progressive_stories.stats(),
+        "final_feedback_summaries": final_feedback_summaries.stats(),
+        "narration_scoring": {**narration_scorer.stats(), "llm_feedback": narration_feedback.stats()},
+        "user_cache": user_profiles.stats(),
+        "password_pool": password_pool.stats(),
+        "score_buffer": score_buffer.stats(),
+        "review_deck": review_deck.stats(),
+        "lexicon": lexicon.stats(),
+        "semantic_cache": semantic_cache.stats(),
+    }
+
+#Prometheus text exposition of the instruments in utils.metrics
+@router.get("/metrics")
+async def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def require_profile_token(token: str = Header(default="", alias=profiling.PROFILE_HEADER)):
+    if not profiling.token_matches(token):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+#profiles recorded by utils.profiling, newest first
+@router.get("/admin/profiles", dependencies=[Depends(require_profile_token)])
+async def list_profiles():
+    return {"profiles": profiling.profile_store.list()}
+
+#one profile as collapsed stacks, for flamegraph.pl or speedscope
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: int):
+    profile = profiling.profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return Response(
+        content=profile["collapsed"],
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.collapsed"'},
+    )
@@ -1,22 +1,75 @@
+#settings are read from the environment when each module is imported,
+#so .env is loaded once here, before any app module
+import dotenv
+dotenv.load_dotenv()
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import dotenv
 import os
 from fastapi.security import OAuth2PasswordBearer
 import google.generativeai as genai
 import json
+import asyncio
 from basemodels.allpydmodels import *
 from utils.all_helper import *
 from utils.story_helper import *
-from endpoints import auth, games, games_word
+from endpoints import auth, games, games_word, stats
 from database import *
+from utils.content_pool import content_pools, CONTENT_POOL_WARMUP
+from utils.story_helper import story_prefetcher, progressive_stories, final_feedback_summaries, narration_feedback
+from utils import schema_manager
+from utils.password_pool import password_pool
+from utils.score_buffer import score_buffer
+from utils.lexicon import lexicon
+from utils.semantic_cache import semantic_cache
+from utils.llm_resilience import last_known_good
+from utils.metrics import MetricsMiddleware
+from utils.profiling import ProfilingMiddleware, PROFILING_ENABLED
+from contextlib import asynccontextmanager
+
 
-app = FastAPI()
+SCHEMA_BOOTSTRAP = os.getenv('SCHEMA_BOOTSTRAP', '1') == '1'
+SCHEMA_CHECK = os.getenv('SCHEMA_CHECK', '0') == '1'
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    #clients are built here, in the worker, never at import time
+    app.state.resources = resources
+    resources.open()
+    loop = asyncio.get_running_loop()
+    if SCHEMA_BOOTSTRAP:
+        try:
+            await loop.run_in_executor(db_executor, schema_manager.apply_migrations)
+        except Exception as e:
+            print(f"Schema migration failed: {e}")
+    if SCHEMA_CHECK:
+        failures = await loop.run_in_executor(db_executor, schema_manager.check_query_plans)
+        if failures:
+            raise RuntimeError(f"Hot queries fall back to COLLSCAN: {', '.join(failures)}")
+    await score_buffer.start()
+    await loop.run_in_executor(None, semantic_cache.load)
+    if CONTENT_POOL_WARMUP:
+        for pool in content_pools:
+            pool.warm_up()
+    yield
+    await score_buffer.stop()
+    for pool in content_pools:
+        await pool.shutdown()
+    await story_prefetcher.shutdown()
+    await progressive_stories.shutdown()
+    await final_feedback_summaries.shutdown()
+    await narration_feedback.shutdown()
+    await lexicon.shutdown()
+    await loop.run_in_executor(None, semantic_cache.save)
+    await loop.run_in_executor(None, last_known_good.save)
+    password_pool.shutdown()
+    resources.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -27,10 +80,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# route latency/status histograms for /metrics
+app.add_middleware(MetricsMiddleware)
+# opt-in request profiling; not installed at all unless configured
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 #routers
 app.include_router(auth.router, tags=["Auth"])
 app.include_router(games.router, tags=["Games"])
 app.include_router(games_word.router, tags=["Games"])
+app.include_router(stats.router, tags=["Stats"])
 
 @app.middleware("http")
 async def add_cors_header(request, call_next):
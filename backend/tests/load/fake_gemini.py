@@ -0,0 +1,68 @@
+import json
+import math
+import random
+import time
+
+from utils.llm_providers import LLMProvider, LLMResponse, prompt_feature, local_reply
+
+# In-process stand-in for Gemini used by the load tests, registered as the
+# "fake" LLM provider (LLM_PROVIDER=fake). It answers every prompt with the local provider's templated JSON, after a
+# latency drawn from a log-normal distribution, and fails a configurable
+# share of calls the way the real client does (by raising).
+
+DEFAULT_LATENCY = {"median": 0.8, "sigma": 0.5, "failure_rate": 0.0}
+
+
+class FakeGeminiError(Exception):
+    pass
+
+
+class FakeGenerativeModel(LLMProvider):
+    """LLM provider with Gemini-like latency and failures: generate_content(prompt, stream=False, **kwargs).
+
+    latency maps a feature name (see prompt_feature) to {"median", "sigma",
+    "failure_rate"}; "default" applies to the rest. Seeded, so a run with the
+    same seed and request order draws the same latencies.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: dict = None, seed: int = 0):
+        super().__init__()
+        self.latency = {"default": dict(DEFAULT_LATENCY), **(latency or {})}
+        self._random = random.Random(seed)
+        self.calls = {}
+
+    def _profile(self, feature: str) -> dict:
+        return {**self.latency["default"], **self.latency.get(feature, {})}
+
+    def _draw(self, feature: str):
+        profile = self._profile(feature)
+        with self._lock:
+            self.calls[feature] = self.calls.get(feature, 0) + 1
+            delay = profile["median"] * math.exp(profile["sigma"] * self._random.gauss(0, 1)) if profile["median"] else 0.0
+            failed = self._random.random() < profile["failure_rate"]
+        return delay, failed
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        feature = prompt_feature(prompt)
+        delay, failed = self._draw(feature)
+        text = json.dumps(local_reply(prompt), ensure_ascii=False)
+        usage = {"prompt_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+        self._record_usage(usage["prompt_tokens"], usage["output_tokens"])
+        if not stream:
+            time.sleep(delay)
+            if failed:
+                raise FakeGeminiError(f"fake {feature} failure")
+            return LLMResponse(text, usage)
+        return self._stream(feature, text, delay, failed)
+
+    def _stream(self, feature: str, text: str, delay: float, failed: bool):
+        # time to first chunk is a third of the total, the rest is spread over 8 chunks
+        time.sleep(delay / 3)
+        size = math.ceil(len(text) / 8)
+        for start in range(0, len(text), size):
+            if failed and start >= len(text) // 2:
+                raise FakeGeminiError(f"fake {feature} stream failure")
+            yield LLMResponse(text[start:start + size])
+            time.sleep(delay * 2 / 3 / 8)
@@ -0,0 +1,259 @@
+"""Load test: boots the app against a local mongod and a fake Gemini, drives user journeys, writes a JSON baseline.
+
+    mongod --dbpath /tmp/langstar-load &
+    cd backend
+    python tests/load/run_load.py --rps 50 --duration 60 --output load_baseline.json
+    python tests/load/run_load.py --rps 50 --duration 60 --compare load_baseline.json
+
+Each journey is register -> dailies -> memorypairs -> updatescore ->
+storystart -> storynarrate x5 -> leaderboard. Journeys start on an open-loop
+schedule sized so the total request rate matches --rps. Users are created
+with a run-specific prefix and deleted afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+# Structure: backend/tests/load/run_load.py
+backend_path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+LANGUAGE = "SPANISH"
+REQUESTS_PER_JOURNEY = 11
+# what a client does when the next story part is still being written
+NARRATE_RETRIES = 5
+NARRATE_RETRY_DELAY = 0.5
+
+
+def configure_environment(mongo_uri: str):
+    # must happen before main is imported: the app reads its config at import time
+    os.environ["MONGO_URI"] = mongo_uri
+    os.environ.setdefault("SECRET_KEY", "load-test-secret")
+    os.environ.setdefault("ALGORITHM", "HS256")
+    os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    # the helpers get the fake Gemini registered in main() through get_provider()
+    os.environ["LLM_PROVIDER"] = "fake"
+    workdir = tempfile.mkdtemp(prefix="langstar-load-")
+    os.environ.setdefault("SCORE_WAL_PATH", os.path.join(workdir, "score_wal.log"))
+    os.environ.setdefault("LLM_LAST_GOOD_PATH", os.path.join(workdir, "llm_last_good.json"))
+    os.environ.setdefault("SEMANTIC_CACHE_PATH", os.path.join(workdir, "semantic_cache.json"))
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.journeys = 0
+        self.journeys_failed = 0
+
+    async def call(self, client, path: str, payload: dict):
+        started = time.perf_counter()
+        try:
+            response = await client.post(path, json=payload)
+        except Exception:
+            self.latencies[path].append(time.perf_counter() - started)
+            self.errors[path] += 1
+            raise
+        self.latencies[path].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[path] += 1
+        return response
+
+
+async def journey(client, recorder: Recorder, username: str):
+    user = {"language": LANGUAGE, "username": username}
+    try:
+        register = await recorder.call(client, "/register", {"username": username, "password": "load-test-password"})
+        register.raise_for_status()
+        await recorder.call(client, "/dailies", user)
+        await recorder.call(client, "/memorypairs", user)
+        await recorder.call(client, "/updatescore", {**user, "score": 5})
+        story = await recorder.call(client, "/storystart", user)
+        story.raise_for_status()
+        part = story.json()["current_part"]
+        for _ in range(5):
+            for _attempt in range(NARRATE_RETRIES):
+                narrated = await recorder.call(client, "/storynarrate", {"username": username, "transcription": part["content"]})
+                if narrated.status_code != 503:
+                    break
+                await asyncio.sleep(NARRATE_RETRY_DELAY)
+            narrated.raise_for_status()
+            body = narrated.json()
+            if body.get("status") == "in_progress":
+                part = body["next_part"]
+        await recorder.call(client, "/leaderboard", {**user, "limit": 10})
+        recorder.journeys += 1
+    except Exception as e:
+        recorder.journeys_failed += 1
+        print(f"Journey {username} failed: {e!r}")
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarise(recorder: Recorder, elapsed: float, config: dict) -> dict:
+    endpoints = {}
+    for path, samples in sorted(recorder.latencies.items()):
+        ordered = sorted(samples)
+        endpoints[path] = {
+            "requests": len(ordered),
+            "errors": recorder.errors[path],
+            "error_rate": round(recorder.errors[path] / len(ordered), 4),
+            "throughput_rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(ordered, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 1),
+            "max_ms": round(ordered[-1] * 1000, 1),
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    errors = sum(endpoint["errors"] for endpoint in endpoints.values())
+    return {
+        "config": config,
+        "elapsed_seconds": round(elapsed, 2),
+        "journeys_completed": recorder.journeys,
+        "journeys_failed": recorder.journeys_failed,
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def compare(report: dict, baseline: dict, max_regression: float) -> list:
+    """Endpoints whose p95 grew by more than max_regression (a fraction) over the baseline."""
+    regressions = []
+    for path, current in report["endpoints"].items():
+        before = baseline["endpoints"].get(path)
+        if before and before["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{path}: p95 {before['p95_ms']}ms -> {current['p95_ms']}ms")
+    return regressions
+
+
+async def drive(base_url: str, rps: float, duration: float, run_id: str) -> tuple:
+    import httpx
+
+    recorder = Recorder()
+    interval = REQUESTS_PER_JOURNEY / rps
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        tasks = []
+        index = 0
+        # open loop: journeys start on schedule whether or not earlier ones have finished
+        while time.perf_counter() - started < duration:
+            tasks.append(asyncio.ensure_future(journey(client, recorder, f"load_{run_id}_{index}")))
+            index += 1
+            await asyncio.sleep(max(0.0, started + index * interval - time.perf_counter()))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def cleanup(run_id: str):
+    from database import resources, AUTH_DB, STORY_DB, LEXICON_DB, lexicon_collection_name
+    from utils.all_helper import SUPPORTED_LANGUAGES
+
+    users_collection = resources.collection(AUTH_DB, "users")
+    users = list(users_collection.find({"username": {"$regex": f"^load_{run_id}_"}}, {"_id": 1}))
+    ids = [user["_id"] for user in users]
+    for name in ("active_stories", "story_feedback"):
+        resources.collection(STORY_DB, name).delete_many({"user_id": {"$in": ids}})
+    resources.collection(AUTH_DB, "review_cards").delete_many({"user_id": {"$in": ids}})
+    # the lexicon is filled from the fake Gemini's decks; emptied rather than dropped so the
+    # indexes from the schema migrations stay (they are only created once per database)
+    for language in SUPPORTED_LANGUAGES:
+        resources.collection(LEXICON_DB, lexicon_collection_name(language)).delete_many({})
+    users_collection.delete_many({"_id": {"$in": ids}})
+    resources.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep starting journeys")
+    parser.add_argument("--mongo-uri", default=os.getenv("LOAD_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-median", type=float, default=0.8, help="median fake Gemini latency in seconds")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-profile", help='JSON file with per-feature overrides, e.g. {"story": {"median": 3}}')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="load_baseline.json")
+    parser.add_argument("--compare", help="baseline JSON to check this run against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    configure_environment(args.mongo_uri)
+    latency = {"default": {"median": args.llm_median, "sigma": args.llm_sigma, "failure_rate": args.llm_failure_rate}}
+    if args.llm_profile:
+        with open(args.llm_profile) as f:
+            latency.update(json.load(f))
+
+    from fake_gemini import FakeGenerativeModel
+    from utils.llm_providers import register_provider
+
+    fake = FakeGenerativeModel(latency, seed=args.seed)
+    register_provider("fake", lambda: fake)
+    from main import app
+
+    run_id = uuid.uuid4().hex[:8]
+    server, thread = start_server(app, args.port)
+    try:
+        recorder, elapsed = asyncio.run(drive(f"http://127.0.0.1:{args.port}", args.rps, args.duration, run_id))
+    finally:
+        server.should_exit = True
+        thread.join()
+        cleanup(run_id)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    report = {**summarise(recorder, elapsed, config), "fake_gemini_calls": fake.calls}
+    baseline = None
+    if args.compare:
+        # read first: --output may point at the same file
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'endpoint':<16}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for path, endpoint in report["endpoints"].items():
+        print(f"{path:<16}{endpoint['requests']:>9}{endpoint['errors']:>8}"
+              f"{endpoint['p50_ms']:>9}{endpoint['p95_ms']:>9}{endpoint['p99_ms']:>9}")
+    print(f"{report['requests']} requests, {report['throughput_rps']} req/s, error rate {report['error_rate']}; wrote {args.output}")
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
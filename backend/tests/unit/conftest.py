@@ -2,6 +2,7 @@
 import os
 import sys
 import pytest
+import tempfile
 from unittest.mock import MagicMock
 
 # --- 1. SET ENV VARS BEFORE ANYTHING ---
@@ -10,6 +11,9 @@ os.environ["SECRET_KEY"] = "supersecretkey"
 os.environ["ALGORITHM"] = "HS256"
 os.environ["GOOGLE_API_KEY"] = "dummy"
 os.environ["ACCESS_TOKEN_EXPIRE_MINUTES"] = "30"
+os.environ["SCORE_WAL_PATH"] = os.path.join(tempfile.mkdtemp(), "score_wal.log")
+os.environ["LLM_LAST_GOOD_PATH"] = os.path.join(tempfile.mkdtemp(), "llm_last_good.json")
+os.environ["SEMANTIC_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "semantic_cache.json")
 
 # --- 2. MOCK EXTERNAL LIBRARIES ---
 # IMPORTANT: Mock passlib.context.CryptContext BEFORE any app code imports it
@@ -31,6 +35,10 @@ mock_db.__getitem__.return_value = mock_users_collection
 sys.modules["pymongo"] = MagicMock()
 sys.modules["pymongo"].MongoClient.return_value = mock_mongo_client
 sys.modules["pymongo.server_api"] = MagicMock()
+# real exception classes, so the app's except clauses work against the mock
+class DuplicateKeyError(Exception):
+    pass
+sys.modules["pymongo.errors"] = MagicMock(DuplicateKeyError=DuplicateKeyError)
 
 # Mock google
 sys.modules["google"] = MagicMock()
@@ -57,6 +65,10 @@ def client():
     # Reset pwd context mock
     mock_pwd_context_instance.reset_mock()
     mock_pwd_context_instance.verify.return_value = True
+
+    # Reset in-process caches so one test's user data never leaks into another
+    from utils.user_cache import user_profiles
+    user_profiles.clear()
     
     with TestClient(app) as c:
         yield c
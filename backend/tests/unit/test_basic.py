@@ -34,3 +34,37 @@ def test_app_startup(client):
     # Just checking if we can hit the OpenAPI schema
     response = client.get("/openapi.json")
     assert response.status_code == 200
+
+
+def test_schema_check_flags_collscan(client, monkeypatch):
+    from unittest.mock import MagicMock
+    from utils import schema_manager
+
+    indexed = MagicMock()
+    indexed.explain.return_value = {"queryPlanner": {"winningPlan": {
+        "stage": "LIMIT", "inputStage": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}
+    }}}
+    scanned = MagicMock()
+    scanned.explain.return_value = {"queryPlanner": {"winningPlan": {
+        "stage": "SORT", "inputStage": {"stage": "COLLSCAN"}
+    }}}
+    monkeypatch.setattr(schema_manager, "_hot_queries", lambda: [("indexed", indexed), ("scanned", scanned)])
+
+    assert schema_manager.check_query_plans() == ["scanned"]
+
+
+def test_resources_rebuild_client_after_close_and_fork(client, monkeypatch):
+    import database
+
+    resources = database.Resources()
+    first = resources.mongo
+    assert resources.mongo is first
+    resources.close()
+    first.close.assert_called()
+
+    monkeypatch.setattr(database.MongoClient, "side_effect", lambda *args, **kwargs: object())
+    reopened = resources.mongo
+    assert reopened is not first
+    #a forked child must not reuse the parent's client
+    monkeypatch.setattr(database.os, "getpid", lambda: -1)
+    assert resources.mongo is not reopened
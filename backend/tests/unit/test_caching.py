@@ -0,0 +1,62 @@
+import asyncio
+
+
+def test_content_pool_miss_then_rotation(client):
+    from utils.content_pool import ContentPool
+
+    counter = {"calls": 0}
+
+    def fake_generator(language, level):
+        counter["calls"] += 1
+        return {"cards": [{"new_concept": f"{language}-{level}-{counter['calls']}"}]}
+
+    async def scenario():
+        pool = ContentPool("test", fake_generator, low=2, high=3, max_serves=2)
+        first = await pool.get("SPANISH", "beginner")
+        # let the background refill top the key up to the high watermark
+        for _ in range(100):
+            if pool.stats()["decks"]["SPANISH/beginner"] >= 3:
+                break
+            await asyncio.sleep(0.01)
+        second = await pool.get("SPANISH", "beginner")
+        await pool.shutdown()
+        return pool, first, second
+
+    pool, first, second = asyncio.run(scenario())
+    assert pool.misses == 1
+    assert pool.hits == 1
+    # the deck that was just served went to the back of the rotation
+    assert second != first
+
+
+def test_content_pool_never_keeps_mock_decks(client):
+    from utils.content_pool import ContentPool
+
+    def failing_generator(language, level):
+        return {"cards": [{"new_concept": "Hola (Mock)"}]}
+
+    async def scenario():
+        pool = ContentPool("test", failing_generator, low=1, high=2, max_serves=3)
+        await pool.get("FRENCH", "advanced")
+        await pool.shutdown()
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert pool.stats()["decks"]["FRENCH/advanced"] == 0
+
+
+def test_user_profile_cache_reads_once_and_writes_through(client, mock_users_coll):
+    mock_users_coll.find_one.return_value = {
+        "_id": "userid123",
+        "username": "cacheuser",
+        "languages": {"SPANISH": 50},
+    }
+
+    assert client.post("/getscores", json={"username": "cacheuser", "language": "spanish"}).status_code == 200
+    client.post("/updatescore", json={"username": "cacheuser", "language": "spanish", "score": 5})
+    response = client.post("/getscores", json={"username": "cacheuser", "language": "spanish"})
+
+    assert response.json()["languages"]["SPANISH"] == 55
+    mock_users_coll.find_one.assert_called_once_with(
+        {"username": "cacheuser"}, {"_id": 1, "username": 1, "languages": 1}
+    )
@@ -0,0 +1,241 @@
+import asyncio
+import threading
+
+
+def test_run_genai_runs_off_event_loop(client):
+    from utils.genai_executor import run_genai
+
+    loop_thread = threading.get_ident()
+
+    def blocking_call(x):
+        return x * 2, threading.get_ident()
+
+    result, worker_thread = asyncio.run(run_genai(blocking_call, 21))
+    assert result == 42
+    assert worker_thread != loop_thread
+
+
+def test_stats_exposes_genai_counts(client):
+    response = client.get("/stats")
+    assert response.status_code == 200
+    genai = response.json()["genai"]
+    assert genai["inflight"] == 0
+    assert genai["queued"] == 0
+    assert genai["max_concurrency"] > 0
+
+
+def test_users_repo_runs_on_db_pool(client, mock_users_coll):
+    from database import users_repo
+
+    seen = {}
+
+    def fake_find_one(*args):
+        seen["thread"] = threading.current_thread().name
+        return {"username": "testuser", "languages": {"SPANISH": 5}}
+
+    mock_users_coll.find_one.side_effect = fake_find_one
+    user = asyncio.run(users_repo.get_by_username("testuser"))
+    assert user["languages"]["SPANISH"] == 5
+    assert seen["thread"].startswith("mongo")
+
+
+def test_password_pool_roundtrip_and_legacy_migration(client):
+    from utils.password_pool import check_login_password_async, hash_password_async, get_password_hash
+
+    hashed = asyncio.run(hash_password_async("correct horse"))
+    assert asyncio.run(check_login_password_async("correct horse", hashed)) == (True, None)
+    assert asyncio.run(check_login_password_async("wrong", hashed)) == (False, None)
+
+    legacy = get_password_hash("correct horse")
+    valid, new_hash = asyncio.run(check_login_password_async("correct horse", legacy))
+    assert valid and new_hash is not None
+
+
+def test_login_rejected_when_password_pool_saturated(client, mock_users_coll, monkeypatch):
+    from utils.password_pool import password_pool
+
+    monkeypatch.setattr(password_pool, "max_pending", 0)
+    mock_users_coll.find_one.return_value = {"username": "busy", "password": "x", "languages": {}}
+
+    response = client.post("/login", json={"username": "busy", "password": "pw"})
+    assert response.status_code == 429
+
+
+def test_single_flight_coalesces_identical_calls(client, monkeypatch):
+    from utils import single_flight
+
+    calls = []
+    release = threading.Event()
+
+    def generate(language, level):
+        calls.append((language, level))
+        release.wait(2)
+        return {"cards": [{"new_concept": "Hola"}]}
+
+    async def scenario():
+        flights = single_flight.SingleFlight()
+        monkeypatch.setattr(single_flight, "genai_flights", flights)
+        waiting = [
+            asyncio.ensure_future(single_flight.run_genai_shared(generate, language, "beginner"))
+            for language in ("Spanish", "spanish ", "SPANISH")
+        ]
+        await asyncio.sleep(0.05)
+        release.set()
+        results = await asyncio.gather(*waiting)
+        return flights, results
+
+    flights, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results[0] == results[1] == results[2]
+    # followers get their own copy
+    assert results[1] is not results[0]
+    stats = flights.stats()["features"]["generate"]
+    assert stats["executions"] == 1 and stats["coalesced"] == 2
+
+
+def test_single_flight_opt_out(client, monkeypatch):
+    from utils import single_flight
+
+    calls = []
+
+    def generate(language):
+        calls.append(language)
+        return {"language": language}
+
+    async def scenario():
+        await asyncio.gather(*(single_flight.run_genai_shared(generate, "French") for _ in range(3)))
+
+    monkeypatch.setattr(single_flight, "SINGLE_FLIGHT_OPT_OUT", {"generate"})
+    asyncio.run(scenario())
+    assert len(calls) == 3
+
+
+def test_genai_scheduler_grants_by_priority():
+    from utils.genai_scheduler import GenAIScheduler, INTERACTIVE, STANDARD, BACKGROUND
+
+    # 60 requests per minute with a one-request burst: one grant per second
+    scheduler = GenAIScheduler(rpm=60, tpm=0, burst_seconds=1, deadlines={INTERACTIVE: 5, STANDARD: 5, BACKGROUND: 5})
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire(priority, 100)
+        order.append(name)
+
+    async def scenario():
+        await call("first", STANDARD)
+        scheduler.requests.rate = 100.0  # speed the refill up for the test
+        waiting = [
+            asyncio.ensure_future(call("twister", BACKGROUND)),
+            asyncio.ensure_future(call("chat", STANDARD)),
+            asyncio.ensure_future(call("narration", INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queue_depth"] == {INTERACTIVE: 1, STANDARD: 1, BACKGROUND: 1}
+        await asyncio.gather(*waiting)
+
+    asyncio.run(scenario())
+    assert order == ["first", "narration", "chat", "twister"]
+
+
+def test_genai_scheduler_rejects_after_deadline():
+    from fastapi import HTTPException
+    from utils.genai_scheduler import GenAIScheduler, INTERACTIVE, STANDARD, BACKGROUND
+
+    scheduler = GenAIScheduler(rpm=1, tpm=0, burst_seconds=60, deadlines={INTERACTIVE: 1, STANDARD: 1, BACKGROUND: 0.05})
+
+    async def scenario():
+        await scheduler.acquire(STANDARD, 1)
+        await scheduler.acquire(BACKGROUND, 1)
+
+    try:
+        asyncio.run(scenario())
+        assert False, "expected a 503"
+    except HTTPException as e:
+        assert e.status_code == 503
+    stats = scheduler.stats()
+    assert stats["classes"][BACKGROUND]["expired"] == 1
+    assert stats["queue_depth"][BACKGROUND] == 0
+
+
+def test_metrics_endpoint_exports_route_and_mongo_histograms(client, mock_users_coll):
+    mock_users_coll.find_one.return_value = None
+    client.post("/login", json={"username": "nobody", "password": "x"})
+    client.get("/no-such-route")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'langstar_http_request_duration_seconds_count{method="POST",route="/login",status="401"}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert 'langstar_mongo_operation_duration_seconds_count{collection="users",operation="find_one"}' in body
+    assert 'langstar_genai_queue_depth{priority="interactive"} 0.0' in body
+
+
+def test_profiling_middleware_records_requested_profiles(client, monkeypatch):
+    import time
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from utils import profiling
+
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "letmein")
+    monkeypatch.setattr(profiling, "profile_store", profiling.ProfileStore(5))
+
+    def busy_wait():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    app = FastAPI()
+
+    @app.get("/slow")
+    def slow():
+        busy_wait()
+        return {"ok": True}
+
+    app.add_middleware(profiling.ProfilingMiddleware)
+    with TestClient(app) as test_client:
+        plain = test_client.get("/slow")
+        profiled = test_client.get("/slow", headers={"X-Profile-Token": "letmein"})
+        in_url = test_client.get("/slow?profile=letmein")
+
+    assert "x-profile-id" not in plain.headers
+    assert "x-profile-id" not in in_url.headers
+    profile_id = int(profiled.headers["x-profile-id"])
+    profile = profiling.profile_store.get(profile_id)
+    assert profile["path"] == "/slow" and profile["status"] == 200
+    assert "busy_wait" in profile["collapsed"]
+
+    # the admin endpoints hide themselves from anyone without the token
+    assert client.get("/admin/profiles").status_code == 404
+    listed = client.get("/admin/profiles", headers={"X-Profile-Token": "letmein"}).json()["profiles"]
+    assert [entry["id"] for entry in listed] == [profile_id]
+    collapsed = client.get(f"/admin/profiles/{profile_id}", headers={"X-Profile-Token": "letmein"})
+    assert collapsed.text == profile["collapsed"]
+
+
+def test_single_flight_keeps_free_text_and_personal_stories_apart(client, monkeypatch):
+    from utils import single_flight
+
+    calls = []
+    release = threading.Event()
+
+    def analyze_speech_transcript(language, transcript):
+        calls.append(transcript)
+        release.wait(2)
+        return {"original": transcript}
+
+    async def scenario():
+        monkeypatch.setattr(single_flight, "genai_flights", single_flight.SingleFlight())
+        waiting = [
+            asyncio.ensure_future(single_flight.run_genai_shared(analyze_speech_transcript, language, transcript))
+            for language, transcript in (("Spanish", "Hola  amigo"), ("SPANISH", "hola amigo"))
+        ]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*waiting)
+
+    results = asyncio.run(scenario())
+    # same language, differently written transcripts: each user gets their own text back
+    assert [result["original"] for result in results] == ["Hola  amigo", "hola amigo"]
+    assert {"generate_stories", "generate_story_opening"} <= single_flight.SINGLE_FLIGHT_OPT_OUT
@@ -24,6 +24,20 @@ def test_signup_success(client, mock_users_coll):
     mock_users_coll.insert_one.assert_called_once()
 
 
+def test_signup_race_on_the_unique_index_is_a_400(client, mock_users_coll, monkeypatch):
+    from unittest.mock import MagicMock
+    from pymongo.errors import DuplicateKeyError
+
+    # the pre-check saw no user, but a concurrent registration inserted it first
+    monkeypatch.setattr(mock_users_coll, "find_one", MagicMock(return_value=None))
+    monkeypatch.setattr(mock_users_coll, "insert_one", MagicMock(side_effect=DuplicateKeyError("E11000 duplicate key")))
+
+    response = client.post("/register", json={"username": "raceduser", "password": "password123"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already exists"
+
+
 def test_login_success(client, mock_users_coll):
     # Setup mock to return a user found
     mock_users_coll.find_one.return_value = {
@@ -52,3 +66,342 @@ def test_leaderboard_empty(client, mock_users_coll):
     # The code catches exception and returns empty list
     assert response.status_code == 200 
     assert response.json()["leaderboard"] == []
+
+
+def test_leaderboard_page_and_cursor(client, monkeypatch):
+    from unittest.mock import MagicMock
+    from main import app
+    from database import get_users_repo
+    from utils import leaderboard
+
+    docs = [
+        {"username": "ana", "languages": {"SPANISH": 90}},
+        {"username": "bo", "languages": {"SPANISH": 70}},
+        {"username": "cy", "languages": {"SPANISH": 70}},
+    ]
+    calls = []
+
+    async def fake_find(query, projection=None, sort=None, limit=0):
+        calls.append(query)
+        return docs[:limit]
+
+    monkeypatch.setitem(app.dependency_overrides, get_users_repo, lambda: MagicMock(find=fake_find))
+
+    response = client.post("/leaderboard", json={"language": "spanish", "username": "ana", "limit": 2})
+    data = response.json()
+    assert [u["rank"] for u in data["leaderboard"]] == [1, 2]
+    assert data["leaderboard"][1] == {"username": "bo", "points": 70, "rank": 2}
+
+    cursor = leaderboard.decode_cursor(data["next_cursor"])
+    assert cursor == {"points": 70, "username": "bo", "rank": 2}
+
+    # the next page starts strictly after the cursor position
+    client.post("/leaderboard", json={"language": "spanish", "username": "ana", "limit": 2, "cursor": data["next_cursor"]})
+    assert calls[-1] == {"$or": [
+        {"languages.SPANISH": {"$lt": 70}},
+        {"languages.SPANISH": 70, "username": {"$gt": "bo"}},
+    ]}
+
+
+def test_leaderboard_around_me(client, monkeypatch):
+    from unittest.mock import MagicMock
+    from main import app
+    from database import get_users_repo
+
+    async def fake_get(username, projection=None):
+        return {"languages": {"SPANISH": 50}}
+
+    async def fake_count(query):
+        return 9
+
+    async def fake_find(query, projection=None, sort=None, limit=0):
+        if "$gt" in query["$or"][0]["languages.SPANISH"]:
+            # neighbours above come back nearest-first
+            return [{"username": "above1", "languages": {"SPANISH": 60}}, {"username": "above2", "languages": {"SPANISH": 80}}]
+        return [{"username": "below1", "languages": {"SPANISH": 40}}]
+
+    users = MagicMock(get_by_username=fake_get, count=fake_count, find=fake_find)
+    monkeypatch.setitem(app.dependency_overrides, get_users_repo, lambda: users)
+
+    data = client.post("/leaderboard/around", json={"language": "spanish", "username": "me", "window": 2}).json()
+    assert data["rank"] == 10
+    assert [(u["username"], u["rank"]) for u in data["leaderboard"]] == [
+        ("above2", 8), ("above1", 9), ("me", 10), ("below1", 11)
+    ]
+
+
+def test_score_buffer_merges_and_replays_after_crash(client, tmp_path, monkeypatch):
+    import asyncio
+    from utils import score_buffer as score_buffer_module
+    from utils.score_buffer import ScoreBuffer
+
+    writes = []
+
+    async def fake_bulk_increment(deltas):
+        writes.append(dict(deltas))
+
+    monkeypatch.setattr(score_buffer_module.users_repo, "bulk_increment", fake_bulk_increment)
+    wal_path = str(tmp_path / "scores.log")
+
+    async def crash_before_flush():
+        buffer = ScoreBuffer(wal_path, flush_interval=60, max_events=1000)
+        for _ in range(5):
+            buffer.add("maya", "SPANISH", 2)
+        buffer.add("maya", "FRENCH", 1)
+        assert buffer.pending_for("maya") == {"SPANISH": 10, "FRENCH": 1}
+        # process dies here: no flush, no stop()
+
+    async def restart():
+        buffer = ScoreBuffer(wal_path, flush_interval=60, max_events=1000)
+        await buffer.start()
+        await buffer.stop()
+
+    asyncio.run(crash_before_flush())
+    asyncio.run(restart())
+
+    assert writes == [{("maya", "SPANISH"): 10, ("maya", "FRENCH"): 1}]
+
+
+def test_score_buffer_keeps_inflight_scores_visible_and_cache_consistent(client, tmp_path, monkeypatch):
+    import asyncio
+    from utils import score_buffer as score_buffer_module, user_cache
+    from utils.score_buffer import ScoreBuffer
+    from utils.user_cache import UserProfileCache
+
+    stored = {"SPANISH": 10}
+    events = {}
+
+    async def slow_bulk_increment(deltas):
+        events["writes"] = events.get("writes", 0) + 1
+        for (_, language), delta in deltas.items():
+            stored[language] += delta
+        events["applied"].set()
+        await events["release"].wait()
+
+    async def get_by_username(username, projection=None):
+        return {"_id": 1, "username": username, "languages": dict(stored)}
+
+    monkeypatch.setattr(score_buffer_module.users_repo, "bulk_increment", slow_bulk_increment)
+    monkeypatch.setattr(user_cache.users_repo, "get_by_username", get_by_username)
+    buffer = ScoreBuffer(str(tmp_path / "scores.log"), flush_interval=60, max_events=1000)
+    profiles = UserProfileCache(100, 60)
+    buffer.on_flushed = profiles.invalidate
+    monkeypatch.setattr(user_cache, "score_buffer", buffer)
+    monkeypatch.setattr(user_cache, "user_profiles", profiles)
+
+    async def scenario():
+        events["applied"], events["release"] = asyncio.Event(), asyncio.Event()
+        assert (await user_cache.get_user_profile("maya"))["languages"]["SPANISH"] == 10
+        buffer.add("maya", "SPANISH", 5)
+        first = asyncio.get_running_loop().create_task(buffer.flush())
+        await events["applied"].wait()
+        # a cached profile still sees the batch that is being written
+        during = (await user_cache.get_user_profile("maya"))["languages"]["SPANISH"]
+        # a second flush joins the running one instead of writing alongside it
+        second = asyncio.get_running_loop().create_task(buffer.flush())
+        await asyncio.sleep(0)
+        events["release"].set()
+        await asyncio.gather(first, second)
+        after = (await user_cache.get_user_profile("maya"))["languages"]["SPANISH"]
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert (during, after) == (15, 15)
+    assert events["writes"] == 1
+
+
+def test_score_buffer_replays_only_logs_of_dead_workers(client, tmp_path, monkeypatch):
+    import asyncio
+    import os
+    import subprocess
+    import sys
+    from utils import score_buffer as score_buffer_module
+    from utils.score_buffer import ScoreBuffer
+
+    writes = []
+
+    async def fake_bulk_increment(deltas):
+        writes.append(dict(deltas))
+
+    monkeypatch.setattr(score_buffer_module.users_repo, "bulk_increment", fake_bulk_increment)
+    wal_path = str(tmp_path / "scores.log")
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    dead, alive = int(finished.stdout), os.getppid()
+    (tmp_path / f"scores.log.{dead}").write_text('{"u": "maya", "l": "SPANISH", "d": 3}\n')
+    (tmp_path / f"scores.log.{dead}.1.flushing").write_text('{"u": "maya", "l": "SPANISH", "d": 4}\n')
+    (tmp_path / f"scores.log.{alive}").write_text('{"u": "ravi", "l": "FRENCH", "d": 9}\n')
+
+    async def two_workers_start():
+        first = ScoreBuffer(wal_path, flush_interval=60, max_events=1000)
+        second = ScoreBuffer(wal_path, flush_interval=60, max_events=1000)
+        await first.start()
+        await second.start()
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(two_workers_start())
+
+    # the dead worker's logs are applied once; the live worker's log is untouched
+    assert writes == [{("maya", "SPANISH"): 7}]
+    assert sorted(os.listdir(tmp_path)) == [f"scores.log.{alive}"]
+
+
+def test_sm2_schedule():
+    from datetime import datetime, timedelta
+    from utils.review_deck import sm2, new_card_state
+
+    now = datetime(2026, 1, 1)
+    state = new_card_state(now)
+    intervals = []
+    for _ in range(3):
+        state = sm2(state, 5, now)
+        intervals.append(state["interval_days"])
+    assert intervals == [1, 6, 16]
+    assert state["due_at"] == now + timedelta(days=16)
+
+    # a lapse restarts the card but keeps (a lowered) ease
+    lapsed = sm2(state, 1, now)
+    assert (lapsed["repetitions"], lapsed["interval_days"]) == (0, 1)
+    assert 1.3 <= lapsed["ease"] < state["ease"]
+
+
+def test_review_deck_tops_up_only_missing_cards(monkeypatch):
+    import asyncio
+    from utils import review_deck as review_deck_module
+    from utils.review_deck import ReviewDeck
+
+    due = [{"concept": f"due{i}", "card": {"new_concept": f"due{i}"}} for i in range(7)]
+    generated = {"cards": [{"new_concept": name} for name in ("due0", "fresh1", "fresh2", "fresh3", "fresh4")]}
+    added = []
+    pool_calls = []
+
+    async def fake_due(user_id, language, now, limit):
+        return due[:limit]
+
+    async def fake_get_many(user_id, language, concepts):
+        return [{"concept": concept} for concept in concepts if concept.startswith("due")]
+
+    async def fake_add(user_id, language, cards, state):
+        added.extend(card["new_concept"] for card in cards)
+
+    async def fake_pool_get(language, level):
+        pool_calls.append((language, level))
+        return generated
+
+    monkeypatch.setattr(review_deck_module.review_cards_repo, "due", fake_due)
+    monkeypatch.setattr(review_deck_module.review_cards_repo, "get_many", fake_get_many)
+    monkeypatch.setattr(review_deck_module.review_cards_repo, "add", fake_add)
+    monkeypatch.setattr(review_deck_module.dailies_pool, "get", fake_pool_get)
+
+    deck = asyncio.run(ReviewDeck(10, 5).build("u1", "SPANISH", "beginner"))
+    assert (deck["due"], deck["new"]) == (7, 3)
+    assert added == ["fresh1", "fresh2", "fresh3"]
+
+    # a full set of due cards needs no generated deck at all
+    deck = asyncio.run(ReviewDeck(5, 5).build("u1", "SPANISH", "beginner"))
+    assert (deck["due"], deck["new"]) == (5, 0)
+    assert len(pool_calls) == 1
+
+
+def test_lexicon_entries_share_keys_across_sources():
+    from utils.lexicon import entries_from_dailies, entries_from_pairs, normalise
+
+    assert normalise("  ¡Hola,   Mundo! ") == "hola, mundo"
+    card = {
+        "new_concept": "Perro", "concept_pronunciation": "peh-rro", "english": "dog", "meaning": "a dog",
+        "example": "El perro ladra.", "example_pronunciation": "", "translation": "The dog barks.",
+    }
+    [from_card] = entries_from_dailies({"cards": [card]}, "beginner")
+    [from_pair] = entries_from_pairs({"pairs": [["perro.", "dog", "peh-rro"]]}, "beginner")
+    assert from_card["key"] == from_pair["key"] == "word:perro"
+    # both sources agree on which field is which, so a later $set never swaps them
+    assert (from_pair["translation"], from_pair["pronunciation"]) == (from_card["translation"], from_card["pronunciation"])
+    assert from_card["example_translation"] == "The dog barks."
+
+
+def test_lexicon_pairs_keep_the_memory_game_order(monkeypatch):
+    import asyncio
+    from utils import lexicon as lexicon_module
+    from utils.lexicon import Lexicon, entries_from_dailies
+
+    card = {
+        "new_concept": "Perro", "concept_pronunciation": "Peh-rro", "english": "Dog", "meaning": "a dog",
+        "example": "", "example_pronunciation": "", "translation": "",
+    }
+    entries = entries_from_dailies({"cards": [card]}, "beginner")
+
+    async def count(language, query):
+        return 1
+
+    async def sample(language, query, size):
+        return entries
+
+    monkeypatch.setattr(lexicon_module.lexicon_repo, "count", count)
+    monkeypatch.setattr(lexicon_module.lexicon_repo, "sample", sample)
+    deck = asyncio.run(Lexicon(min_entries=1, deck_size=1).pairs("spanish", "beginner"))
+    # [foreign, english, pronunciation]: index 1 is the English card in the game
+    assert deck == {"pairs": [["Perro", "Dog", "Peh-rro"]]}
+
+
+def test_content_pool_miss_served_from_lexicon(monkeypatch):
+    import asyncio
+    from utils.content_pool import ContentPool
+
+    generated = []
+    lexicon_deck = {"pairs": [["perro", "dog", "peh-rro"]]}
+
+    def generator(language, level):
+        generated.append((language, level))
+        return {"pairs": []}
+
+    async def sampler(language, level):
+        return lexicon_deck
+
+    async def scenario():
+        pool = ContentPool("test", generator, low=0, high=0, max_serves=1, sampler=sampler)
+        deck = await pool.get("SPANISH", "beginner")
+        return pool, deck
+
+    pool, deck = asyncio.run(scenario())
+    assert deck is lexicon_deck
+    assert generated == []
+    assert pool.stats()["lexicon_hits"] == 1
+
+
+def test_semantic_cache_matches_rephrasings_and_persists(tmp_path):
+    from utils.semantic_cache import SemanticCache
+
+    path = str(tmp_path / "semantic.json")
+    cache = SemanticCache(capacity=2, threshold=0.9, path=path, save_every=100)
+    answer = {"response": "gracias"}
+    cache.put("spanish", "How do I say thank you?", answer)
+    assert cache.get("SPANISH", "thank you in spanish") == answer
+    assert cache.get("FRENCH", "thank you in french") is None
+    assert cache.get("SPANISH", "how do I say goodbye") is None
+
+    # capacity 2: the least recently used answer goes first
+    cache.put("spanish", "how do I say dog", {"response": "perro"})
+    cache.get("spanish", "thank you")
+    cache.put("spanish", "how do I say cat", {"response": "gato"})
+    assert cache.get("spanish", "dog") is None
+    assert cache.stats()["evictions"] == 1
+
+    cache.save()
+    restarted = SemanticCache(capacity=2, threshold=0.9, path=path, save_every=100)
+    assert restarted.get("spanish", "thank you") == answer
+    assert restarted.get("spanish", "how to say cat") == {"response": "gato"}
+
+
+def test_semantic_cache_keeps_word_order_and_known_languages(tmp_path):
+    from utils.semantic_cache import SemanticCache
+
+    cache = SemanticCache(capacity=8, threshold=0.9, path=str(tmp_path / "semantic.json"), save_every=100)
+    answer = {"response": "mi hermano es más alto que mi hermana"}
+    cache.put("spanish", "how do I say my brother is taller than my sister", answer)
+    assert cache.get("spanish", "how do I say my sister is taller than my brother") is None
+    assert cache.get("spanish", "my brother is taller than my sister?") == answer
+
+    # free-form language names never get a shard of their own
+    cache.put("Klingon", "how do I say hello", {"response": "nuqneH"})
+    assert cache.get("Klingon", "how do I say hello") is None
+    assert "KLINGON" not in cache.stats()["entries"]
@@ -1,6 +1,8 @@
 
 from unittest.mock import MagicMock
+import json
 import sys
+import pytest
 # We assume the mocks from conftest are active
 
 def test_generate_dailies_mock(client):
@@ -75,3 +77,272 @@ def test_story_generation_mock(client):
            pass
         finally:
             story_helper.model = original_model
+
+def test_incremental_json_fields_emits_parts_in_order():
+    from utils.streaming import IncrementalJSONFields
+
+    text = '```json\n{"title": "El Gato", "score": 12, "parts": [{"part_number": 1, "content": "Uno"}, {"part_number": 2, "content": "Dos"}]}\n```'
+    parser = IncrementalJSONFields(stream_arrays=("parts",))
+    events = []
+    for char in text:
+        events.extend(parser.feed(char))
+
+    assert events == [
+        ("field", "title", "El Gato"),
+        ("field", "score", 12),
+        ("item", "parts", 0, {"part_number": 1, "content": "Uno"}),
+        ("item", "parts", 1, {"part_number": 2, "content": "Dos"}),
+    ]
+    assert parser.done
+    assert parser.result["parts"][1]["content"] == "Dos"
+
+
+def test_language_teacher_stream_sse(client):
+    from utils import all_helper
+
+    body = '{"response": "Say gracias", "examples": "Gracias amigo", "interesting_facts": "From Latin"}'
+    chunks = [MagicMock(text=body[i:i + 7]) for i in range(0, len(body), 7)]
+    mock_model = MagicMock()
+    mock_model.generate_content.return_value = iter(chunks)
+    original_model = all_helper.model
+    all_helper.model = mock_model
+    try:
+        response = client.post("/language_teacher/stream", json={"language": "Spanish", "query": "thanks"})
+    finally:
+        all_helper.model = original_model
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[0] == 'event: field\ndata: {"name": "response", "value": "Say gracias"}'
+    assert events[-1].startswith("event: done")
+
+
+def test_language_teacher_stream_caches_only_valid_replies(client):
+    from utils import all_helper
+    from utils.semantic_cache import semantic_cache
+
+    # the reply parses as JSON but lacks interesting_facts
+    body = '{"response": "Say adiós", "examples": "Adiós amigo"}'
+    mock_model = MagicMock()
+    mock_model.generate_content.return_value = iter([MagicMock(text=body)])
+    original_model = all_helper.model
+    all_helper.model = mock_model
+    try:
+        response = client.post("/language_teacher/stream", json={"language": "Spanish", "query": "how do I say goodbye"})
+    finally:
+        all_helper.model = original_model
+
+    assert response.text.split("\n\n")[-2].startswith("event: done")
+    assert semantic_cache.get("Spanish", "how do I say goodbye") is None
+
+
+def test_retries_are_charged_and_tokens_reconciled_with_usage(monkeypatch):
+    import asyncio
+    from basemodels.allpydmodels import TongueTwistersResponse
+    from utils import llm, genai_executor
+    from utils.genai_scheduler import GenAIScheduler, QUEUE_DEADLINES, DEFAULT_ESTIMATED_TOKENS
+
+    scheduler = GenAIScheduler(6000, 6000, 10, QUEUE_DEADLINES)
+    monkeypatch.setattr(llm, "genai_scheduler", scheduler)
+    monkeypatch.setattr(genai_executor, "genai_scheduler", scheduler)
+    monkeypatch.setattr(llm, "llm_stats", llm.LLMStats())
+
+    def reply(text, tokens):
+        return MagicMock(text=text, usage_metadata=MagicMock(total_token_count=tokens))
+
+    valid = '{"tongue_twisters": [{"text": "Tres tigres", "pronunciation": "tres", "translation": "Three tigers"}]}'
+    mock_model = MagicMock()
+    mock_model.generate_content.side_effect = [reply('{"tongue_twisters": "oops"}', 300), reply(valid, 200)]
+
+    def generate_tongue_twisters():
+        return llm.invoke_json(mock_model, "test_charge", "p", TongueTwistersResponse, lambda: {}, retries=1)
+
+    asyncio.run(genai_executor.run_genai(generate_tongue_twisters))
+    stats = scheduler.stats()
+    # admission paid one request and the estimate; the retry paid another request
+    assert stats["charged_requests"] == 1
+    # both calls were settled against what they really used
+    assert stats["reconciled_tokens"] == (300 - DEFAULT_ESTIMATED_TOKENS) + (200 - DEFAULT_ESTIMATED_TOKENS) + DEFAULT_ESTIMATED_TOKENS
+    assert stats["tokens_available"] == pytest.approx(1000 - 500, abs=1)
+
+
+def test_extract_json_keeps_multiline_values():
+    from utils.llm import extract_json
+
+    text = 'Here you go:\n```json\n{"response": "line one\\nline two", "examples": "a  b"}\n```\nEnjoy!'
+    assert extract_json(text) == {"response": "line one\nline two", "examples": "a  b"}
+
+
+def test_invoke_json_retries_then_validates():
+    from basemodels.allpydmodels import TongueTwistersResponse
+    from utils.llm import invoke_json, llm_stats
+
+    valid = '{"tongue_twisters": [{"text": "Tres tigres", "pronunciation": "tres", "translation": "Three tigers"}]}'
+    mock_model = MagicMock()
+    mock_model.generate_content.side_effect = [MagicMock(text='{"tongue_twisters": "oops"}'), MagicMock(text=valid)]
+
+    result = invoke_json(mock_model, "test_retry", "prompt", TongueTwistersResponse, lambda: {"mock": True}, retries=1)
+
+    assert result["tongue_twisters"][0]["text"] == "Tres tigres"
+    # the retry prompt carries the original request plus the validation error
+    assert mock_model.generate_content.call_args_list[1].args[0].startswith("prompt")
+    stats = llm_stats.snapshot()["test_retry"]
+    assert stats["parse_failures"] == 1 and stats["retries"] == 1 and stats["fallbacks"] == 0
+    assert stats["parse_failure_rate"] == 0.5
+
+
+def test_invoke_json_retries_wrongly_sized_stories_and_pairs():
+    from basemodels.allpydmodels import GeneratedStory, MemoryPairsResponse
+    from utils.llm import invoke_json
+
+    part = {"part_number": 1, "content": "Hola", "translation": "Hello", "description": "A scene"}
+    short_story = json.dumps({"title": "T", "title_english": "T", "parts": [part] * 4})
+    story = json.dumps({"title": "T", "title_english": "T", "parts": [part] * 5})
+    mock_model = MagicMock()
+    mock_model.generate_content.side_effect = [MagicMock(text=short_story), MagicMock(text=story)]
+    assert len(invoke_json(mock_model, "test_story_size", "p", GeneratedStory, lambda: {}, retries=1)["parts"]) == 5
+
+    mock_model.generate_content.side_effect = [
+        MagicMock(text='{"pairs": [["Gato", "Cat"]]}'), MagicMock(text='{"pairs": [["Gato", "Cat", "Gah-toh"]]}')
+    ]
+    assert invoke_json(mock_model, "test_pair_size", "p", MemoryPairsResponse, lambda: {}, retries=1)["pairs"] == [["Gato", "Cat", "Gah-toh"]]
+    assert mock_model.generate_content.call_count == 4
+
+
+def test_invoke_json_falls_back_when_model_fails():
+    from basemodels.allpydmodels import DailiesResponse
+    from utils.llm import invoke_json, llm_stats
+
+    mock_model = MagicMock()
+    mock_model.generate_content.side_effect = RuntimeError("quota")
+
+    result = invoke_json(mock_model, "test_fallback", "prompt", DailiesResponse, lambda: {"cards": []}, retries=2)
+
+    assert result == {"cards": []}
+    # a failed call is not retried, only unusable replies are
+    assert mock_model.generate_content.call_count == 1
+    assert llm_stats.snapshot()["test_fallback"]["fallbacks"] == 1
+
+
+def test_invoke_json_serves_last_known_good_and_opens_circuit(monkeypatch):
+    from basemodels.allpydmodels import MemoryPairsResponse
+    from utils import llm
+    from utils.llm_resilience import CircuitBreaker
+
+    monkeypatch.setattr(llm, "llm_stats", llm.LLMStats())
+    llm.llm_stats._breakers["test_lkg"] = CircuitBreaker(failures=2, cooldown=60)
+
+    good = {"pairs": [["Gato", "Cat", "Gah-toh"]]}
+    mock_model = MagicMock()
+    mock_model.generate_content.return_value = MagicMock(text='{"pairs": [["Gato", "Cat", "Gah-toh"]]}')
+    mock = lambda: {"pairs": [["Mock", "Mock", "Mock"]]}
+
+    assert llm.invoke_json(mock_model, "test_lkg", "p", MemoryPairsResponse, mock, last_good_key=("SPANISH", "beginner")) == good
+
+    mock_model.generate_content.side_effect = TimeoutError("deadline exceeded")
+    for _ in range(3):
+        assert llm.invoke_json(mock_model, "test_lkg", "p", MemoryPairsResponse, mock, last_good_key=("spanish", "beginner")) == good
+    # nothing stored for this key, so degraded mode falls back to the mock
+    assert llm.invoke_json(mock_model, "test_lkg", "p", MemoryPairsResponse, mock, last_good_key=("FRENCH", "beginner")) == mock()
+
+    stats = llm.llm_stats.snapshot()["test_lkg"]
+    assert stats["circuit"] == "open"
+    # two failures opened the circuit; the later calls never reached the model
+    assert mock_model.generate_content.call_count == 3
+    assert stats["short_circuited"] == 2
+    assert stats["stale_served"] == 3 and stats["fallbacks"] == 1
+
+
+def test_stream_json_shares_the_circuit_and_last_known_good(monkeypatch):
+    from basemodels.allpydmodels import MemoryPairsResponse
+    from utils import llm
+    from utils.llm_resilience import CircuitBreaker
+
+    monkeypatch.setattr(llm, "llm_stats", llm.LLMStats())
+    llm.llm_stats._breakers["test_stream"] = CircuitBreaker(failures=1, cooldown=60)
+
+    body = '{"pairs": [["Gato", "Cat", "Gah-toh"]]}'
+    mock_model = MagicMock()
+    mock_model.generate_content.return_value = iter([MagicMock(text=body[:10]), MagicMock(text=body[10:])])
+    mock = lambda: {"pairs": [["Mock", "Mock", "Mock"]]}
+    key = ("SPANISH", "beginner")
+
+    assert "".join(llm.stream_json(mock_model, "test_stream", "p", MemoryPairsResponse, mock, last_good_key=key)) == body
+
+    # a failure before the first chunk streams the stored reply and opens the circuit
+    mock_model.generate_content.side_effect = TimeoutError("deadline exceeded")
+    for _ in range(2):
+        served = "".join(llm.stream_json(mock_model, "test_stream", "p", MemoryPairsResponse, mock, last_good_key=key))
+        assert json.loads(served) == json.loads(body)
+
+    stats = llm.llm_stats.snapshot()["test_stream"]
+    assert stats["circuit"] == "open"
+    assert mock_model.generate_content.call_count == 2
+    assert stats["replies"] == 1 and stats["errors"] == 1
+    assert stats["short_circuited"] == 1 and stats["stale_served"] == 2
+
+
+def test_invoke_json_hedges_slow_calls(monkeypatch):
+    import threading
+    from basemodels.allpydmodels import LanguageTeachingResponse
+    from utils import llm
+
+    monkeypatch.setattr(llm, "llm_stats", llm.LLMStats())
+    monkeypatch.setattr(llm, "LLM_HEDGE_MAX_RATIO", 1.0)
+    latency = llm.llm_stats.latency("test_hedge")
+    for _ in range(20):
+        latency.record(0.01)
+
+    release = threading.Event()
+    reply = '{"response": "Hola", "examples": "Hola amigo", "interesting_facts": "Common"}'
+    calls = []
+
+    def generate_content(prompt, **kwargs):
+        calls.append(prompt)
+        if len(calls) == 1:
+            # the first call hangs until the test ends
+            release.wait(2)
+        return MagicMock(text=reply)
+
+    mock_model = MagicMock()
+    mock_model.generate_content.side_effect = generate_content
+    try:
+        result = llm.invoke_json(mock_model, "test_hedge", "p", LanguageTeachingResponse, lambda: {})
+    finally:
+        release.set()
+
+    assert result["response"] == "Hola"
+    stats = llm.llm_stats.snapshot()["test_hedge"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_hedges_are_paid_for_and_skipped_when_quota_is_low(monkeypatch, tmp_path):
+    from utils import llm
+    from utils.genai_scheduler import GenAIScheduler, QUEUE_DEADLINES
+    from utils.llm_resilience import LastKnownGood
+
+    monkeypatch.setattr(llm, "llm_stats", llm.LLMStats())
+    monkeypatch.setattr(llm, "LLM_HEDGE_MAX_RATIO", 1.0)
+    llm.llm_stats.incr("test_quota", "calls")
+    # one request of burst: a hedge would empty the bucket
+    scheduler = GenAIScheduler(6, 0, 10, QUEUE_DEADLINES)
+    monkeypatch.setattr(llm, "genai_scheduler", scheduler)
+    assert llm._start_hedge(MagicMock(), "test_quota", "p") is None
+    assert llm.llm_stats.count("test_quota", "hedges_skipped") == 1
+    assert scheduler.stats()["optional_refused"] == 1
+
+    # a roomy budget pays for the hedge out of the same buckets
+    scheduler = GenAIScheduler(6000, 0, 10, QUEUE_DEADLINES)
+    monkeypatch.setattr(llm, "genai_scheduler", scheduler)
+    hedge = llm._start_hedge(MagicMock(**{"generate_content.return_value": MagicMock(text="{}")}), "test_quota", "p")
+    assert hedge.result() == "{}"
+    assert scheduler.stats()["optional_granted"] == 1 and scheduler.stats()["requests_available"] < 1000
+
+    # the last-known-good file is written at most once per interval, then flushed by save()
+    path = tmp_path / "last_good.json"
+    store = LastKnownGood(str(path), save_interval=60)
+    store.put("dailies", ("spanish", "beginner"), {"cards": [1]})
+    store.put("dailies", ("spanish", "advanced"), {"cards": [2]})
+    assert len(json.loads(path.read_text())) == 1
+    store.save()
+    assert len(json.loads(path.read_text())) == 2
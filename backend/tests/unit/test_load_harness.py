@@ -0,0 +1,69 @@
+import os
+import sys
+
+# the fake Gemini lives with the load tests: backend/tests/load
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "load"))
+
+from fake_gemini import FakeGenerativeModel
+
+
+def test_fake_gemini_answers_every_helper(monkeypatch):
+    from utils import all_helper, story_helper
+    from utils.llm import llm_stats
+
+    fake = FakeGenerativeModel({"default": {"median": 0, "sigma": 0, "failure_rate": 0}})
+    monkeypatch.setattr(all_helper, "model", fake)
+    monkeypatch.setattr(story_helper, "model", fake)
+    before = {feature: stats["fallbacks"] + stats["parse_failures"] for feature, stats in llm_stats.snapshot().items()}
+
+    assert len(all_helper.generate_dailies("SPANISH", "beginner")["cards"]) == 10
+    assert all_helper.generate_memory_pairs("SPANISH", "beginner")["pairs"]
+    assert all_helper.language_teaching_chat("SPANISH", "thanks")["response"]
+    assert all_helper.generate_tongue_twisters("SPANISH")["tongue_twisters"]
+    assert all_helper.analyze_speech_transcript("SPANISH", "hola")["original"] == "hola"
+    assert len(story_helper.generate_stories("SPANISH", "beginner")["parts"]) == 5
+    assert story_helper.generate_story_opening("SPANISH", "beginner")["part"]["part_number"] == 1
+    assert story_helper.evaluate_user_narration("Hola amigo", "Hola", "SPANISH")["accuracy_score"] == "50"
+
+    continuation = "".join(story_helper.stream_story_continuation("SPANISH", "beginner", "El gato", [{"part_number": 1, "content": "Uno"}]))
+    assert '"part_number": 2' in continuation
+
+    after = {feature: stats["fallbacks"] + stats["parse_failures"] for feature, stats in llm_stats.snapshot().items()}
+    assert all(after[feature] == before.get(feature, 0) for feature in after)
+    assert fake.calls["story"] == 1 and fake.calls["story_continuation"] == 1
+
+
+def test_fake_gemini_failure_rate_raises():
+    fake = FakeGenerativeModel({"default": {"median": 0, "sigma": 0, "failure_rate": 1.0}})
+    try:
+        fake.generate_content("Generate 10 flashcards")
+        assert False, "expected a failure"
+    except Exception as e:
+        assert "dailies" in str(e)
+
+
+def test_local_provider_is_deterministic_and_streams():
+    from utils.llm_providers import LocalProvider
+
+    provider = LocalProvider()
+    prompt = 'Analyze this SPANISH speech transcript: "hola que tal"'
+    assert provider.generate_content(prompt).text == provider.generate_content(prompt).text
+    streamed = "".join(chunk.text for chunk in provider.generate_content(prompt, stream=True))
+    assert streamed == provider.generate_content(prompt).text
+    assert provider.usage()["requests"] == 4
+
+
+def test_providers_are_abstract_and_selected_by_name(monkeypatch):
+    import pytest
+    from utils import llm_providers
+
+    with pytest.raises(TypeError):
+        llm_providers.LLMProvider()
+
+    fake = FakeGenerativeModel({"default": {"median": 0, "sigma": 0, "failure_rate": 0}})
+    monkeypatch.setattr(llm_providers, "_factories", dict(llm_providers._factories))
+    monkeypatch.setattr(llm_providers, "_provider", None)
+    monkeypatch.setattr(llm_providers, "LLM_PROVIDER", "fake")
+    llm_providers.register_provider("fake", lambda: fake)
+    assert llm_providers.get_provider() is fake
+    assert fake.generate_content("Generate 10 flashcards for SPANISH").usage["output_tokens"] > 0
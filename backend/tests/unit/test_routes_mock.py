@@ -18,11 +18,20 @@ def test_update_score(client, mock_users_coll):
     
     # Endpoint returns nothing (null) or 200 OK on success
     assert response.status_code == 200
+
+    # Increments are write-behind: nothing is written until the buffer flushes
+    import asyncio
+    import pymongo
+    from utils.score_buffer import score_buffer
+    mock_users_coll.bulk_write.assert_not_called()
+    asyncio.run(score_buffer.flush())
+
     # Verify DB update was called with correct increment
-    mock_users_coll.update_one.assert_called_with(
+    pymongo.UpdateOne.assert_called_with(
         {"username": "testuser"},
         {"$inc": {"languages.SPANISH": 10}}
     )
+    mock_users_coll.bulk_write.assert_called_once()
 
 def test_get_scores(client, mock_users_coll):
     # Mock find_one to return user data
@@ -0,0 +1,319 @@
+import asyncio
+from unittest.mock import MagicMock
+
+
+class FakeStoriesRepo:
+    """In-memory stand-in for ActiveStoriesRepository."""
+
+    def __init__(self):
+        self.docs = []
+
+    async def delete_for_user(self, user_id):
+        self.docs = [d for d in self.docs if not (d["user_id"] == user_id and d["status"] != "pending")]
+
+    async def create(self, story_doc):
+        story_doc["_id"] = f"story{len(self.docs)}"
+        self.docs.append(story_doc)
+        return MagicMock(inserted_id=story_doc["_id"])
+
+    async def promote_pending(self, user_id, language, level):
+        for doc in self.docs:
+            if (doc["user_id"], doc["status"], doc["language"], doc["level"]) == (user_id, "pending", language, level):
+                doc["status"] = "active"
+                return doc
+        return None
+
+    async def append_part(self, story_id, part, lease_until=None):
+        for doc in self.docs:
+            if doc["_id"] == story_id and len(doc["parts"]) == part["part_number"] - 1:
+                doc["parts"].append(part)
+
+    async def extend_lease(self, story_id, lease_until):
+        for doc in self.docs:
+            if doc["_id"] == story_id and "completing_until" in doc:
+                doc["completing_until"] = lease_until
+
+    async def fill_parts(self, story_id, parts):
+        for doc in self.docs:
+            if doc["_id"] == story_id and len(doc["parts"]) == parts[0]["part_number"] - 1:
+                doc["parts"].extend(parts)
+                doc.pop("completing_until", None)
+
+    async def get_for_user(self, user_id):
+        for doc in self.docs:
+            if doc["user_id"] == user_id and doc["status"] != "pending":
+                return doc
+        return None
+
+    async def update_for_user(self, user_id, update):
+        self.updates = getattr(self, "updates", []) + [update]
+
+    async def set_part_feedback(self, story_id, index, feedback):
+        self.part_feedback = getattr(self, "part_feedback", []) + [(story_id, index, feedback)]
+        for doc in self.docs:
+            if doc["_id"] == story_id and doc["parts"][index].get("user_narration"):
+                doc["parts"][index]["user_narration"] = {**doc["parts"][index]["user_narration"], "feedback": feedback}
+
+    async def discard_pending(self, user_id):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not (d["user_id"] == user_id and d["status"] == "pending")]
+        return MagicMock(deleted_count=before - len(self.docs))
+
+
+def _story(title):
+    return {
+        "title": title,
+        "title_english": title,
+        "parts": [
+            {"part_number": i, "content": f"{title} {i}", "translation": "", "description": ""}
+            for i in range(1, 6)
+        ],
+    }
+
+
+def test_story_start_promotes_prefetched_story(client, monkeypatch):
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "story_prefetcher", story_helper.StoryPrefetcher())
+    monkeypatch.setattr(story_helper, "generate_stories", lambda language, level: _story("Fresh"))
+    repo.docs.append(story_helper.build_story_doc("u1", "SPANISH", "beginner", _story("Prefetched"), status="pending"))
+    repo.docs[-1]["_id"] = "pending1"
+
+    result = asyncio.run(story_helper.generate_and_start_story("u1", "SPANISH", "beginner"))
+
+    assert result["story_id"] == "pending1"
+    assert result["current_part"]["content"] == "Prefetched 1"
+    assert story_helper.story_prefetcher.stats()["hits"] == 1
+
+
+def test_story_start_discards_prefetch_for_other_level(client, monkeypatch):
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "story_prefetcher", story_helper.StoryPrefetcher())
+    monkeypatch.setattr(story_helper, "STORY_PROGRESSIVE", False)
+    monkeypatch.setattr(story_helper, "generate_stories", lambda language, level: _story("Fresh"))
+    repo.docs.append(story_helper.build_story_doc("u1", "SPANISH", "beginner", _story("Prefetched"), status="pending"))
+    repo.docs[-1]["_id"] = "pending1"
+
+    result = asyncio.run(story_helper.generate_and_start_story("u1", "SPANISH", "intermediate"))
+
+    assert result["current_part"]["content"] == "Fresh 1"
+    stats = story_helper.story_prefetcher.stats()
+    assert stats["misses"] == 1
+    assert stats["discarded"] == 1
+    assert all(doc["status"] == "active" for doc in repo.docs)
+
+
+def test_progressive_story_returns_part_one_and_fills_the_rest(client, monkeypatch):
+    import json
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "story_prefetcher", story_helper.StoryPrefetcher())
+    monkeypatch.setattr(story_helper, "progressive_stories", story_helper.ProgressiveStories())
+    monkeypatch.setattr(story_helper, "STORY_PROGRESSIVE", True)
+    story = _story("Slow")
+    monkeypatch.setattr(
+        story_helper, "generate_story_opening",
+        lambda language, level: {"title": "Slow", "title_english": "Slow", "part": story["parts"][0]}
+    )
+    continuation = json.dumps({"parts": story["parts"][1:]})
+
+    def fake_continuation(language, level, title, parts):
+        assert parts[0]["content"] == "Slow 1"
+        for i in range(0, len(continuation), 16):
+            yield continuation[i:i + 16]
+
+    monkeypatch.setattr(story_helper, "stream_story_continuation", fake_continuation)
+
+    async def scenario():
+        result = await story_helper.generate_and_start_story("u1", "SPANISH", "beginner")
+        first_parts = len(repo.docs[0]["parts"])
+        # /storynarrate for part 1 waits until part 2 exists
+        ready = await story_helper.progressive_stories.wait_for_part("u1", repo.docs[0], 4)
+        return result, first_parts, ready
+
+    result, first_parts, ready = asyncio.run(scenario())
+    assert result["current_part"]["content"] == "Slow 1"
+    assert first_parts == 1
+    assert [part["content"] for part in ready["parts"]] == [f"Slow {i}" for i in range(1, 6)]
+
+
+def test_final_feedback_aggregated_from_part_feedback():
+    from utils.feedback_engine import aggregate_final_feedback
+
+    def part(content, score, areas, points):
+        return {"content": content, "user_narration": {"feedback": {
+            "accuracy_score": score, "improvement_areas": areas, "positive_points": points
+        }}}
+
+    story = {"parts": [
+        part("uno dos tres", "90%", ["Intonation"], ["Clarity", "Confidence"]),
+        part("uno dos tres", "60", ["Verb endings", "intonation."], ["Clarity"]),
+        part("uno dos tres", 75, ["Verb endings"], ["Vocabulary"]),
+        {"content": "not narrated", "user_narration": None},
+    ]}
+
+    feedback = aggregate_final_feedback(story)
+    assert feedback["overall_score"] == "75"
+    assert feedback["main_improvement_areas"][:2] == ["Verb endings", "Intonation"]
+    assert feedback["key_strengths"][0] == "Clarity"
+    assert len(feedback["learning_recommendations"]) == 3
+
+
+def test_narration_scorer_aligns_words_and_batches():
+    from utils.narration_scorer import score_batch, char_distances
+
+    assert list(char_distances([("kitten", "sitting"), ("", "abc"), ("tenía", "tenia")])) == [3, 3, 1]
+    first, second = score_batch([
+        ("El perro tenía hambre. Comió pan!", "el perro tenia mucha hambre comio"),
+        ("Hola amigo", "hola amigo"),
+    ], "SPANISH")
+    assert [word["status"] for word in first["words"]] == ["hit", "hit", "close", "hit", "close", "missed"]
+    assert first["extra_words"] == ["mucha"]
+    assert 0 < first["accuracy"] < 80
+    assert second["accuracy"] == 100.0
+
+
+def test_narration_scored_locally_with_llm_feedback_attached_later(monkeypatch):
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    story = {**_story("Calm"), "_id": "story0", "user_id": "u1", "status": "active", "language": "SPANISH", "current_part": 1}
+    repo.docs.append(story)
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "narration_feedback", story_helper.NarrationFeedback())
+    monkeypatch.setattr(story_helper, "NARRATION_FEEDBACK_LLM", "background")
+    monkeypatch.setattr(story_helper, "evaluate_user_narration", lambda original, narration, language: {
+        "accuracy_score": "10", "pronunciation_feedback": "Clear", "grammar_feedback": "Fine",
+        "vocabulary_feedback": "Good", "improvement_areas": ["Pace"], "positive_points": ["Tone"],
+    })
+
+    async def scenario():
+        result = await story_helper.save_part_narration("u1", "calm 1")
+        await asyncio.gather(*story_helper.narration_feedback._tasks)
+        return result
+
+    result = asyncio.run(scenario())
+    assert result["current_feedback"]["accuracy_score"] == "100"
+    assert result["feedback_pending"] is True
+    [(story_id, index, attached)] = repo.part_feedback
+    assert (story_id, index) == ("story0", 0)
+    # the qualitative text comes from the model, the score stays the local one
+    assert attached["pronunciation_feedback"] == "Clear"
+    assert attached["accuracy_score"] == "100"
+
+
+def test_finish_story_waits_for_background_feedback(monkeypatch):
+    import time
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    story = {**_story("Calm"), "_id": "story0", "user_id": "u1", "status": "active", "language": "SPANISH", "current_part": 5}
+    local = {"accuracy_score": "80", "improvement_areas": ["Keep a steady pace"], "positive_points": ["Completed"], "alignment": {}}
+    for part in story["parts"]:
+        part["user_narration"] = {"transcription": part["content"], "feedback": local}
+    repo.docs.append(story)
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "narration_feedback", story_helper.NarrationFeedback())
+    monkeypatch.setattr(story_helper, "NARRATION_FEEDBACK_LLM", "background")
+
+    def slow_evaluation(original, narration, language):
+        time.sleep(0.05)
+        return {"accuracy_score": "10", "improvement_areas": ["Rolled r"], "positive_points": ["Tone"]}
+
+    monkeypatch.setattr(story_helper, "evaluate_user_narration", slow_evaluation)
+
+    async def scenario():
+        snapshot = {**story, "parts": [dict(part) for part in story["parts"]]}
+        story_helper.narration_feedback.attach_in_background("story0", 3, "Calm 4", "Calm 4", "SPANISH", local)
+        return await story_helper.finish_story("u1", snapshot)
+
+    result = asyncio.run(scenario())
+    # the part 4 feedback landed after the snapshot was taken, and still counts
+    assert "Rolled r" in result["final_feedback"]["main_improvement_areas"]
+    assert repo.docs == []
+
+
+def test_cancelled_or_abandoned_continuation_leaves_a_complete_story(monkeypatch):
+    import threading
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    progressive = story_helper.ProgressiveStories()
+    started = threading.Event()
+
+    def stuck_continuation(language, level, title, parts):
+        started.set()
+        yield from ()
+
+    async def never_ending(func, *args):
+        await asyncio.sleep(3600)
+        yield ""
+
+    monkeypatch.setattr(story_helper, "stream_genai", never_ending)
+
+    async def scenario():
+        for user in ("u1", "u2"):
+            doc = {**_story("Cut"), "user_id": user, "status": "active", "language": "SPANISH", "current_part": 1}
+            doc["parts"] = [story_helper.story_part(doc["parts"][0])]
+            await repo.create(doc)
+        # u1's writer is cancelled by a shutdown
+        progressive.complete_in_background("u1", "story0", "SPANISH", "beginner", "Cut", repo.docs[0]["parts"][0])
+        await asyncio.sleep(0.01)
+        await progressive.shutdown()
+        # u2's writer died with its worker: no lease, so the first wait finishes the story
+        return await progressive.wait_for_part("u2", repo.docs[1], 1)
+
+    ready = asyncio.run(scenario())
+    assert len(repo.docs[0]["parts"]) == 5
+    assert len(ready["parts"]) == 5
+    assert progressive.stats()["abandoned"] == 1
+
+
+def test_continuation_renews_its_lease_and_is_replaced_by_the_next_story(monkeypatch):
+    from datetime import datetime
+    from utils import story_helper
+
+    repo = FakeStoriesRepo()
+    monkeypatch.setattr(story_helper, "stories_repo", repo)
+    monkeypatch.setattr(story_helper, "STORY_LEASE_HEARTBEAT", 0.01)
+    monkeypatch.setattr(story_helper, "progressive_stories", story_helper.ProgressiveStories())
+    progressive = story_helper.progressive_stories
+
+    async def slow_stream(func, *args):
+        # the first part takes far longer than the heartbeat
+        await asyncio.sleep(3600)
+        yield ""
+
+    monkeypatch.setattr(story_helper, "stream_genai", slow_stream)
+
+    async def opening(func, language, level):
+        return {"title": "Cut", "title_english": "Cut", "part": _story("Cut")["parts"][0]}
+
+    monkeypatch.setattr(story_helper, "run_genai_shared", opening)
+    monkeypatch.setattr(story_helper.story_prefetcher, "take", lambda *args: asyncio.sleep(0))
+
+    async def scenario():
+        await story_helper.generate_and_start_story("u1", "SPANISH", "beginner")
+        first = repo.docs[0]
+        stale = datetime.utcnow()
+        first["completing_until"] = stale
+        await asyncio.sleep(0.05)
+        renewed = first["completing_until"] > stale
+        writer = progressive._writers["u1"]
+        await story_helper.generate_and_start_story("u1", "SPANISH", "beginner")
+        await asyncio.gather(writer, return_exceptions=True)
+        replaced = writer.cancelled() and progressive._writers["u1"] is not writer
+        await progressive.shutdown()
+        return renewed, replaced
+
+    renewed, replaced = asyncio.run(scenario())
+    assert renewed and replaced
+    assert progressive.stats()["superseded"] == 1
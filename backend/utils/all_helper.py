@@ -1,37 +1,18 @@
-import bcrypt
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
-import dotenv
 import os
 from fastapi.security import OAuth2PasswordBearer
-import google.generativeai as genai
-import json
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from utils.llm import invoke_json, stream_json
+from utils.llm_providers import get_provider
+from basemodels.allpydmodels import DailiesResponse, MemoryPairsResponse, LanguageTeachingResponse, TongueTwistersResponse, SpeechAnalysisResponse
 
-# Database setup
-dotenv.load_dotenv()
-uri = os.getenv('MONGO_URI')
-client = MongoClient(uri, server_api=ServerApi('1'))
-storydb = client["story_db"]
+#LLM provider (Gemini unless LLM_PROVIDER says otherwise); it builds its client on first use in each process
+model = get_provider()
 
-#gemini model
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-# 2025-UPDATE: Using standard flash model and adding fallback
-model = genai.GenerativeModel('gemini-2.5-flash')
 
-
-# Security configurations
 # Security configurations
-# 2025-UPDATE: Using direct bcrypt instead of passlib to avoid version conflicts
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    try:
-        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-    except Exception:
-        return False
+# bcrypt helpers live in utils.password_pool so the hashing processes can import them cheaply
+from utils.password_pool import get_password_hash, verify_password
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 ALGORITHM = os.getenv('ALGORITHM')
@@ -47,6 +28,9 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+SUPPORTED_LANGUAGES = ["SPANISH", "FRENCH", "GERMAN", "ITALIAN", "GUJARATI", "TELUGU", "JAPANESE"]
+LEVELS = ["beginner", "intermediate", "advanced"]
+
 #determine level
 def determine_user_level(points: int) -> str:
     if points < 100:
@@ -59,7 +43,8 @@ def determine_user_level(points: int) -> str:
 #generating dailies
 def generate_dailies(language: str, level: str) -> dict:
     prompt = f"""Generate 10 flashcards for {language} language learning at {level} level.
-    Return only a JSON array with this exact structure:
+    Return only a JSON object with this exact structure:
+    {{
         "cards": [
             {{
                 "new_concept": "concept in {language}",
@@ -72,70 +57,63 @@ def generate_dailies(language: str, level: str) -> dict:
             }}
         ]
     }}"""
-    try:
-        response = model.generate_content(prompt)
-        # Remove markdown formatting and clean the string
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-        # Remove any extra newlines and spaces
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Dailies): {e} - Returning Mock Data")
-        # Mock fallback
-        return {
-            "cards": [
-                {
-                    "new_concept": "Hola (Mock)",
-                    "concept_pronunciation": "oh-la",
-                    "english": "Hello",
-                    "meaning": "A common greeting used when meeting someone.",
-                    "example": "Hola, ¿cómo estás?",
-                    "example_pronunciation": "oh-la, koh-moh ehs-tahs",
-                    "translation": "Hello, how are you?"
-                },
-                {
-                    "new_concept": "Gracias (Mock)",
-                    "concept_pronunciation": "grah-see-ahs",
-                    "english": "Thank you",
-                    "meaning": "Used to express gratitude.",
-                    "example": "Muchas gracias por tu ayuda.",
-                    "example_pronunciation": "moo-chas grah-see-ahs por too ah-yoo-dah",
-                    "translation": "Thank you very much for your help."
-                }
-            ]
-        }
+    return invoke_json(model, "dailies", prompt, DailiesResponse, mock_dailies, last_good_key=(language, level))
+
+
+def mock_dailies() -> dict:
+    return {
+        "cards": [
+            {
+                "new_concept": "Hola (Mock)",
+                "concept_pronunciation": "oh-la",
+                "english": "Hello",
+                "meaning": "A common greeting used when meeting someone.",
+                "example": "Hola, ¿cómo estás?",
+                "example_pronunciation": "oh-la, koh-moh ehs-tahs",
+                "translation": "Hello, how are you?"
+            },
+            {
+                "new_concept": "Gracias (Mock)",
+                "concept_pronunciation": "grah-see-ahs",
+                "english": "Thank you",
+                "meaning": "Used to express gratitude.",
+                "example": "Muchas gracias por tu ayuda.",
+                "example_pronunciation": "moo-chas grah-see-ahs por too ah-yoo-dah",
+                "translation": "Thank you very much for your help."
+            }
+        ]
+    }
 
 
 #generate word pairs for memory game
 def generate_memory_pairs(language: str, level: str) -> dict:
     prompt = f"""Generate 10 word/phrase pairs for a memory matching game in {language} at {level} level so that the user is able to learn some good, effective things to say in that language.
     Return only a JSON object with this exact structure:
+    {{
+        "pairs": [
+            ["word or phrase in {language}", "english translation", "pronunciation in english"]
+        ]
     }}
     Make sure the words/phrases are appropriate for {level} level learners, and if you give phrases, don't make them too long. Also, make sure to give some phrases and some words."""
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Memory): {e} - Returning Mock Data")
-        return {
-            "pairs": [
-                ["Gato (Mock)", "Cat", "Gah-toh"],
-                ["Perro (Mock)", "Dog", "Peh-rro"],
-                ["Casa (Mock)", "House", "Kah-sah"],
-                ["Coche (Mock)", "Car", "Koh-cheh"],
-                ["Árbol (Mock)", "Tree", "Ar-bol"]
-            ]
-        }
+    return invoke_json(
+        model, "memorypairs", prompt, MemoryPairsResponse, mock_memory_pairs, last_good_key=(language, level)
+    )
+
+
+def mock_memory_pairs() -> dict:
+    return {
+        "pairs": [
+            ["Gato (Mock)", "Cat", "Gah-toh"],
+            ["Perro (Mock)", "Dog", "Peh-rro"],
+            ["Casa (Mock)", "House", "Kah-sah"],
+            ["Coche (Mock)", "Car", "Koh-cheh"],
+            ["Árbol (Mock)", "Tree", "Ar-bol"]
+        ]
+    }
 
 
-def language_teaching_chat(language: str, user_query: str) -> dict:
-    prompt = f"""As a language teaching assistant for {language}, respond to: {user_query}, with answers related to {language}.
+def language_teaching_prompt(language: str, user_query: str) -> str:
+    return f"""As a language teaching assistant for {language}, respond to: {user_query}, with answers related to {language}.
     
     Return response in this JSON structure:
     {{
@@ -146,20 +124,26 @@ def language_teaching_chat(language: str, user_query: str) -> dict:
     
     
     Focus on providing clear explanations with practical examples."""
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-         print(f"GenAI Error (Chat): {e} - Returning Mock Data")
-         return {
-            "response": "I'm currently offline (Mock Mode), but normally I'd help you with that!",
-            "examples": "Example 1 (Mock), Example 2 (Mock)",
-            "interesting_facts": "Fact 1 (Mock), Fact 2 (Mock)"
-        }
+
+
+def language_teaching_chat(language: str, user_query: str) -> dict:
+    prompt = language_teaching_prompt(language, user_query)
+    return invoke_json(model, "language_teacher", prompt, LanguageTeachingResponse, mock_language_teaching)
+
+
+def mock_language_teaching() -> dict:
+    return {
+        "response": "I'm currently offline (Mock Mode), but normally I'd help you with that!",
+        "examples": "Example 1 (Mock), Example 2 (Mock)",
+        "interesting_facts": "Fact 1 (Mock), Fact 2 (Mock)"
+    }
+
+#streams the raw text of a language_teaching_chat answer chunk by chunk
+def stream_language_teaching_chat(language: str, user_query: str):
+    yield from stream_json(
+        model, "language_teacher", language_teaching_prompt(language, user_query),
+        LanguageTeachingResponse, mock_language_teaching
+    )
 
 def generate_tongue_twisters(language: str) -> dict:
     prompt = f"""Generate 5 fun and challenging tongue twisters in {language} at five different difficulty levels.
@@ -170,28 +154,26 @@ def generate_tongue_twisters(language: str) -> dict:
             {{
                 "text": "tongue twister in {language}",
                 "pronunciation": "pronunciation guide",
-                "translation": "english translation",
+                "translation": "english translation"
             }}
         ]
     }}"""
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-         print(f"GenAI Error (Twister): {e} - Returning Mock Data")
-         return {
-            "tongue_twisters": [
-                {
-                    "text": "Tres tristes tigres tragaban trigo en un trigal (Mock)",
-                    "pronunciation": "Tres tris-tes ti-gres...",
-                    "translation": "Three sad tigers were eating wheat in a wheat field"
-                }
-            ]
-        }
+
+    return invoke_json(
+        model, "tongue_twisters", prompt, TongueTwistersResponse, mock_tongue_twisters, last_good_key=(language,)
+    )
+
+
+def mock_tongue_twisters() -> dict:
+    return {
+        "tongue_twisters": [
+            {
+                "text": "Tres tristes tigres tragaban trigo en un trigal (Mock)",
+                "pronunciation": "Tres tris-tes ti-gres...",
+                "translation": "Three sad tigers were eating wheat in a wheat field"
+            }
+        ]
+    }
 
 #function to teach sentence transformations based on the sentence given by user
 def analyze_speech_transcript(language: str, transcript: str) -> dict:
@@ -204,22 +186,17 @@ def analyze_speech_transcript(language: str, transcript: str) -> dict:
         "alternatives": [
             "2 alternative ways to express the same meaning"
         ],
-        "score": "rating from 1-10 based on grammar and natural flow",
+        "score": "rating from 1-10 based on grammar and natural flow"
     }}
     
     Focus on natural speech patterns and common expressions in {language}."""
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Analysis): {e} - Returning Mock Data")
-        return {
+
+    return invoke_json(
+        model, "speech_analysis", prompt, SpeechAnalysisResponse,
+        lambda: {
             "original": transcript,
             "correct_form": transcript + " (Corrected Mock)",
             "alternatives": ["Alternative 1", "Alternative 2"],
             "score": "8"
         }
+    )
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import os
+import random
+from collections import deque
+
+from utils.all_helper import generate_dailies, generate_memory_pairs, SUPPORTED_LANGUAGES, LEVELS
+from utils.genai_executor import run_genai
+from utils.single_flight import run_genai_shared
+from utils.genai_scheduler import background_priority
+from utils.lexicon import lexicon, entries_from_dailies, entries_from_pairs
+
+# refill starts when a key drops below LOW and tops it back up to HIGH
+CONTENT_POOL_LOW = int(os.getenv('CONTENT_POOL_LOW', '2'))
+CONTENT_POOL_HIGH = int(os.getenv('CONTENT_POOL_HIGH', '5'))
+# how many times one deck goes round the rotation before it is retired
+CONTENT_POOL_MAX_SERVES = int(os.getenv('CONTENT_POOL_MAX_SERVES', '3'))
+CONTENT_POOL_WARMUP = os.getenv('CONTENT_POOL_WARMUP', '0') == '1'
+# share of requests answered from the lexicon even when the pool has decks; misses always try it first
+LEXICON_SHARE = float(os.getenv('LEXICON_SHARE', '0'))
+
+
+def is_generated(deck) -> bool:
+    """False for empty or "(Mock)" content, which the helpers return when GenAI fails; never pool or cache it."""
+    return bool(deck) and "(Mock)" not in json.dumps(deck, ensure_ascii=False)
+
+
+class ContentPool:
+    """Ready-made decks per (language, level), refilled in the background.
+
+    Fresh decks are served first, and a served deck goes to the back of the
+    queue until it has been handed out max_serves times, so consecutive
+    requests for the same key get different decks.
+
+    Every generated deck is harvested into the lexicon, and once the lexicon
+    holds enough entries for a key a miss is answered from it instead of
+    waiting on the model.
+    """
+
+    def __init__(self, name: str, generator, low: int, high: int, max_serves: int, entries=None, sampler=None):
+        self.name = name
+        self.generator = generator
+        self.low = low
+        self.high = max(high, low)
+        self.max_serves = max(max_serves, 1)
+        self.entries = entries
+        self.sampler = sampler
+        self._decks = {}
+        self._refilling = set()
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.lexicon_hits = 0
+
+    def _queue(self, key) -> deque:
+        return self._decks.setdefault(key, deque())
+
+    def _push(self, key, deck, serves: int):
+        if serves < self.max_serves:
+            self._queue(key).append({"deck": deck, "serves": serves})
+
+    def _harvest(self, language: str, level: str, deck):
+        if self.entries is not None:
+            lexicon.harvest(language, self.name, self.entries(deck, level))
+
+    async def _from_lexicon(self, key):
+        if self.sampler is None:
+            return None
+        try:
+            deck = await self.sampler(*key)
+        except Exception as e:
+            print(f"Lexicon sample error ({self.name} {key[0]}/{key[1]}): {e}")
+            return None
+        if deck is not None:
+            self.lexicon_hits += 1
+        return deck
+
+    async def get(self, language: str, level: str):
+        key = (language, level)
+        decks = self._queue(key)
+        if (not decks or random.random() < LEXICON_SHARE) and (deck := await self._from_lexicon(key)) is not None:
+            self._schedule_refill(key)
+            return deck
+        if decks:
+            self.hits += 1
+            entry = decks.popleft()
+            self._push(key, entry["deck"], entry["serves"] + 1)
+            self._schedule_refill(key)
+            return entry["deck"]
+
+        # pool is empty: generate on the request path, then keep the deck for others
+        self.misses += 1
+        # a burst of misses for one key waits on a single generation
+        deck = await run_genai_shared(self.generator, language, level)
+        if is_generated(deck):
+            self.generated += 1
+            self._push(key, deck, 1)
+            self._harvest(language, level, deck)
+        self._schedule_refill(key)
+        return deck
+
+    def _schedule_refill(self, key):
+        if len(self._queue(key)) >= self.low or key in self._refilling:
+            return
+        self._refilling.add(key)
+        task = asyncio.get_running_loop().create_task(self._refill(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key):
+        language, level = key
+        background_priority()
+        try:
+            while len(self._queue(key)) < self.high:
+                deck = await run_genai(self.generator, language, level)
+                if not is_generated(deck) or any(entry["deck"] == deck for entry in self._queue(key)):
+                    # generation is failing (mock or last-known-good content); stop and let the next request retry
+                    break
+                self.generated += 1
+                self._harvest(language, level, deck)
+                # unseen decks jump ahead of ones already handed out
+                self._queue(key).appendleft({"deck": deck, "serves": 0})
+        except Exception as e:
+            print(f"Content pool refill error ({self.name} {language}/{level}): {e}")
+        finally:
+            self._refilling.discard(key)
+
+    def warm_up(self):
+        for language in SUPPORTED_LANGUAGES:
+            for level in LEVELS:
+                self._schedule_refill((language, level))
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._refilling.clear()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "lexicon_hits": self.lexicon_hits,
+            "refilling": len(self._refilling),
+            "decks": {f"{language}/{level}": len(decks) for (language, level), decks in self._decks.items()},
+        }
+
+
+dailies_pool = ContentPool(
+    "dailies", generate_dailies, CONTENT_POOL_LOW, CONTENT_POOL_HIGH, CONTENT_POOL_MAX_SERVES,
+    entries=entries_from_dailies, sampler=lexicon.dailies,
+)
+memory_pairs_pool = ContentPool(
+    "memorypairs", generate_memory_pairs, CONTENT_POOL_LOW, CONTENT_POOL_HIGH, CONTENT_POOL_MAX_SERVES,
+    entries=entries_from_pairs, sampler=lexicon.pairs,
+)
+content_pools = [dailies_pool, memory_pairs_pool]
@@ -0,0 +1,92 @@
+import re
+from collections import defaultdict
+
+# Builds the end-of-story feedback from the per-part evaluations that
+# save_part_narration already stored, instead of asking Gemini again.
+
+TOP_ITEMS = 3
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_NOT_WORD = re.compile(r"[^\w\s]")
+
+
+def parse_score(value):
+    """Accuracy scores arrive as 85, "85", "85%" or "85/100"; returns a 0-100 float or None."""
+    if isinstance(value, (int, float)):
+        score = float(value)
+    else:
+        match = _NUMBER.search(str(value or ""))
+        if not match:
+            return None
+        score = float(match.group())
+    return max(0.0, min(100.0, score))
+
+
+def _normalise(item: str) -> str:
+    return " ".join(_NOT_WORD.sub(" ", item.casefold()).split())
+
+
+def _rank_items(weighted_lists: list) -> list:
+    """Rank free-text items by summed weight, then frequency, across several feedbacks.
+
+    weighted_lists holds (items, weight) pairs; within one list earlier items
+    count more, since the model lists the most important points first.
+    """
+    totals = defaultdict(float)
+    counts = defaultdict(int)
+    labels = {}
+    for items, weight in weighted_lists:
+        seen = set()
+        for position, item in enumerate(items or []):
+            if not isinstance(item, str) or not item.strip():
+                continue
+            key = _normalise(item)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            totals[key] += weight / (position + 1)
+            counts[key] += 1
+            labels.setdefault(key, item.strip())
+    ranked = sorted(totals, key=lambda key: (-totals[key], -counts[key], key))
+    return [labels[key] for key in ranked[:TOP_ITEMS]]
+
+
+def _recommendations(score: float, areas: list) -> list:
+    recommendations = [f"Practise {area[0].lower() + area[1:]} with short daily read-alouds" for area in areas[:2]]
+    if score < 50:
+        recommendations.append("Replay each story part slowly and repeat it sentence by sentence")
+    elif score < 80:
+        recommendations.append("Narrate the story again at a natural pace to build fluency")
+    else:
+        recommendations.append("Move on to a longer or harder story to keep improving")
+    return recommendations
+
+
+def aggregate_final_feedback(story: dict) -> dict:
+    """Final feedback in the same shape generate_final_feedback returns, computed locally."""
+    scored = []
+    strengths = []
+    improvements = []
+    for part in story["parts"]:
+        narration = part.get("user_narration")
+        if not narration:
+            continue
+        feedback = narration.get("feedback") or {}
+        score = parse_score(feedback.get("accuracy_score"))
+        # longer parts carry more of the story, so they weigh more in the average
+        length = max(len(part.get("content", "").split()), 1)
+        if score is not None:
+            scored.append((score, length))
+        accuracy = (score if score is not None else 50.0) / 100
+        # strengths from strong narrations, improvement areas from weak ones, count most
+        strengths.append((feedback.get("positive_points"), 0.5 + accuracy))
+        improvements.append((feedback.get("improvement_areas"), 1.5 - accuracy))
+
+    total_weight = sum(length for _, length in scored)
+    overall = sum(score * length for score, length in scored) / total_weight if total_weight else 0.0
+    areas = _rank_items(improvements)
+    return {
+        "overall_score": str(round(overall)),
+        "key_strengths": _rank_items(strengths),
+        "main_improvement_areas": areas,
+        "learning_recommendations": _recommendations(overall, areas),
+    }
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from fastapi import HTTPException, status
+
+from utils.genai_scheduler import genai_scheduler, set_prepaid, take_prepaid
+
+# Gemini calls are blocking, so they run on their own bounded thread pool
+# instead of the event loop (or the default executor shared with everything else)
+GENAI_MAX_CONCURRENCY = int(os.getenv('GENAI_MAX_CONCURRENCY', '16'))
+# 0 means the waiting queue is unbounded
+GENAI_MAX_QUEUE = int(os.getenv('GENAI_MAX_QUEUE', '0'))
+
+
+class GenAIExecutor:
+    def __init__(self, max_workers: int, max_queue: int = 0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="genai")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _call(self, func, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._inflight += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                self._completed += 1
+
+    async def run(self, func, *args, **kwargs):
+        with self._lock:
+            if self.max_queue and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Content generation is busy, please try again"
+                )
+            self._queued += 1
+        future = self._pool.submit(partial(self._call, func, args, kwargs))
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        # a call cancelled while still queued never reaches _call
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_workers,
+                "max_queue": self.max_queue,
+                "inflight": self._inflight,
+                "queued": self._queued,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+
+genai_executor = GenAIExecutor(GENAI_MAX_CONCURRENCY, GENAI_MAX_QUEUE)
+
+
+def _prepaid_call(tokens: float, func, *args, **kwargs):
+    set_prepaid(tokens)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        take_prepaid()
+
+
+async def run_genai(func, *args, **kwargs):
+    """Run a blocking generation helper on the GenAI pool without blocking the event loop."""
+    tokens = await genai_scheduler.acquire_for(func)
+    return await genai_executor.run(_prepaid_call, tokens, func, *args, **kwargs)
+
+
+async def stream_genai(func, *args):
+    """Async-iterate a blocking generator of text chunks (e.g. a Gemini stream) run on the GenAI pool."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    end = object()
+    tokens = await genai_scheduler.acquire_for(func)
+
+    def pump():
+        # latency and fallbacks are recorded per feature by the helper (llm.stream_json)
+        set_prepaid(tokens)
+        chunks = None
+        try:
+            chunks = func(*args)
+            for chunk in chunks:
+                if stop.is_set():
+                    # the client went away; stop reading from Gemini
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (chunk, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            take_prepaid()
+            loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+
+    worker = asyncio.ensure_future(genai_executor.run(pump))
+    try:
+        while True:
+            chunk, error = await queue.get()
+            if error is not None:
+                raise error
+            if chunk is end:
+                break
+            yield chunk
+    finally:
+        stop.set()
+        await asyncio.gather(worker, return_exceptions=True)
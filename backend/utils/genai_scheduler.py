@@ -0,0 +1,286 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from fastapi import HTTPException, status
+
+# Gemini quota for this process; 0 disables that budget
+GENAI_RPM = float(os.getenv('GENAI_RPM', '1000'))
+GENAI_TPM = float(os.getenv('GENAI_TPM', '1000000'))
+# how much of the per-minute budget may be spent at once
+GENAI_BURST_SECONDS = float(os.getenv('GENAI_BURST_SECONDS', '10'))
+
+# priority classes, most urgent first
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, STANDARD, BACKGROUND)
+
+# longest a call of each class may wait for quota before it is rejected
+QUEUE_DEADLINES = {
+    INTERACTIVE: float(os.getenv('GENAI_DEADLINE_INTERACTIVE', '10')),
+    STANDARD: float(os.getenv('GENAI_DEADLINE_STANDARD', '20')),
+    BACKGROUND: float(os.getenv('GENAI_DEADLINE_BACKGROUND', '120')),
+}
+
+# default class per generation helper; background tasks override it with background_priority()
+HELPER_PRIORITIES = {
+    "evaluate_user_narration": INTERACTIVE,
+    "generate_story_opening": INTERACTIVE,
+    "generate_stories": INTERACTIVE,
+    "stream_stories": INTERACTIVE,
+    # /storynarrate waits on the continuation for the next part, so it is user-facing work
+    "stream_story_continuation": INTERACTIVE,
+    "language_teaching_chat": STANDARD,
+    "stream_language_teaching_chat": STANDARD,
+    "analyze_speech_transcript": STANDARD,
+    "generate_dailies": STANDARD,
+    "generate_memory_pairs": STANDARD,
+    "generate_tongue_twisters": BACKGROUND,
+    "generate_final_feedback": BACKGROUND,
+}
+
+# rough prompt + reply size of each helper, charged against the tokens-per-minute budget
+ESTIMATED_TOKENS = {
+    "generate_stories": 2500,
+    "stream_stories": 2500,
+    "stream_story_continuation": 2500,
+    "generate_story_opening": 800,
+    "generate_dailies": 2000,
+    "generate_memory_pairs": 800,
+    "evaluate_user_narration": 700,
+    "generate_final_feedback": 900,
+}
+DEFAULT_ESTIMATED_TOKENS = 1000
+
+_priority = contextvars.ContextVar("genai_priority", default=None)
+# tokens paid at admission for the helper running on this GenAI thread; the
+# helper's first Gemini call settles them against its real usage
+_prepaid = threading.local()
+
+
+def background_priority():
+    """Mark GenAI calls made from the current task as background work."""
+    _priority.set(BACKGROUND)
+
+
+def set_prepaid(tokens: float):
+    _prepaid.tokens = tokens
+
+
+def take_prepaid() -> float:
+    tokens = getattr(_prepaid, "tokens", 0.0)
+    _prepaid.tokens = 0.0
+    return tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0) if per_minute else 0.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate == 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def cost(self, amount: float) -> float:
+        # a request larger than the whole bucket still has to be able to run
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        missing = self.cost(amount) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.tokens -= self.cost(amount)
+
+    def has_headroom(self, amount: float, share: float, now: float) -> bool:
+        """Whether taking amount still leaves at least share of the bucket."""
+        if self.unlimited:
+            return True
+        self._refill(now)
+        return self.tokens - self.cost(amount) >= share * self.capacity
+
+    def adjust(self, amount: float, now: float):
+        # may go below zero: later grants then wait the debt out
+        if self.unlimited:
+            return
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self):
+        self.tokens = min(self.tokens, 0.0)
+
+    def level(self):
+        if self.unlimited:
+            return None
+        self._refill(time.monotonic())
+        return round(self.tokens, 1)
+
+
+class GenAIScheduler:
+    """Admits Gemini calls against requests- and tokens-per-minute budgets.
+
+    Waiting calls are granted strictly by priority class, then arrival order,
+    so interactive calls overtake queued background work. A call still
+    waiting when its class deadline passes is rejected with a 503 instead of
+    being sent late. Optional extra calls (hedges) take quota through
+    try_acquire, which never queues and is safe to call from worker threads.
+    """
+
+    def __init__(self, rpm: float, tpm: float, burst_seconds: float, deadlines: dict):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds)
+        self.deadlines = deadlines
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+        # the buckets and queue are also touched by try_acquire from worker threads
+        self._lock = threading.Lock()
+        self._counts = {priority: {"granted": 0, "expired": 0, "waited_ms": 0.0} for priority in PRIORITIES}
+        self.throttled = 0
+        self.optional_granted = 0
+        self.optional_refused = 0
+        self.charged_requests = 0
+        self.reconciled_tokens = 0.0
+
+    def priority_for(self, func) -> str:
+        return _priority.get() or HELPER_PRIORITIES.get(getattr(func, "__name__", ""), STANDARD)
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def _grant(self, priority: str, tokens: float, waited: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self._counts[priority]["granted"] += 1
+        self._counts[priority]["waited_ms"] += waited * 1000
+
+    def _kick(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def _dispatch(self):
+        self._timer = None
+        now = time.monotonic()
+        with self._lock:
+            while self._waiters:
+                _, _, priority, tokens, future, queued_at = self._waiters[0]
+                if future.done() or future.get_loop().is_closed():
+                    heapq.heappop(self._waiters)
+                    continue
+                delay = self._wait_time(tokens, now)
+                if delay > 0:
+                    self._timer = future.get_loop().call_later(delay, self._dispatch)
+                    return
+                heapq.heappop(self._waiters)
+                self._grant(priority, tokens, now - queued_at)
+                future.set_result(None)
+
+    async def acquire(self, priority: str, tokens: float):
+        now = time.monotonic()
+        with self._lock:
+            if not self._waiters and self._wait_time(tokens, now) == 0:
+                self._grant(priority, tokens, 0.0)
+                return
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (PRIORITIES.index(priority), next(self._seq), priority, tokens, future, now))
+        self._kick()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.deadlines[priority])
+        except asyncio.TimeoutError:
+            future.cancel()
+            # a smaller request behind this one may fit right away
+            self._kick()
+            self._counts[priority]["expired"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Content generation is busy, please try again"
+            )
+        except asyncio.CancelledError:
+            # the caller went away; a grant that raced in is simply spent
+            future.cancel()
+            self._kick()
+            raise
+
+    async def acquire_for(self, func) -> float:
+        """Admit a helper's call; returns the token estimate that was charged for it."""
+        tokens = ESTIMATED_TOKENS.get(getattr(func, "__name__", ""), DEFAULT_ESTIMATED_TOKENS)
+        await self.acquire(self.priority_for(func), tokens)
+        return tokens
+
+    def charge(self, requests: int = 0, tokens: float = 0.0):
+        """Account for usage that was not admitted by acquire: retries, and the
+        difference between a call's estimate and its real token count (negative
+        for a refund). Never waits, so it is safe from worker threads."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests.adjust(requests, now)
+            self.tokens.adjust(tokens, now)
+            self.charged_requests += requests
+            self.reconciled_tokens += tokens
+
+    def settle(self, used: float, prepaid: float):
+        """A call that was charged prepaid tokens reported used tokens."""
+        self.charge(tokens=used - prepaid)
+
+    def try_acquire(self, tokens: float, headroom: float) -> bool:
+        """Take quota for an optional call right away, or refuse.
+
+        Refused while any call is queued or when the grant would leave
+        either bucket below headroom (a share of its capacity), so optional
+        work never competes with the calls it is meant to speed up.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._waiters or not (
+                self.requests.has_headroom(1, headroom, now) and self.tokens.has_headroom(tokens, headroom, now)
+            ):
+                self.optional_refused += 1
+                return False
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.optional_granted += 1
+            return True
+
+    def report_throttled(self):
+        """The provider answered 429: stop granting until the buckets refill."""
+        with self._lock:
+            self.throttled += 1
+            self.requests.drain()
+            self.tokens.drain()
+
+    def stats(self) -> dict:
+        queued = {priority: 0 for priority in PRIORITIES}
+        for _, _, priority, _, future, _ in self._waiters:
+            if not future.done():
+                queued[priority] += 1
+        return {
+            "queue_depth": queued,
+            "classes": {priority: dict(counts) for priority, counts in self._counts.items()},
+            "requests_available": self.requests.level(),
+            "tokens_available": self.tokens.level(),
+            "throttled": self.throttled,
+            "optional_granted": self.optional_granted,
+            "optional_refused": self.optional_refused,
+            "charged_requests": self.charged_requests,
+            "reconciled_tokens": round(self.reconciled_tokens),
+        }
+
+
+genai_scheduler = GenAIScheduler(GENAI_RPM, GENAI_TPM, GENAI_BURST_SECONDS, QUEUE_DEADLINES)
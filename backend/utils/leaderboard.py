@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+
+from pymongo import ASCENDING, DESCENDING
+
+LEADERBOARD_PAGE_SIZE = int(os.getenv('LEADERBOARD_PAGE_SIZE', '50'))
+LEADERBOARD_MAX_PAGE_SIZE = 200
+LEADERBOARD_MAX_WINDOW = 50
+
+# Ranking is "points desc, username asc". Every query below is a range scan
+# on the matching {languages.<L>: -1, username: 1} index, so neither a page
+# nor a rank lookup touches more documents than it returns or counts.
+# The routes pass in the users repository they got from Depends(get_users_repo).
+
+
+def score_field(language: str) -> str:
+    return f"languages.{language}"
+
+
+def leaderboard_index(language: str) -> list:
+    return [(score_field(language), DESCENDING), ("username", ASCENDING)]
+
+
+def encode_cursor(points: int, username: str, rank: int) -> str:
+    raw = json.dumps({"p": points, "u": username, "r": rank}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return {"points": data["p"], "username": data["u"], "rank": int(data["r"])}
+    except Exception:
+        raise ValueError("Invalid leaderboard cursor")
+
+
+def _ranked_after(field: str, points: int, username: str) -> dict:
+    # everything that sorts after (points, username)
+    return {"$or": [
+        {field: {"$lt": points}},
+        {field: points, "username": {"$gt": username}},
+    ]}
+
+
+def _ranked_before(field: str, points: int, username: str) -> dict:
+    # everything that sorts before (points, username)
+    return {"$or": [
+        {field: {"$gt": points}},
+        {field: points, "username": {"$lt": username}},
+    ]}
+
+
+def _entry(doc: dict, language: str, rank: int) -> dict:
+    return {
+        "username": doc["username"],
+        "points": doc["languages"][language],
+        "rank": rank,
+    }
+
+
+async def top_page(users_repo, language: str, limit: int = None, cursor: str = None) -> dict:
+    field = score_field(language)
+    limit = max(1, min(limit or LEADERBOARD_PAGE_SIZE, LEADERBOARD_MAX_PAGE_SIZE))
+    projection = {"_id": 0, "username": 1, field: 1}
+
+    if cursor:
+        after = decode_cursor(cursor)
+        query = _ranked_after(field, after["points"], after["username"])
+        first_rank = after["rank"] + 1
+    else:
+        query = {field: {"$exists": True}}
+        first_rank = 1
+
+    # one extra document tells us whether there is a next page
+    docs = await users_repo.find(query, projection, sort=leaderboard_index(language), limit=limit + 1)
+    page = [_entry(doc, language, first_rank + i) for i, doc in enumerate(docs[:limit])]
+
+    next_cursor = None
+    if len(docs) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(last["points"], last["username"], last["rank"])
+    return {"leaderboard": page, "next_cursor": next_cursor}
+
+
+async def rank_of(users_repo, language: str, username: str, points: int) -> int:
+    field = score_field(language)
+    return await users_repo.count(_ranked_before(field, points, username)) + 1
+
+
+async def around_user(users_repo, language: str, username: str, window: int) -> dict:
+    field = score_field(language)
+    window = max(0, min(window, LEADERBOARD_MAX_WINDOW))
+    user = await users_repo.get_by_username(username, {"_id": 0, field: 1})
+    if not user or language not in user.get("languages", {}):
+        return {"rank": None, "points": None, "leaderboard": []}
+
+    points = user["languages"][language]
+    rank = await rank_of(users_repo, language, username, points)
+    projection = {"_id": 0, "username": 1, field: 1}
+
+    above = []
+    below = []
+    if window:
+        # walk the index backwards from the user for the neighbours above
+        reverse_sort = [(field, ASCENDING), ("username", DESCENDING)]
+        above = await users_repo.find(_ranked_before(field, points, username), projection, sort=reverse_sort, limit=window)
+        below = await users_repo.find(_ranked_after(field, points, username), projection, sort=leaderboard_index(language), limit=window)
+
+    entries = [_entry(doc, language, rank - i - 1) for i, doc in enumerate(above)][::-1]
+    entries.append({"username": username, "points": points, "rank": rank})
+    entries.extend(_entry(doc, language, rank + i + 1) for i, doc in enumerate(below))
+    return {"rank": rank, "points": points, "leaderboard": entries}
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import re
+import unicodedata
+
+from database import lexicon_repo
+
+# a language/level is served from the lexicon only once it holds this many sampleable entries
+LEXICON_MIN_ENTRIES = int(os.getenv('LEXICON_MIN_ENTRIES', '50'))
+LEXICON_DECK_SIZE = int(os.getenv('LEXICON_DECK_SIZE', '10'))
+
+# twisters come five to a reply spanning every difficulty, so they are not levelled
+ANY_LEVEL = "any"
+
+
+def normalise(text: str) -> str:
+    """The dedup key for a concept: NFC, case-folded, whitespace collapsed, outer punctuation dropped."""
+    text = unicodedata.normalize("NFC", text or "").casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(".,;:!?¡¿\"'«»“”‘’()[]")
+
+
+def _clean(text) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", str(text or ""))).strip()
+
+
+def _entry(kind: str, level: str, concept: str, translation: str, pronunciation: str, **extra) -> dict:
+    entry = {
+        "key": f"{kind}:{normalise(concept)}",
+        "kind": kind,
+        "level": level,
+        "concept": _clean(concept),
+        "translation": _clean(translation),
+        "pronunciation": _clean(pronunciation),
+    }
+    entry.update({field: _clean(value) for field, value in extra.items()})
+    return entry
+
+
+def entries_from_dailies(deck: dict, level: str) -> list:
+    return [
+        _entry(
+            "word", level, card["new_concept"], card["english"], card["concept_pronunciation"],
+            meaning=card["meaning"], example=card["example"],
+            example_pronunciation=card["example_pronunciation"], example_translation=card["translation"],
+        )
+        for card in deck.get("cards", [])
+        if card.get("new_concept")
+    ]
+
+
+def entries_from_pairs(pairs: dict, level: str) -> list:
+    # pairs are [word, english, pronunciation], the order the memory game reads them in
+    return [
+        _entry("word", level, pair[0], pair[1], pair[2])
+        for pair in pairs.get("pairs", [])
+        if len(pair) >= 3 and pair[0]
+    ]
+
+
+def entries_from_twisters(twisters: dict) -> list:
+    return [
+        _entry("twister", ANY_LEVEL, item["text"], item["translation"], item["pronunciation"])
+        for item in twisters.get("tongue_twisters", [])
+        if item.get("text")
+    ]
+
+
+def _card(entry: dict) -> dict:
+    return {
+        "new_concept": entry["concept"],
+        "concept_pronunciation": entry["pronunciation"],
+        "english": entry["translation"],
+        "meaning": entry["meaning"],
+        "example": entry["example"],
+        "example_pronunciation": entry["example_pronunciation"],
+        "translation": entry["example_translation"],
+    }
+
+
+class Lexicon:
+    """Every word and twister the model has generated, kept per language.
+
+    harvest() stores the entries of a generated reply in the background, so
+    it never adds latency to the response. dailies() and pairs() build a
+    deck straight from the lexicon by random sampling, or return None while
+    the language/level has fewer than min_entries usable entries.
+    """
+
+    def __init__(self, min_entries: int, deck_size: int):
+        self.min_entries = min_entries
+        self.deck_size = deck_size
+        self._tasks = set()
+        self._ready = set()
+        self.harvested = 0
+        self.harvest_errors = 0
+        self.served = 0
+        self.not_ready = 0
+
+    def harvest(self, language: str, source: str, entries: list):
+        if not entries:
+            return
+        task = asyncio.get_running_loop().create_task(self._store(language.upper(), source, entries))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _store(self, language: str, source: str, entries: list):
+        try:
+            await lexicon_repo.upsert_many(language, [(source, entry) for entry in entries])
+            self.harvested += len(entries)
+        except Exception as e:
+            self.harvest_errors += 1
+            print(f"Lexicon harvest error ({language} {source}): {e}")
+
+    async def _sample(self, language: str, query: dict):
+        ready_key = (language, repr(sorted(query.items())))
+        # the lexicon only grows, so once a key has enough entries the count is not repeated
+        if ready_key not in self._ready:
+            if await lexicon_repo.count(language, query) < self.min_entries:
+                self.not_ready += 1
+                return None
+            self._ready.add(ready_key)
+        entries = await lexicon_repo.sample(language, query, self.deck_size)
+        if len(entries) < self.deck_size:
+            return None
+        self.served += 1
+        return entries
+
+    async def dailies(self, language: str, level: str):
+        # pair-only entries have no meaning/example and cannot make a full card
+        entries = await self._sample(language.upper(), {"kind": "word", "level": level, "example": {"$gt": ""}})
+        return {"cards": [_card(entry) for entry in entries]} if entries else None
+
+    async def pairs(self, language: str, level: str):
+        entries = await self._sample(language.upper(), {"kind": "word", "level": level})
+        return {"pairs": [[entry["concept"], entry["translation"], entry["pronunciation"]] for entry in entries]} if entries else None
+
+    async def search(self, language: str, text: str, limit: int = 20) -> list:
+        return await lexicon_repo.search(language.upper(), text, limit)
+
+    async def shutdown(self):
+        # let in-flight harvests land rather than dropping them
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "harvested": self.harvested,
+            "harvest_errors": self.harvest_errors,
+            "pending": len(self._tasks),
+            "served": self.served,
+            "not_ready": self.not_ready,
+        }
+
+
+lexicon = Lexicon(LEXICON_MIN_ENTRIES, LEXICON_DECK_SIZE)
@@ -0,0 +1,311 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pydantic import ValidationError
+
+from utils.genai_scheduler import genai_scheduler, take_prepaid, DEFAULT_ESTIMATED_TOKENS
+from utils.metrics import LLM_LATENCY, LLM_FALLBACKS
+from utils.llm_resilience import (
+    CircuitBreaker, LatencyTracker, last_known_good,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN, LLM_HEDGE, LLM_HEDGE_MAX_RATIO, LATENCY_WINDOW,
+    LLM_HEDGE_MAX_OUTSTANDING, LLM_HEDGE_MIN_HEADROOM,
+)
+
+# extra attempts after a reply that is not valid JSON for the expected model
+LLM_JSON_RETRIES = int(os.getenv('LLM_JSON_RETRIES', '1'))
+
+# give up on a Gemini call after this many seconds
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '30'))
+
+# Gemini JSON mode: the reply is a bare JSON document, no markdown fences
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+_decoder = json.JSONDecoder()
+_COUNTERS = (
+    "calls", "replies", "parse_failures", "retries", "errors", "fallbacks",
+    "short_circuited", "stale_served", "hedged", "hedge_wins", "hedges_skipped",
+)
+# primary and hedge calls run here when hedging, so the caller can wait on both
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv('GENAI_MAX_CONCURRENCY', '16')) * 2, thread_name_prefix="llm-hedge")
+# a slot is held from the hedge's submission until it finishes, won or lost
+_hedge_slots = threading.BoundedSemaphore(max(LLM_HEDGE_MAX_OUTSTANDING, 1))
+
+
+class LLMStats:
+    """Per-feature call, parse-failure, retry and fallback counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: defaultdict(int))
+        self._breakers = {}
+        self._latencies = {}
+
+    def incr(self, feature: str, counter: str):
+        with self._lock:
+            self._counts[feature][counter] += 1
+
+    def count(self, feature: str, counter: str) -> int:
+        with self._lock:
+            return self._counts[feature][counter]
+
+    def breaker(self, feature: str) -> CircuitBreaker:
+        with self._lock:
+            if feature not in self._breakers:
+                self._breakers[feature] = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+            return self._breakers[feature]
+
+    def latency(self, feature: str) -> LatencyTracker:
+        with self._lock:
+            if feature not in self._latencies:
+                self._latencies[feature] = LatencyTracker(LATENCY_WINDOW)
+            return self._latencies[feature]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for feature, counts in self._counts.items():
+                replies = counts["replies"]
+                breaker = self._breakers.get(feature)
+                latency = self._latencies.get(feature)
+                result[feature] = {
+                    **{counter: counts[counter] for counter in _COUNTERS},
+                    "parse_failure_rate": counts["parse_failures"] / replies if replies else 0.0,
+                    "circuit": breaker.state if breaker else "closed",
+                    "p95_seconds": latency.p95() if latency else None,
+                }
+        return result
+
+
+llm_stats = LLMStats()
+
+
+def extract_json(text: str):
+    """Parse the first JSON object or array in text in one pass.
+
+    Tolerates leading prose or a ```json fence and trailing text, without
+    rewriting the string (so newlines inside values survive).
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        raise ValueError("no JSON object in reply")
+    value, _ = _decoder.raw_decode(text, min(starts))
+    return value
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted" or "429" in str(error)
+
+
+def _retry_prompt(prompt: str, error: Exception) -> str:
+    detail = str(error).splitlines()[0][:200]
+    return (
+        f"{prompt}\n\nYour previous reply could not be used ({detail}). "
+        "Reply again with only the JSON object, exactly matching the structure above."
+    )
+
+
+def response_tokens(response):
+    """Total tokens a reply reports (Gemini usage_metadata, or LLMResponse.usage), or None."""
+    total = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+    if isinstance(total, int) and total:
+        return total
+    usage = getattr(response, "usage", None)
+    if isinstance(usage, dict) and usage:
+        return usage.get("prompt_tokens", 0) + usage.get("output_tokens", 0)
+    return None
+
+
+def _call_model(model, feature: str, prompt: str, prepaid: float = 0.0) -> str:
+    """One model call; the prepaid token estimate is settled against the usage the reply reports."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = model.generate_content(
+            prompt, generation_config=JSON_GENERATION_CONFIG, request_options={"timeout": LLM_TIMEOUT}
+        )
+        text = response.text
+        outcome = "ok"
+        used = response_tokens(response)
+        if used is not None:
+            genai_scheduler.settle(used, prepaid)
+        return text
+    finally:
+        LLM_LATENCY.labels(feature, outcome).observe(time.perf_counter() - started)
+
+
+def _start_hedge(model, feature: str, prompt: str):
+    """Submit a hedge call, or return None when the hedge budget, the slots or the quota say no."""
+    if llm_stats.count(feature, "hedged") >= LLM_HEDGE_MAX_RATIO * llm_stats.count(feature, "calls"):
+        return None
+    if not _hedge_slots.acquire(blocking=False):
+        llm_stats.incr(feature, "hedges_skipped")
+        return None
+    # the hedge is a real Gemini request, so it is paid for like one
+    if not genai_scheduler.try_acquire(DEFAULT_ESTIMATED_TOKENS, LLM_HEDGE_MIN_HEADROOM):
+        _hedge_slots.release()
+        llm_stats.incr(feature, "hedges_skipped")
+        return None
+    llm_stats.incr(feature, "hedged")
+    hedge = _hedge_pool.submit(_call_model, model, feature, prompt, DEFAULT_ESTIMATED_TOKENS)
+    hedge.add_done_callback(lambda _: _hedge_slots.release())
+    return hedge
+
+
+def _generate(model, feature: str, prompt: str, prepaid: float) -> str:
+    """One Gemini call, hedged with a second identical call if it runs past the feature's p95."""
+    latency = llm_stats.latency(feature)
+    started = time.monotonic()
+    delay = latency.p95() if LLM_HEDGE else None
+    if delay is None:
+        text = _call_model(model, feature, prompt, prepaid)
+        latency.record(time.monotonic() - started)
+        return text
+
+    primary = _hedge_pool.submit(_call_model, model, feature, prompt, prepaid)
+    done, _ = wait([primary], timeout=delay)
+    calls = [primary]
+    if not done:
+        hedge = _start_hedge(model, feature, prompt)
+        if hedge is not None:
+            calls.append(hedge)
+    pending = set(calls)
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    llm_stats.incr(feature, "hedge_wins")
+                latency.record(time.monotonic() - started)
+                # a loser still queued is dropped; one already sending runs out and its reply is discarded
+                for loser in pending:
+                    loser.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def invoke_json(model, feature: str, prompt: str, response_model, fallback, retries: int = None, last_good_key: tuple = None):
+    """Generate, parse and validate a JSON reply for one feature.
+
+    Returns the parsed dict once it validates against response_model (a
+    pydantic model). Unparseable or invalid replies are retried with the
+    error appended to the prompt. If the call fails, the feature's circuit
+    is open, or every attempt is invalid, the last good reply stored under
+    last_good_key (e.g. (language, level)) is returned, else fallback().
+    """
+    retries = LLM_JSON_RETRIES if retries is None else retries
+    llm_stats.incr(feature, "calls")
+    breaker = llm_stats.breaker(feature)
+    # what run_genai charged when it admitted the helper: pays for the first attempt
+    prepaid = take_prepaid()
+    estimate = prepaid or DEFAULT_ESTIMATED_TOKENS
+    attempt_prompt = prompt
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            llm_stats.incr(feature, "short_circuited")
+            LLM_FALLBACKS.labels(feature, "short_circuit").inc()
+            break
+        if attempt:
+            llm_stats.incr(feature, "retries")
+            # a retry is another Gemini request: pay for it before sending
+            genai_scheduler.charge(requests=1, tokens=estimate)
+            prepaid = estimate
+        try:
+            text = _generate(model, feature, attempt_prompt, prepaid)
+        except Exception as e:
+            print(f"GenAI Error ({feature}): {e} - Returning Fallback Data")
+            llm_stats.incr(feature, "errors")
+            breaker.record_failure()
+            if _is_rate_limited(e):
+                genai_scheduler.report_throttled()
+            break
+        breaker.record_success()
+        llm_stats.incr(feature, "replies")
+        try:
+            data = extract_json(text)
+            response_model.model_validate(data)
+        except (ValueError, ValidationError) as e:
+            llm_stats.incr(feature, "parse_failures")
+            attempt_prompt = _retry_prompt(prompt, e)
+            continue
+        if last_good_key is not None:
+            last_known_good.put(feature, last_good_key, data)
+        return data
+    return _fallback(feature, fallback, last_good_key)
+
+
+def _fallback(feature: str, fallback, last_good_key: tuple = None) -> dict:
+    if last_good_key is not None:
+        data = last_known_good.get(feature, last_good_key)
+        if data is not None:
+            llm_stats.incr(feature, "stale_served")
+            LLM_FALLBACKS.labels(feature, "stale").inc()
+            return data
+    llm_stats.incr(feature, "fallbacks")
+    LLM_FALLBACKS.labels(feature, "mock").inc()
+    return fallback()
+
+
+def stream_json(model, feature: str, prompt: str, response_model, fallback, last_good_key: tuple = None):
+    """Stream the raw text of a JSON reply, chunk by chunk, for one feature.
+
+    Goes through the same circuit breaker, fallbacks and metrics as
+    invoke_json. If the circuit is open or the call fails before its first
+    chunk, the fallback (last good reply, else fallback()) is streamed as a
+    single chunk; a failure after chunks were sent is raised, since they
+    cannot be taken back. The finished reply is validated and stored under
+    last_good_key. There is no retry: the text has already gone out.
+    """
+    llm_stats.incr(feature, "calls")
+    breaker = llm_stats.breaker(feature)
+    prepaid = take_prepaid()
+    if not breaker.allow():
+        llm_stats.incr(feature, "short_circuited")
+        LLM_FALLBACKS.labels(feature, "short_circuit").inc()
+        yield json.dumps(_fallback(feature, fallback, last_good_key), ensure_ascii=False)
+        return
+    started = time.perf_counter()
+    outcome = "error"
+    chunks = []
+    last = None
+    try:
+        try:
+            for chunk in model.generate_content(prompt, stream=True):
+                last = chunk
+                chunks.append(chunk.text)
+                yield chunk.text
+        except GeneratorExit:
+            # the reader went away; not the model's fault
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            llm_stats.incr(feature, "errors")
+            breaker.record_failure()
+            if _is_rate_limited(e):
+                genai_scheduler.report_throttled()
+            if chunks:
+                raise
+            print(f"GenAI Error ({feature}): {e} - Returning Fallback Data")
+            yield json.dumps(_fallback(feature, fallback, last_good_key), ensure_ascii=False)
+            return
+        outcome = "ok"
+    finally:
+        LLM_LATENCY.labels(feature, outcome).observe(time.perf_counter() - started)
+    breaker.record_success()
+    llm_stats.incr(feature, "replies")
+    used = response_tokens(last)
+    if used is not None:
+        genai_scheduler.settle(used, prepaid)
+    try:
+        data = extract_json("".join(chunks))
+        response_model.model_validate(data)
+    except (ValueError, ValidationError):
+        llm_stats.incr(feature, "parse_failures")
+        return
+    if last_good_key is not None:
+        last_known_good.put(feature, last_good_key, data)
@@ -0,0 +1,268 @@
+import abc
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# which LLM backs the generation helpers: "gemini" or "local" (offline templates)
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.5-flash')
+# fixed delay of every local reply, to mimic a remote model in soak tests
+LOCAL_LLM_LATENCY = float(os.getenv('LOCAL_LLM_LATENCY', '0'))
+
+
+class LLMResponse:
+    def __init__(self, text: str, usage: dict = None):
+        self.text = text
+        self.usage = usage or {}
+
+
+class LLMProvider(abc.ABC):
+    """What the generation helpers need from a model.
+
+    generate_content(prompt, stream=False, **options) keeps the
+    google.generativeai call shape the helpers were written against: it
+    returns an object with .text, or with stream=True an iterator of such
+    chunks. usage() returns the running token totals.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {"requests": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    @abc.abstractmethod
+    def generate_content(self, prompt: str, stream: bool = False, **options):
+        ...
+
+    def _record_usage(self, prompt_tokens: int, output_tokens: int):
+        with self._lock:
+            self._usage["requests"] += 1
+            self._usage["prompt_tokens"] += prompt_tokens
+            self._usage["output_tokens"] += output_tokens
+
+    def usage(self) -> dict:
+        with self._lock:
+            return {"provider": self.name, **self._usage}
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, model_name: str):
+        super().__init__()
+        self.model_name = model_name
+        self._model = None
+        self._pid = None
+
+    @property
+    def model(self):
+        # built on first use in each process: a client inherited across a fork is not reused
+        with self._lock:
+            if self._model is None or self._pid != os.getpid():
+                import google.generativeai as genai
+
+                genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+                self._model = genai.GenerativeModel(self.model_name)
+                self._pid = os.getpid()
+            return self._model
+
+    def _record(self, response):
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is not None:
+            self._record_usage(
+                getattr(metadata, "prompt_token_count", 0) or 0,
+                getattr(metadata, "candidates_token_count", 0) or 0,
+            )
+
+    def generate_content(self, prompt: str, stream: bool = False, **options):
+        if stream:
+            return self._stream(prompt, **options)
+        response = self.model.generate_content(prompt, **options)
+        self._record(response)
+        return response
+
+    def _stream(self, prompt: str, **options):
+        last = None
+        for chunk in self.model.generate_content(prompt, stream=True, **options):
+            last = chunk
+            yield chunk
+        # the final chunk carries the totals for the whole stream
+        if last is not None:
+            self._record(last)
+
+
+class LocalProvider(LLMProvider):
+    """Deterministic offline replies built from templates.
+
+    The helper is recognised from its prompt and answered with JSON of the
+    shape that helper asks for, so the whole app runs without network access.
+    The same prompt always gets the same reply.
+    """
+
+    name = "local"
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def generate_content(self, prompt: str, stream: bool = False, **options):
+        text = json.dumps(local_reply(prompt), ensure_ascii=False)
+        usage = {"prompt_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+        self._record_usage(usage["prompt_tokens"], usage["output_tokens"])
+        if stream:
+            return self._stream(text)
+        time.sleep(self.latency)
+        return LLMResponse(text, usage)
+
+    def _stream(self, text: str):
+        size = max(1, len(text) // 8)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency / 8)
+            yield LLMResponse(text[start:start + size])
+
+
+def _seed(prompt: str) -> int:
+    return int(hashlib.sha1(prompt.encode()).hexdigest()[:8], 16)
+
+
+def _language(prompt: str) -> str:
+    from utils.all_helper import SUPPORTED_LANGUAGES
+
+    for language in SUPPORTED_LANGUAGES:
+        if re.search(rf"\b{language}\b", prompt, re.IGNORECASE):
+            return language.title()
+    return "the language"
+
+
+def prompt_feature(prompt: str) -> str:
+    # order matters: the story prompts share most of their wording
+    for marker, feature in (
+        ("Generate the opening of a 5-part story", "story_opening"),
+        ("Generate a 5-part story", "story"),
+        ("Write parts", "story_continuation"),
+        ("flashcards", "dailies"),
+        ("memory matching game", "memorypairs"),
+        ("Compare the following original text", "narration_feedback"),
+        ("Analyze overall language learning performance", "final_feedback"),
+        ("tongue twisters", "tongue_twisters"),
+        ("speech transcript", "speech_analysis"),
+    ):
+        if marker in prompt:
+            return feature
+    return "language_teacher"
+
+
+def _story_part(language: str, number: int, seed: int) -> dict:
+    places = ["market", "beach", "forest", "station", "library"]
+    place = places[(seed + number) % len(places)]
+    return {
+        "part_number": number,
+        "content": f"[{language}] Part {number}: the traveller reaches the {place}.",
+        "translation": f"Part {number}: the traveller reaches the {place}.",
+        "description": f"A traveller arriving at a {place}",
+    }
+
+
+def _overlap_score(prompt: str) -> int:
+    original = re.search(r"Original: (.*)", prompt)
+    narration = re.search(r"User's narration: (.*)", prompt)
+    if not original or not narration:
+        return 75
+    expected = set(original.group(1).casefold().split())
+    spoken = set(narration.group(1).casefold().split())
+    return round(100 * len(expected & spoken) / len(expected)) if expected else 0
+
+
+def local_reply(prompt: str) -> dict:
+    """The templated reply to a helper prompt, as a dict."""
+    feature = prompt_feature(prompt)
+    language = _language(prompt)
+    seed = _seed(prompt)
+    if feature == "dailies":
+        return {"cards": [
+            {
+                "new_concept": f"{language} word {seed % 97 + i}",
+                "concept_pronunciation": f"word {i}",
+                "english": f"word {i}",
+                "meaning": f"Offline flashcard {i} for {language}.",
+                "example": f"{language} example sentence {i}.",
+                "example_pronunciation": f"example sentence {i}",
+                "translation": f"Example sentence {i}.",
+            }
+            for i in range(10)
+        ]}
+    if feature == "memorypairs":
+        return {"pairs": [[f"{language} word {seed % 97 + i}", f"word {i}", f"word {i}"] for i in range(10)]}
+    if feature == "story":
+        return {
+            "title": f"{language} journey",
+            "title_english": "The journey",
+            "parts": [_story_part(language, number, seed) for number in range(1, 6)],
+        }
+    if feature == "story_opening":
+        return {"title": f"{language} journey", "title_english": "The journey", "part": _story_part(language, 1, seed)}
+    if feature == "story_continuation":
+        first = int(re.search(r"Write parts (\d+)", prompt).group(1))
+        return {"parts": [_story_part(language, number, seed) for number in range(first, 6)]}
+    if feature == "narration_feedback":
+        score = _overlap_score(prompt)
+        return {
+            "accuracy_score": str(score),
+            "pronunciation_feedback": "Pronunciation was not assessed offline.",
+            "grammar_feedback": "Grammar was not assessed offline.",
+            "vocabulary_feedback": f"{score}% of the original words were used.",
+            "improvement_areas": ["Follow the original wording more closely"] if score < 80 else ["Keep a steady pace"],
+            "positive_points": ["Completed the narration"],
+        }
+    if feature == "final_feedback":
+        return {
+            "overall_score": "75",
+            "key_strengths": ["Completed every part"],
+            "main_improvement_areas": ["Follow the original wording more closely"],
+            "learning_recommendations": ["Narrate one short story every day"],
+        }
+    if feature == "tongue_twisters":
+        return {"tongue_twisters": [
+            {"text": f"{language} twister {i}", "pronunciation": f"twister {i}", "translation": f"Tongue twister {i}"}
+            for i in range(1, 6)
+        ]}
+    if feature == "speech_analysis":
+        transcript = re.search(r'speech transcript: "(.*)"', prompt)
+        text = transcript.group(1) if transcript else ""
+        return {"original": text, "correct_form": text, "alternatives": [text, text], "score": "8"}
+    return {
+        "response": f"Offline answer about {language}.",
+        "examples": f"Two {language} examples would appear here.",
+        "interesting_facts": f"Two facts about {language} would appear here.",
+    }
+
+
+_provider = None
+_provider_lock = threading.Lock()
+# LLM_PROVIDER value -> factory; register_provider adds others (the load tests register their fake Gemini)
+_factories = {
+    "gemini": lambda: GeminiProvider(GEMINI_MODEL),
+    "local": lambda: LocalProvider(LOCAL_LLM_LATENCY),
+}
+
+
+def register_provider(name: str, factory):
+    """Make factory() the provider for LLM_PROVIDER=name. Must run before the first get_provider()."""
+    with _provider_lock:
+        _factories[name] = factory
+
+
+def get_provider() -> LLMProvider:
+    """The provider chosen by LLM_PROVIDER, created once and shared by every helper."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            factory = _factories.get(LLM_PROVIDER)
+            if factory is None:
+                raise ValueError(f"Unknown LLM_PROVIDER {LLM_PROVIDER!r}, expected one of {', '.join(sorted(_factories))}")
+            _provider = factory()
+        return _provider
@@ -0,0 +1,157 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# consecutive failed Gemini calls that open a feature's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+# hedge a call still running after the feature's p95 latency; at most this share of calls
+LLM_HEDGE = os.getenv('LLM_HEDGE', '1') == '1'
+LLM_HEDGE_MAX_RATIO = float(os.getenv('LLM_HEDGE_MAX_RATIO', '0.1'))
+# hedges running at once across all features
+LLM_HEDGE_MAX_OUTSTANDING = int(os.getenv('LLM_HEDGE_MAX_OUTSTANDING', '4'))
+# a hedge is only sent while this share of the Gemini quota buckets is left afterwards
+LLM_HEDGE_MIN_HEADROOM = float(os.getenv('LLM_HEDGE_MIN_HEADROOM', '0.5'))
+LLM_HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+# most recent good reply per (feature, language, level), served instead of mock data
+LLM_LAST_GOOD_PATH = os.getenv('LLM_LAST_GOOD_PATH', 'llm_last_good.json')
+# the store is written at most this often (and on shutdown)
+LLM_LAST_GOOD_SAVE_INTERVAL = float(os.getenv('LLM_LAST_GOOD_SAVE_INTERVAL', '30'))
+
+
+class CircuitBreaker:
+    """Closed -> open after LLM_BREAKER_FAILURES failures in a row -> half-open after the cooldown.
+
+    While open every call fails fast; half-open lets a single probe through
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failures: int, cooldown: float):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or (self._opened_at is None and self._consecutive >= self.failures):
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return "half_open"
+            return "open"
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one feature, for the hedging delay."""
+
+    def __init__(self, window: int):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class LastKnownGood:
+    """Last successfully generated reply per key, kept in a small JSON file across restarts.
+
+    Writes are debounced: a put saves the file only if save_interval has
+    passed since the last write, and save() flushes the rest on shutdown.
+    """
+
+    def __init__(self, path: str, save_interval: float):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+        self._saved_at = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Could not read last-known-good store: {e}")
+
+    def _save(self):
+        if not self.path or not self._dirty:
+            return
+        # workers share the file, so each writes its own tmp before the atomic replace
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False, default=str)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as e:
+            print(f"Could not write last-known-good store: {e}")
+        self._saved_at = time.monotonic()
+
+    @staticmethod
+    def _key(feature: str, key: tuple) -> str:
+        return "|".join([feature, *(str(part).casefold() for part in key)])
+
+    def put(self, feature: str, key: tuple, value):
+        with self._lock:
+            self._load()
+            self._entries[self._key(feature, key)] = value
+            self._dirty = True
+            if self._saved_at is None or time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def get(self, feature: str, key: tuple):
+        with self._lock:
+            self._load()
+            value = self._entries.get(self._key(feature, key))
+        return copy.deepcopy(value)
+
+
+last_known_good = LastKnownGood(LLM_LAST_GOOD_PATH, LLM_LAST_GOOD_SAVE_INTERVAL)
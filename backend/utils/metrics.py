@@ -0,0 +1,60 @@
+import time
+
+from prometheus_client import Counter, Histogram
+
+# Prometheus instruments shared by the app; exported by GET /metrics
+
+HTTP_LATENCY = Histogram(
+    "langstar_http_request_duration_seconds",
+    "Time to serve a request, until the last byte of the response",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+LLM_LATENCY = Histogram(
+    "langstar_llm_call_duration_seconds",
+    "Duration of one Gemini call",
+    ["feature", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+LLM_FALLBACKS = Counter(
+    "langstar_llm_fallbacks_total",
+    "Responses not generated by Gemini for the request, by kind (stale, mock, short_circuit)",
+    ["feature", "kind"],
+)
+MONGO_LATENCY = Histogram(
+    "langstar_mongo_operation_duration_seconds",
+    "Duration of one MongoDB operation, including the wait for a pool thread",
+    ["collection", "operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording HTTP_LATENCY per route template.
+
+    Unmatched paths share one label so scanners cannot blow up the series count.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
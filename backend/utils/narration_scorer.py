@@ -0,0 +1,271 @@
+import asyncio
+import unicodedata
+
+import numpy as np
+
+# Scores a narration against the original story part without the LLM: the
+# two texts are aligned word by word (Levenshtein over tokens), and two
+# aligned words that differ are compared letter by letter, so a small slip
+# ("tenia" for "tenía") earns partial credit instead of counting as wrong.
+
+# languages written without spaces are aligned character by character
+CHARACTER_LANGUAGES = {"JAPANESE"}
+# aligned words at least this similar count as "close" rather than substituted
+CLOSE_SIMILARITY = 0.7
+TOP_WORDS = 5
+
+
+def tokenize(text: str, language: str = "") -> list:
+    """NFKC, case-folded tokens with punctuation and symbols removed."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    # filtering by category keeps combining vowel signs (Gujarati, Telugu) inside their word
+    kept = "".join(char for char in text if unicodedata.category(char)[0] not in "PS")
+    if language.upper() in CHARACTER_LANGUAGES:
+        return [char for char in kept if not char.isspace()]
+    return kept.split()
+
+
+def char_distances(pairs: list) -> np.ndarray:
+    """Levenshtein distance of every (a, b) string pair, computed for all pairs at once.
+
+    Rows of the DP table are built with array operations across pairs; with
+    unit insertion cost a row is j + running-minimum(candidates - j).
+    """
+    count = len(pairs)
+    if not count:
+        return np.zeros(0, dtype=np.int64)
+    # each distinct string is encoded once into a padded row of code points
+    strings = {}
+    for a, b in pairs:
+        strings.setdefault(a, len(strings))
+        strings.setdefault(b, len(strings))
+    lengths = np.array([len(string) for string in strings], dtype=np.int64)
+    codes = np.full((len(strings), max(int(lengths.max()), 1)), -1, dtype=np.int64)
+    for row, string in enumerate(strings):
+        codes[row, :len(string)] = np.frombuffer(string.encode("utf-32-le"), dtype=np.uint32)
+    index_a = np.array([strings[a] for a, _ in pairs])
+    index_b = np.array([strings[b] for _, b in pairs])
+    len_a = lengths[index_a]
+    len_b = lengths[index_b]
+    width_a = max(int(len_a.max()), 1)
+    width_b = max(int(len_b.max()), 1)
+    # different pads for a and b, so padding never matches; cells past a string's length are never read
+    codes_a = codes[index_a, :width_a]
+    codes_b = codes[index_b, :width_b]
+    codes_b = np.where(codes_b == -1, -2, codes_b)
+
+    columns = np.arange(width_b + 1, dtype=np.int64)
+    previous = np.tile(columns, (count, 1))
+    distances = len_b.copy()
+    rows = np.arange(count)
+    for i in range(width_a):
+        candidates = np.empty_like(previous)
+        candidates[:, 0] = i + 1
+        np.minimum(
+            previous[:, :-1] + (codes_a[:, i:i + 1] != codes_b),
+            previous[:, 1:] + 1,
+            out=candidates[:, 1:],
+        )
+        current = np.minimum.accumulate(candidates - columns, axis=1) + columns
+        finished = len_a == i + 1
+        distances[finished] = current[rows[finished], len_b[finished]]
+        previous = current
+    return distances
+
+
+def _align(expected: list, heard: list, cost: np.ndarray) -> list:
+    """Token alignment as (expected index or None, heard index or None) steps, in order."""
+    rows, columns = len(expected), len(heard)
+    table = np.zeros((rows + 1, columns + 1))
+    table[0] = np.arange(columns + 1)
+    offsets = np.arange(columns + 1)
+    for i in range(1, rows + 1):
+        candidates = np.empty(columns + 1)
+        candidates[0] = i
+        candidates[1:] = np.minimum(table[i - 1, 1:] + 1, table[i - 1, :-1] + cost[i - 1])
+        table[i] = np.minimum.accumulate(candidates - offsets) + offsets
+
+    table = table.tolist()
+    cost = cost.tolist()
+    steps = []
+    i, j = rows, columns
+    while i or j:
+        if i and j and abs(table[i][j] - table[i - 1][j - 1] - cost[i - 1][j - 1]) < 1e-9:
+            steps.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i and abs(table[i][j] - table[i - 1][j] - 1) < 1e-9:
+            steps.append((i - 1, None))
+            i -= 1
+        else:
+            steps.append((None, j - 1))
+            j -= 1
+    return steps[::-1]
+
+
+def _result(expected: list, heard: list, similarity: np.ndarray) -> dict:
+    cost = 1 - similarity
+    words = []
+    extra = []
+    credit = 0.0
+    for expected_index, heard_index in _align(expected, heard, cost):
+        if expected_index is None:
+            extra.append(heard[heard_index])
+            continue
+        word = {"expected": expected[expected_index], "heard": None, "status": "missed"}
+        if heard_index is not None:
+            score = float(similarity[expected_index, heard_index])
+            word["heard"] = heard[heard_index]
+            if score == 1:
+                word["status"] = "hit"
+            elif score >= CLOSE_SIMILARITY:
+                word["status"] = "close"
+            else:
+                word["status"] = "substituted"
+            credit += score if score >= CLOSE_SIMILARITY else 0.0
+        words.append(word)
+
+    if expected:
+        # words added to the narration dilute the score as much as missing ones
+        accuracy = 100 * credit / (len(expected) + len(extra))
+    else:
+        accuracy = 0.0 if heard else 100.0
+    counts = {status: sum(word["status"] == status for word in words) for status in ("hit", "close", "substituted", "missed")}
+    return {
+        "accuracy": round(accuracy, 1),
+        "hits": counts["hit"],
+        "close": counts["close"],
+        "substitutions": counts["substituted"],
+        "misses": counts["missed"],
+        "extras": len(extra),
+        "words": words,
+        "extra_words": extra,
+    }
+
+
+def score_batch(submissions: list, language: str = "") -> list:
+    """Alignments of several (original, narration) pairs; the letter-level distances of all of them are computed in one pass."""
+    tokenized = [(tokenize(original, language), tokenize(narration, language)) for original, narration in submissions]
+    vocabulary = {}
+    for expected, heard in tokenized:
+        for token in expected + heard:
+            vocabulary.setdefault(token, len(vocabulary))
+    ids = [
+        (np.array([vocabulary[token] for token in expected], dtype=np.int64),
+         np.array([vocabulary[token] for token in heard], dtype=np.int64))
+        for expected, heard in tokenized
+    ]
+    # only the word pairs some submission actually needs, each computed once
+    needed = sorted({(a, b) for expected, heard in tokenized for a in set(expected) for b in set(heard) if a != b})
+    words = list(vocabulary)
+    distances = np.zeros((len(words), len(words)))
+    if needed:
+        first = [vocabulary[a] for a, _ in needed]
+        second = [vocabulary[b] for _, b in needed]
+        distances[first, second] = char_distances(needed)
+    lengths = np.array([max(len(word), 1) for word in words])
+
+    results = []
+    for (expected, heard), (expected_ids, heard_ids) in zip(tokenized, ids):
+        longer = np.maximum(lengths[expected_ids][:, None], lengths[heard_ids][None, :])
+        similarity = 1 - distances[expected_ids[:, None], heard_ids[None, :]] / longer
+        results.append(_result(expected, heard, similarity))
+    return results
+
+
+def score_narration(original: str, narration: str, language: str = "") -> dict:
+    return score_batch([(original, narration)], language)[0]
+
+
+def _listed(words: list) -> str:
+    return ", ".join(words[:TOP_WORDS])
+
+
+def local_feedback(alignment: dict) -> dict:
+    """Feedback in the NarrationEvaluation shape, built from an alignment alone."""
+    words = alignment["words"]
+    missed = [word["expected"] for word in words if word["status"] == "missed"]
+    slips = [f'{word["expected"]} (heard "{word["heard"]}")' for word in words if word["status"] == "close"]
+    swapped = [f'{word["expected"]} (heard "{word["heard"]}")' for word in words if word["status"] == "substituted"]
+    total = len(words)
+
+    improvement_areas = []
+    if missed:
+        improvement_areas.append("Say every word of the original")
+    if slips or swapped:
+        improvement_areas.append("Pronounce words closer to the original")
+    if alignment["extras"]:
+        improvement_areas.append("Stick to the original wording")
+    positive_points = []
+    if alignment["accuracy"] >= 80:
+        positive_points.append("Followed the original closely")
+    if total and alignment["hits"] >= total / 2:
+        positive_points.append("Most words were said exactly")
+    if not missed and total:
+        positive_points.append("Completed every sentence")
+
+    return {
+        "accuracy_score": str(round(alignment["accuracy"])),
+        "pronunciation_feedback": f"Almost right: {_listed(slips)}." if slips else "Every recognised word matched the original.",
+        "grammar_feedback": "Grammar is only assessed by the detailed feedback.",
+        "vocabulary_feedback": (
+            f"{alignment['hits']} of {total} words matched exactly."
+            + (f" Missed: {_listed(missed)}." if missed else "")
+            + (f" Replaced: {_listed(swapped)}." if swapped else "")
+        ),
+        "improvement_areas": improvement_areas or ["Keep a steady pace"],
+        "positive_points": positive_points or ["Completed the narration"],
+        "alignment": alignment,
+    }
+
+
+class NarrationScorer:
+    """Scores concurrent submissions together.
+
+    Submissions made in the same event loop iteration are collected and
+    scored in one score_batch call per language at the end of it, so a burst
+    of /storynarrate requests shares a single vectorised pass.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self.batches = 0
+        self.submissions = 0
+        self.largest_batch = 0
+
+    async def score(self, original: str, narration: str, language: str) -> dict:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._pending:
+            loop.call_soon(self._flush)
+        self._pending.append((original, narration, language.upper(), future))
+        return await future
+
+    def _flush(self):
+        pending, self._pending = self._pending, []
+        by_language = {}
+        for original, narration, language, future in pending:
+            by_language.setdefault(language, []).append((original, narration, future))
+        for language, items in by_language.items():
+            try:
+                results = score_batch([(original, narration) for original, narration, _ in items], language)
+            except Exception as e:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), result in zip(items, results):
+                if not future.done():
+                    future.set_result(result)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(items))
+        self.submissions += len(pending)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "submissions": self.submissions,
+            "largest_batch": self.largest_batch,
+        }
+
+
+narration_scorer = NarrationScorer()
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException, status
+
+# This module is imported by the password worker processes, so it must stay
+# free of app imports (database, Gemini, ...).
+
+PASSWORD_POOL_WORKERS = int(os.getenv('PASSWORD_POOL_WORKERS') or os.cpu_count() or 1)
+# hashes waiting or running before new logins get a 429
+PASSWORD_MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING') or PASSWORD_POOL_WORKERS * 4)
+
+
+# 2025-UPDATE: Using direct bcrypt instead of passlib to avoid version conflicts
+def get_password_hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except Exception:
+        return False
+
+
+def sha256_password(password: str) -> str:
+    # Pre-hash with SHA256 to support passwords longer than bcrypt's 72 bytes
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+
+def hash_new_password(password: str) -> str:
+    return get_password_hash(sha256_password(password))
+
+
+def check_login_password(password: str, hashed_password: str) -> tuple:
+    """Verify a login password; returns (valid, new_hash).
+
+    new_hash is set when the stored hash used the legacy raw-password scheme
+    and should be migrated to the SHA256 pre-hash. Both bcrypt rounds of the
+    legacy path run here, in one worker call.
+    """
+    input_hash = sha256_password(password)
+    if verify_password(input_hash, hashed_password):
+        return True, None
+    if len(password.encode('utf-8')) <= 72 and verify_password(password, hashed_password):
+        return True, get_password_hash(input_hash)
+    return False, None
+
+
+def _mp_context():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        # workers fork from a clean server process that has only imported this module,
+        # not from the threaded app process
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class PasswordPool:
+    """Runs bcrypt on a process pool behind a bounded admission queue."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # created on first use, i.e. inside the serving worker process
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_mp_context())
+        return self._pool
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            self.completed += 1
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many sign-in attempts in progress, please retry",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+            executor = self._executor()
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+
+password_pool = PasswordPool(PASSWORD_POOL_WORKERS, PASSWORD_MAX_PENDING)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_pool.run(hash_new_password, password)
+
+
+async def check_login_password_async(password: str, hashed_password: str) -> tuple:
+    return await password_pool.run(check_login_password, password, hashed_password)
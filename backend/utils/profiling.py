@@ -0,0 +1,154 @@
+import hmac
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+# requests carrying this token in the PROFILE_HEADER header are profiled, and the same header
+# unlocks the /admin/profiles endpoints; unset disables both. Header only: URLs end up in access logs
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_HEADER = "X-Profile-Token"
+# additionally profile 1 in N requests; 0 turns sampling off
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', '0'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+# without a token or sampling the middleware is not installed at all
+PROFILING_ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_EVERY > 0
+
+
+def token_matches(token: str) -> bool:
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples the stacks of every thread in the process into collapsed-stack counts.
+
+    Statistical, so it sees work on the event loop and on the Mongo/GenAI
+    pools alike; anything else running concurrently is included too, under
+    its own thread name.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class ProfileStore:
+    """The last PROFILE_KEEP profiles, newest first."""
+
+    def __init__(self, keep: int):
+        self._profiles = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reserve_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def add(self, profile_id: int, method: str, path: str, status: int, duration: float, sampler: StackSampler):
+        with self._lock:
+            self._profiles.appendleft({
+                "id": profile_id,
+                "method": method,
+                "path": path,
+                "status": status,
+                "duration_ms": round(duration * 1000, 1),
+                "samples": sampler.samples,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "collapsed": sampler.collapsed(),
+            })
+
+    def list(self) -> list:
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != "collapsed"} for profile in self._profiles]
+
+    def get(self, profile_id: int):
+        with self._lock:
+            return next((profile for profile in self._profiles if profile["id"] == profile_id), None)
+
+
+profile_store = ProfileStore(PROFILE_KEEP)
+
+
+class ProfilingMiddleware:
+    """Runs a request under the StackSampler when asked for, or for 1 in PROFILE_SAMPLE_EVERY requests.
+
+    One profile at a time: requests that would overlap a running profile are
+    served unprofiled. The profile id is returned in an X-Profile-Id header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._requests = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def _wanted(self, scope) -> bool:
+        if PROFILE_TOKEN:
+            headers = dict(scope.get("headers") or [])
+            if token_matches(headers.get(PROFILE_HEADER.lower().encode(), b"").decode("latin-1")):
+                return True
+        return PROFILE_SAMPLE_EVERY > 0 and next(self._requests) % PROFILE_SAMPLE_EVERY == 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+        sampler = StackSampler(PROFILE_INTERVAL)
+        profile_id = profile_store.reserve_id()
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", str(profile_id).encode())]}
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            self._busy.release()
+            profile_store.add(profile_id, scope["method"], scope["path"], status, time.perf_counter() - started, sampler)
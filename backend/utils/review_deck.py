@@ -0,0 +1,120 @@
+import os
+from datetime import datetime, timedelta
+
+from database import review_cards_repo
+from utils.content_pool import dailies_pool, is_generated
+
+REVIEW_DECK_SIZE = int(os.getenv('REVIEW_DECK_SIZE', '10'))
+# cap on never-seen cards per deck, so a backlog of due cards is worked off first
+REVIEW_MAX_NEW = int(os.getenv('REVIEW_MAX_NEW', '5'))
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+
+def new_card_state(now: datetime) -> dict:
+    return {"repetitions": 0, "interval_days": 0, "ease": INITIAL_EASE, "due_at": now, "reviewed_at": None}
+
+
+def sm2(state: dict, quality: int, now: datetime) -> dict:
+    """The SM-2 state after one review of the given quality (0-5)."""
+    ease = state.get("ease", INITIAL_EASE)
+    if quality < 3:
+        repetitions = 0
+        interval = 1
+    else:
+        repetitions = state.get("repetitions", 0) + 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(state.get("interval_days", 1) * ease)
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {
+        "repetitions": repetitions,
+        "interval_days": interval,
+        "ease": round(ease, 3),
+        "due_at": now + timedelta(days=interval),
+        "reviewed_at": now,
+    }
+
+
+def _pair_card(result) -> dict:
+    # a memory game pair carries the word, its pronunciation and the English only
+    return {
+        "new_concept": result.concept,
+        "concept_pronunciation": result.pronunciation or "",
+        "english": result.english,
+        "meaning": result.english,
+        "example": "",
+        "example_pronunciation": "",
+        "translation": "",
+    }
+
+
+class ReviewDeck:
+    """Daily flashcard decks built from each user's stored cards.
+
+    Due cards come first, oldest due date first, from one indexed range
+    query; only the remainder is topped up with new cards taken from a
+    generated dailies deck (via the content pool), which are stored as they
+    are served. Review results from the daily cards and the memory game move
+    each card along the SM-2 schedule.
+    """
+
+    def __init__(self, size: int, max_new: int):
+        self.size = size
+        self.max_new = max_new
+        self.decks = 0
+        self.due_served = 0
+        self.new_served = 0
+        self.topups = 0
+        self.reviews = 0
+
+    async def build(self, user_id, language: str, level: str) -> dict:
+        now = datetime.utcnow()
+        due = await review_cards_repo.due(user_id, language, now, self.size)
+        cards = [doc["card"] for doc in due]
+        wanted = min(self.size - len(cards), self.max_new)
+        new_cards = []
+        if wanted > 0:
+            self.topups += 1
+            generated = await dailies_pool.get(language, level)
+            if is_generated(generated):
+                candidates = {card["new_concept"]: card for card in generated.get("cards", [])}
+                known = {doc["concept"] for doc in await review_cards_repo.get_many(user_id, language, list(candidates))}
+                new_cards = [card for concept, card in candidates.items() if concept not in known][:wanted]
+                await review_cards_repo.add(user_id, language, new_cards, new_card_state(now))
+        self.decks += 1
+        self.due_served += len(cards)
+        self.new_served += len(new_cards)
+        return {"cards": cards + new_cards, "due": len(cards), "new": len(new_cards)}
+
+    async def record(self, user_id, language: str, results: list) -> int:
+        """Apply review results; unknown memory game words are stored first. Returns the cards updated."""
+        now = datetime.utcnow()
+        # the last result for a concept wins if a client sends duplicates
+        by_concept = {result.concept: result for result in results}
+        docs = await review_cards_repo.get_many(user_id, language, list(by_concept))
+        known = {doc["concept"] for doc in docs}
+        missing = [_pair_card(result) for concept, result in by_concept.items() if concept not in known and result.english]
+        if missing:
+            await review_cards_repo.add(user_id, language, missing, new_card_state(now))
+            docs = await review_cards_repo.get_many(user_id, language, list(by_concept))
+        states = {doc["_id"]: sm2(doc, by_concept[doc["concept"]].quality, now) for doc in docs}
+        await review_cards_repo.save_states(states)
+        self.reviews += len(states)
+        return len(states)
+
+    def stats(self) -> dict:
+        return {
+            "decks": self.decks,
+            "due_served": self.due_served,
+            "new_served": self.new_served,
+            "topups": self.topups,
+            "reviews": self.reviews,
+        }
+
+
+review_deck = ReviewDeck(REVIEW_DECK_SIZE, REVIEW_MAX_NEW)
@@ -0,0 +1,156 @@
+import argparse
+import sys
+from datetime import datetime
+
+if __name__ == "__main__":
+    # run on its own, not under main.py: load .env before the settings below are imported
+    import dotenv
+    dotenv.load_dotenv()
+
+from pymongo import ASCENDING, TEXT
+
+from database import resources, AUTH_DB, STORY_DB, LEXICON_DB, lexicon_collection_name
+from utils.all_helper import SUPPORTED_LANGUAGES
+from utils.leaderboard import score_field, leaderboard_index
+
+# Versioned index/schema migrations. Each one runs once per database and is
+# recorded in auth_db.schema_migrations; add new steps at the end with the
+# next version number, never edit an applied one.
+
+# looked up per call so nothing connects before the lifespan opens the client
+def migrations_collection():
+    return resources.collection(AUTH_DB, "schema_migrations")
+
+
+def users_collection():
+    return resources.collection(AUTH_DB, "users")
+
+
+def active_stories_collection():
+    return resources.collection(STORY_DB, "active_stories")
+
+
+def review_cards_collection():
+    return resources.collection(AUTH_DB, "review_cards")
+
+
+def lexicon_collection(language: str):
+    return resources.collection(LEXICON_DB, lexicon_collection_name(language))
+
+
+def _unique_usernames():
+    # fails if duplicate usernames already exist; those have to be merged by hand first
+    users_collection().create_index([("username", ASCENDING)], unique=True, name="username_unique")
+
+
+def _active_story_lookup():
+    active_stories_collection().create_index([("user_id", ASCENDING), ("status", ASCENDING)], name="user_id_status")
+
+
+def _leaderboard_indexes():
+    for language in SUPPORTED_LANGUAGES:
+        users_collection().create_index(leaderboard_index(language), name=f"leaderboard_{language}")
+
+
+def _review_card_indexes():
+    review_cards_collection().create_index(
+        [("user_id", ASCENDING), ("language", ASCENDING), ("due_at", ASCENDING)], name="user_language_due"
+    )
+    review_cards_collection().create_index(
+        [("user_id", ASCENDING), ("language", ASCENDING), ("concept", ASCENDING)], unique=True, name="user_language_concept"
+    )
+
+
+def _lexicon_indexes():
+    for language in SUPPORTED_LANGUAGES:
+        collection = lexicon_collection(language)
+        collection.create_index([("key", ASCENDING)], unique=True, name="key_unique")
+        collection.create_index([("kind", ASCENDING), ("level", ASCENDING)], name="kind_level")
+        collection.create_index(
+            [("concept", TEXT), ("translation", TEXT), ("meaning", TEXT)],
+            name="text", default_language="none"
+        )
+
+
+MIGRATIONS = [
+    (1, "unique username index", _unique_usernames),
+    (2, "active_stories user_id index", _active_story_lookup),
+    (3, "per-language leaderboard indexes", _leaderboard_indexes),
+    (4, "review card due and concept indexes", _review_card_indexes),
+    (5, "per-language lexicon indexes", _lexicon_indexes),
+]
+
+
+def applied_versions() -> set:
+    return {doc["_id"] for doc in migrations_collection().find({}, {"_id": 1})}
+
+
+def apply_migrations() -> list:
+    """Apply every migration not yet recorded, in order. Returns the versions applied."""
+    done = applied_versions()
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        migrate()
+        migrations_collection().replace_one(
+            {"_id": version},
+            {"_id": version, "name": name, "applied_at": datetime.utcnow()},
+            upsert=True
+        )
+        applied.append(version)
+        print(f"Applied schema migration {version}: {name}")
+    return applied
+
+
+def _hot_queries() -> list:
+    language = SUPPORTED_LANGUAGES[0]
+    field = score_field(language)
+    return [
+        ("users by username", users_collection().find({"username": "explain-probe"})),
+        ("active story by user", active_stories_collection().find({"user_id": "explain-probe", "status": {"$ne": "pending"}})),
+        ("leaderboard page", users_collection().find({field: {"$exists": True}}).sort(leaderboard_index(language)).limit(50)),
+        ("leaderboard rank", users_collection().find({field: {"$gt": 0}}).sort(leaderboard_index(language))),
+        ("due review cards", review_cards_collection().find(
+            {"user_id": "explain-probe", "language": language, "due_at": {"$lte": datetime.utcnow()}}
+        ).sort([("due_at", ASCENDING)]).limit(10)),
+    ]
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def check_query_plans() -> list:
+    """Explain the hot queries and return the names of those that fall back to COLLSCAN."""
+    failures = []
+    for name, cursor in _hot_queries():
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in set(_stages(winning_plan)):
+            failures.append(name)
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply index migrations and check query plans")
+    parser.add_argument("--check", action="store_true", help="fail if a hot query uses COLLSCAN")
+    args = parser.parse_args(argv)
+
+    apply_migrations()
+    if args.check:
+        failures = check_query_plans()
+        for name in failures:
+            print(f"COLLSCAN: {name}")
+        if failures:
+            return 1
+        print("All hot queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
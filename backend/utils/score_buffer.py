@@ -0,0 +1,223 @@
+import asyncio
+import glob
+import json
+import os
+from collections import defaultdict
+
+from database import users_repo
+
+# flush at least this often, or sooner once this many increments are buffered
+SCORE_FLUSH_INTERVAL = float(os.getenv('SCORE_FLUSH_INTERVAL', '2'))
+SCORE_FLUSH_MAX_EVENTS = int(os.getenv('SCORE_FLUSH_MAX_EVENTS', '500'))
+# append-only log of buffered increments, replayed on startup after a crash;
+# each worker writes <path>.<pid>, so workers on one host can share the setting
+SCORE_WAL_PATH = os.getenv('SCORE_WAL_PATH', 'score_wal.log')
+SCORE_WAL_FSYNC = os.getenv('SCORE_WAL_FSYNC', '0') == '1'
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # alive, but owned by another user
+        return True
+    return True
+
+
+class ScoreBuffer:
+    """Write-behind accumulator for score increments.
+
+    Increments are merged per (username, language), appended to a local log
+    and written with one bulk_write per flush. On flush the live log is
+    rotated into a segment that is deleted only once the bulk write succeeds,
+    so a crash loses nothing; an increment may be applied twice if the process
+    dies between the write and the delete (at-least-once).
+
+    Every file carries the pid of the process writing it. On start a worker
+    replays only the files of processes that are no longer running, and
+    claims each by renaming it into its own name first, so two workers
+    starting together never apply the same log.
+    """
+
+    def __init__(self, wal_path: str, flush_interval: float, max_events: int):
+        self.wal_path = wal_path
+        # called with each username whose increments were just written
+        self.on_flushed = None
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self._pending = defaultdict(int)
+        # the batch being written: still counted by pending_for until the write is acknowledged
+        self._inflight = {}
+        self._events = 0
+        self._segments = []
+        self._segment_seq = 0
+        self._wal = None
+        self._timer = None
+        self._flushing = None
+        self.flushes = 0
+        self.increments = 0
+        self.writes = 0
+
+    @property
+    def _live_path(self) -> str:
+        return f"{self.wal_path}.{os.getpid()}"
+
+    def _segment_path(self) -> str:
+        self._segment_seq += 1
+        return f"{self.wal_path}.{os.getpid()}.{self._segment_seq}.flushing"
+
+    def _open_wal(self):
+        if self._wal is None:
+            self._wal = open(self._live_path, "a", encoding="utf-8")
+
+    def _append_wal(self, username: str, language: str, amount: int):
+        self._open_wal()
+        self._wal.write(json.dumps({"u": username, "l": language, "d": amount}) + "\n")
+        self._wal.flush()
+        if SCORE_WAL_FSYNC:
+            os.fsync(self._wal.fileno())
+
+    def _rotate_wal(self):
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        if os.path.exists(self._live_path) and os.path.getsize(self._live_path):
+            segment = self._segment_path()
+            os.replace(self._live_path, segment)
+            self._segments.append(segment)
+
+    def _orphaned(self) -> list:
+        """Log files left by processes that are no longer running, oldest first."""
+        paths = []
+        # a log without a pid comes from before logs were per worker
+        if os.path.exists(self.wal_path):
+            paths.append(self.wal_path)
+        prefix = f"{self.wal_path}."
+        for path in sorted(glob.glob(f"{glob.escape(self.wal_path)}.*")):
+            owner = path[len(prefix):].split(".")[0]
+            if not owner.isdigit():
+                continue
+            # a file under our own pid was left by an earlier process that had the same pid
+            if int(owner) == os.getpid() or not _running(int(owner)):
+                paths.append(path)
+        return paths
+
+    def _replay(self):
+        # everything pending is also on disk, so rebuild the state from the files
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+        self._pending = defaultdict(int)
+        self._segments = []
+        for orphan in self._orphaned():
+            path = self._segment_path()
+            try:
+                # the rename is the claim: a worker that loses the race finds the file gone
+                os.rename(orphan, path)
+            except FileNotFoundError:
+                continue
+            self._segments.append(path)
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line from a crash mid-write
+                        continue
+                    self._pending[(entry["u"], entry["l"])] += entry["d"]
+
+    def add(self, username: str, language: str, amount: int):
+        if not amount:
+            return
+        self._append_wal(username, language, amount)
+        self._pending[(username, language)] += amount
+        self._events += 1
+        self.increments += 1
+        if self._events >= self.max_events:
+            self._schedule_flush()
+
+    def pending_for(self, username: str) -> dict:
+        pending = defaultdict(int)
+        for source in (self._inflight, self._pending):
+            for (user, language), delta in source.items():
+                if user == username:
+                    pending[language] += delta
+        return {language: delta for language, delta in pending.items() if delta}
+
+    def _running_flush(self):
+        flushing = self._flushing
+        if flushing is None or flushing.done() or flushing.get_loop() is not asyncio.get_running_loop():
+            return None
+        return flushing
+
+    def _schedule_flush(self):
+        if self._running_flush() is None:
+            self._flushing = asyncio.get_running_loop().create_task(self._write())
+
+    async def flush(self):
+        """Write everything buffered so far; one write runs at a time, whoever asks for it."""
+        while (running := self._running_flush()) is not None:
+            await asyncio.shield(running)
+        self._flushing = asyncio.get_running_loop().create_task(self._write())
+        await asyncio.shield(self._flushing)
+
+    async def _write(self):
+        if not self._pending:
+            return
+        self._rotate_wal()
+        batch, self._pending = self._pending, defaultdict(int)
+        self._inflight = batch
+        segments, self._segments = self._segments, []
+        self._events = 0
+        try:
+            await users_repo.bulk_increment(batch)
+        except Exception as e:
+            print(f"Score flush failed, will retry: {e}")
+            for key, delta in batch.items():
+                self._pending[key] += delta
+            self._segments = segments + self._segments
+            return
+        finally:
+            self._inflight = {}
+        for path in segments:
+            os.remove(path)
+        if self.on_flushed is not None:
+            for username in {username for username, _ in batch}:
+                self.on_flushed(username)
+        self.flushes += 1
+        self.writes += len(batch)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        self._replay()
+        await self.flush()
+        self._timer = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+        await self.flush()
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+
+    def stats(self) -> dict:
+        return {
+            "pending_keys": len(self._pending),
+            "inflight_keys": len(self._inflight),
+            "increments": self.increments,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "unflushed_segments": len(self._segments),
+        }
+
+
+score_buffer = ScoreBuffer(SCORE_WAL_PATH, SCORE_FLUSH_INTERVAL, SCORE_FLUSH_MAX_EVENTS)
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from utils.all_helper import SUPPORTED_LANGUAGES
+
+# answers kept per language; 0 turns the cache off
+SEMANTIC_CACHE_CAPACITY = int(os.getenv('SEMANTIC_CACHE_CAPACITY', '512'))
+# cosine similarity of the normalised queries needed to reuse an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.9'))
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', 'semantic_cache.json')
+# write the file after this many new answers (and always on shutdown)
+SEMANTIC_CACHE_SAVE_EVERY = int(os.getenv('SEMANTIC_CACHE_SAVE_EVERY', '20'))
+
+DIMENSIONS = 1024
+NGRAM = 3
+# the IDF weights drift as answers come and go; the matrix is re-weighted this often
+REWEIGHT_EVERY = 32
+
+_LEADING_PHRASES = re.compile(
+    r"^(?:please |can you |could you )?"
+    r"(?:how (?:do|would|can|should) (?:i|you|we) say|how to say|how do you call|what is|what's|what are"
+    r"|what does|what do|translate|tell me|say)\b"
+)
+
+
+def normalise(query: str, language: str = "") -> str:
+    """The query case-folded, without punctuation, the language name or question boilerplate."""
+    text = unicodedata.normalize("NFC", query).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    if language:
+        text = re.sub(rf"\b(?:in |to |into )?{re.escape(language.casefold())}\b", " ", text)
+    text = _LEADING_PHRASES.sub(" ", text)
+    text = re.sub(r"\b(?:please|mean|means)\b", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def same_word_order(a: str, b: str) -> bool:
+    """Whether the words two queries share come in the same order.
+
+    Trigrams barely notice swapped words, so "my brother is taller than my
+    sister" and "my sister is taller than my brother" look alike to them;
+    this check tells the two apart.
+    """
+    words_a, words_b = a.split(), b.split()
+    shared = set(words_a) & set(words_b)
+    return list(dict.fromkeys(w for w in words_a if w in shared)) == list(dict.fromkeys(w for w in words_b if w in shared))
+
+
+def term_frequencies(text: str) -> np.ndarray:
+    """Hashed character trigram counts (log-scaled) of a normalised query."""
+    padded = f" {text} "
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    for start in range(len(padded) - NGRAM + 1):
+        vector[zlib.crc32(padded[start:start + NGRAM].encode()) % DIMENSIONS] += 1
+    np.log1p(vector, out=vector)
+    return vector
+
+
+class _Shard:
+    """Cached answers for one language: raw trigram rows, their TF-IDF unit vectors, and LRU ticks."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.tf = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        self.vectors = np.zeros((capacity, DIMENSIONS), dtype=np.float32)
+        self.document_frequency = np.zeros(DIMENSIONS, dtype=np.float32)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.queries = []
+        self.answers = []
+        self.idf = np.ones(DIMENSIONS, dtype=np.float32)
+        self._since_reweight = 0
+
+    def __len__(self):
+        return len(self.queries)
+
+    def _weigh(self, tf: np.ndarray) -> np.ndarray:
+        vector = tf * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _reweight(self):
+        count = len(self)
+        self.idf = (np.log((count + 1) / (self.document_frequency + 1)) + 1).astype(np.float32)
+        weighted = self.tf[:count] * self.idf
+        norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.vectors[:count] = weighted / norms
+        self._since_reweight = 0
+
+    def nearest(self, text: str, tf: np.ndarray, threshold: float):
+        """The most similar cached query at or above the threshold with the same word order, or None."""
+        if not self.queries:
+            return None
+        similarities = self.vectors[:len(self)] @ self._weigh(tf)
+        candidates = np.flatnonzero(similarities >= threshold)
+        for row in candidates[np.argsort(-similarities[candidates])]:
+            if same_word_order(text, self.queries[row]):
+                return int(row)
+        return None
+
+    def add(self, query: str, tf: np.ndarray, answer, tick: int) -> bool:
+        """Store an answer; returns True if the least recently used one was evicted for it."""
+        evicted = len(self) >= self.capacity
+        if evicted:
+            row = int(np.argmin(self.last_used[:len(self)]))
+            self.document_frequency -= self.tf[row] > 0
+            self.queries[row] = query
+            self.answers[row] = answer
+        else:
+            row = len(self)
+            self.queries.append(query)
+            self.answers.append(answer)
+        self.tf[row] = tf
+        self.document_frequency += tf > 0
+        self.last_used[row] = tick
+        self._since_reweight += 1
+        if self._since_reweight >= REWEIGHT_EVERY or len(self) <= REWEIGHT_EVERY:
+            self._reweight()
+        else:
+            self.vectors[row] = self._weigh(tf)
+        return evicted
+
+    def entries(self) -> list:
+        order = np.argsort(self.last_used[:len(self)])
+        return [{"query": self.queries[row], "answer": self.answers[row]} for row in order]
+
+
+class SemanticCache:
+    """Answers to near-identical questions, per language, matched by trigram TF-IDF cosine similarity.
+
+    Everything is local: a query is normalised, hashed into character
+    trigrams and compared with one matrix product against the cached queries
+    of its language; a match must also keep the shared words in the same
+    order. Only the given languages are cached, each keeping at most
+    `capacity` answers and evicting the least recently used. The answers are
+    saved to a JSON file off the event loop and re-embedded by load() on the
+    next start.
+    """
+
+    def __init__(self, capacity: int, threshold: float, path: str, save_every: int, languages=SUPPORTED_LANGUAGES):
+        self.capacity = capacity
+        self.languages = {language.upper() for language in languages}
+        self.threshold = threshold
+        self.path = path
+        self.save_every = max(save_every, 1)
+        self._lock = threading.Lock()
+        # saves run on executor threads; one file write at a time
+        self._write_lock = threading.Lock()
+        self._shards = None
+        self._tick = 0
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _load(self):
+        if self._shards is not None:
+            return
+        self._shards = {}
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not read semantic cache: {e}")
+            return
+        for language, entries in saved.items():
+            if language not in self.languages:
+                continue
+            # oldest first, so the recency order survives the restart
+            for entry in entries[-self.capacity:]:
+                self._add(language, entry["query"], entry["answer"])
+
+    def load(self):
+        """Read the saved answers; called from the lifespan in a thread, otherwise on first use."""
+        with self._lock:
+            self._load()
+
+    def _shard(self, language: str) -> _Shard:
+        if language not in self._shards:
+            self._shards[language] = _Shard(self.capacity)
+        return self._shards[language]
+
+    def _add(self, language: str, query: str, answer) -> bool:
+        self._tick += 1
+        return self._shard(language).add(query, term_frequencies(query), answer, self._tick)
+
+    def get(self, language: str, query: str):
+        language = language.upper()
+        # every new language would allocate a shard, so free-form language names are not cached
+        if not self.enabled or language not in self.languages:
+            return None
+        text = normalise(query, language)
+        if not text:
+            return None
+        with self._lock:
+            self._load()
+            shard = self._shards.get(language)
+            row = shard.nearest(text, term_frequencies(text), self.threshold) if shard else None
+            if row is None:
+                self.misses += 1
+                return None
+            self._tick += 1
+            shard.last_used[row] = self._tick
+            self.hits += 1
+            return shard.answers[row]
+
+    def put(self, language: str, query: str, answer):
+        language = language.upper()
+        if not self.enabled or language not in self.languages:
+            return
+        text = normalise(query, language)
+        if not text:
+            return
+        with self._lock:
+            self._load()
+            shard = self._shards.get(language)
+            row = shard.nearest(text, term_frequencies(text), self.threshold) if shard else None
+            if row is not None:
+                # a concurrent miss for the same question already stored an answer; refresh it
+                shard.answers[row] = answer
+                return
+            if self._add(language, text, answer):
+                self.evictions += 1
+            self.stores += 1
+            self._unsaved += 1
+            snapshot = self._snapshot() if self._unsaved >= self.save_every else None
+        if snapshot is None:
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+        except RuntimeError:
+            self._write(snapshot)
+
+    def _snapshot(self):
+        # taken under the lock, so the write itself never holds up get/put
+        if not self.path or self._shards is None:
+            return None
+        self._unsaved = 0
+        return {language: shard.entries() for language, shard in self._shards.items()}
+
+    def _write(self, snapshot: dict):
+        with self._write_lock:
+            try:
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"Could not write semantic cache: {e}")
+
+    def save(self):
+        with self._lock:
+            snapshot = self._snapshot() if self._unsaved else None
+        if snapshot is not None:
+            self._write(snapshot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = {language: len(shard) for language, shard in (self._shards or {}).items()}
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": sizes,
+        }
+
+
+semantic_cache = SemanticCache(
+    SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_SAVE_EVERY
+)
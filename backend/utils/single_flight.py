@@ -0,0 +1,76 @@
+import asyncio
+import copy
+import json
+import os
+from collections import defaultdict
+
+from utils.genai_executor import run_genai
+from utils.all_helper import SUPPORTED_LANGUAGES, LEVELS
+
+# helpers (by function name) that always get their own Gemini call because every
+# user must get a different result (a personal story); the rest share identical in-flight calls
+SINGLE_FLIGHT_OPT_OUT = {
+    name.strip()
+    for name in os.getenv('SINGLE_FLIGHT_OPT_OUT', 'generate_stories,generate_story_opening').split(',')
+    if name.strip()
+}
+
+# arguments compared case- and space-insensitively; any other text must match exactly
+_KEYWORDS = {word.casefold() for word in (*SUPPORTED_LANGUAGES, *LEVELS)}
+
+
+def _normalise(value):
+    if isinstance(value, str):
+        keyword = " ".join(value.casefold().split())
+        return keyword if keyword in _KEYWORDS else value
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one execution.
+
+    The first caller (the leader) starts the call as its own task; callers
+    arriving while it runs await the same task and each get a copy of its
+    result (or its exception). A leader whose request is cancelled does not
+    cancel the call for the others.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._counts = defaultdict(lambda: {"calls": 0, "executions": 0, "coalesced": 0})
+
+    async def do(self, feature: str, key, make_call):
+        counts = self._counts[feature]
+        counts["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            counts["executions"] += 1
+            task = asyncio.ensure_future(make_call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            return await asyncio.shield(task)
+        counts["coalesced"] += 1
+        result = await asyncio.shield(task)
+        # the leader's caller may mutate its result (e.g. build a story doc from it)
+        return copy.deepcopy(result)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "features": {
+                feature: {**counts, "coalesce_ratio": counts["coalesced"] / counts["calls"] if counts["calls"] else 0.0}
+                for feature, counts in self._counts.items()
+            },
+        }
+
+
+genai_flights = SingleFlight()
+
+
+async def run_genai_shared(func, *args):
+    """run_genai, but concurrent calls of func with equal (normalised) arguments share one call."""
+    feature = getattr(func, "__name__", repr(func))
+    if feature in SINGLE_FLIGHT_OPT_OUT:
+        return await run_genai(func, *args)
+    key = (func, tuple(_normalise(arg) for arg in args))
+    return await genai_flights.do(feature, key, lambda: run_genai(func, *args))
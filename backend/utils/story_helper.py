@@ -1,35 +1,46 @@
-import dotenv
 import os
-import google.generativeai as genai
-import json
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
-from datetime import datetime
+import asyncio
+import time
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
 from utils.all_helper import determine_user_level
-import google.generativeai as genai
-import json
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
+from utils.genai_executor import run_genai, stream_genai
+from utils.single_flight import run_genai_shared
+from utils.genai_scheduler import background_priority
+from utils.metrics import LLM_FALLBACKS
+from utils.streaming import IncrementalJSONFields
+from utils.feedback_engine import aggregate_final_feedback
+from utils.narration_scorer import narration_scorer, local_feedback
+from utils.llm import invoke_json, stream_json
+from utils.llm_providers import get_provider
+from basemodels.allpydmodels import GeneratedStory, StoryOpening, StoryContinuation, NarrationEvaluation, FinalFeedback
+from database import stories_repo, users_repo, story_feedback_repo
 
-# Database setup
-dotenv.load_dotenv()
-uri = os.getenv('MONGO_URI')
-client = MongoClient(uri, server_api=ServerApi('1'))
-storydb = client["story_db"]
+# progressive mode returns part 1 right away and writes parts 2-5 in the background
+STORY_PROGRESSIVE = os.getenv('STORY_PROGRESSIVE', '1') == '1'
+# how long /storynarrate waits for a part that is still being generated
+STORY_PART_WAIT = float(os.getenv('STORY_PART_WAIT', '15'))
+STORY_PART_POLL = 0.25
+# final feedback is computed locally; set to 1 to also have Gemini write a summary in the background
+FINAL_FEEDBACK_LLM = os.getenv('FINAL_FEEDBACK_LLM', '0') == '1'
+# a progressive story whose writer has not renewed its lease for this long is considered abandoned
+# (e.g. the worker was restarted) and is finished with fallback parts
+STORY_COMPLETION_LEASE = float(os.getenv('STORY_COMPLETION_LEASE', str(STORY_PART_WAIT * 2)))
+# the writer renews the lease this often while its stream is open, parts or not
+STORY_LEASE_HEARTBEAT = STORY_COMPLETION_LEASE / 3
+# narrations are scored locally; Gemini's qualitative feedback is "off", "background"
+# (stored on the part later, only used by the final feedback) or "inline" (waited for)
+NARRATION_FEEDBACK_LLM = os.getenv('NARRATION_FEEDBACK_LLM', 'off')
+# longest the end of a story waits for background feedback still being written
+NARRATION_FEEDBACK_WAIT = float(os.getenv('NARRATION_FEEDBACK_WAIT', '10'))
 
-#gemini model
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-model = genai.GenerativeModel('gemini-2.5-flash')
-
-#gemini model
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-# 2025-UPDATE: Using standard flash model and adding fallback
-model = genai.GenerativeModel('gemini-2.5-flash')
+#LLM provider, shared with all_helper
+model = get_provider()
 
 
 #generating stories
-def generate_stories(language: str, level: str) -> dict:
-    prompt = f"""Generate a 5-part story in {language} for {level} level language learners.
+def story_prompt(language: str, level: str) -> str:
+    return f"""Generate a 5-part story in {language} for {level} level language learners.
     Each part should be 2-3 sentences long and simple enough to be illustrated.
     Return only a JSON object with this exact structure:
     {{
@@ -45,90 +56,418 @@ def generate_stories(language: str, level: str) -> dict:
             ... (repeat for all 5 parts)
         ]
     }}"""
-    
 
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Story): {e} - Returning Mock Data")
-        return {
-            "title": f"The Adventure ({language} Mock)",
-            "title_english": "The Adventure",
-            "parts": [
-                {
-                    "part_number": 1,
-                    "content": f"This is part 1 of a mock story in {language}.",
-                    "translation": "This is part 1 of a mock story in English.",
-                    "description": "A calm scene."
-                },
-                {
-                    "part_number": 2,
-                    "content": f"This is part 2 of a mock story in {language}.",
-                    "translation": "This is part 2 of a mock story in English.",
-                    "description": "An exciting scene."
-                },
-                {
-                    "part_number": 3,
-                    "content": f"This is part 3 of a mock story in {language}.",
-                    "translation": "This is part 3 of a mock story in English.",
-                    "description": "A mysterious scene."
-                },
-                {
-                    "part_number": 4,
-                    "content": f"This is part 4 of a mock story in {language}.",
-                    "translation": "This is part 4 of a mock story in English.",
-                    "description": "A happy scene."
-                },
-                {
-                    "part_number": 5,
-                    "content": f"This is part 5 of a mock story in {language}.",
-                    "translation": "This is part 5 of a mock story in English.",
-                    "description": "A conclusive scene."
-                }
-            ]
-        }
+
+def mock_story(language: str) -> dict:
+    return {
+        "title": f"The Adventure ({language} Mock)",
+        "title_english": "The Adventure",
+        "parts": [
+            {
+                "part_number": 1,
+                "content": f"This is part 1 of a mock story in {language}.",
+                "translation": "This is part 1 of a mock story in English.",
+                "description": "A calm scene."
+            },
+            {
+                "part_number": 2,
+                "content": f"This is part 2 of a mock story in {language}.",
+                "translation": "This is part 2 of a mock story in English.",
+                "description": "An exciting scene."
+            },
+            {
+                "part_number": 3,
+                "content": f"This is part 3 of a mock story in {language}.",
+                "translation": "This is part 3 of a mock story in English.",
+                "description": "A mysterious scene."
+            },
+            {
+                "part_number": 4,
+                "content": f"This is part 4 of a mock story in {language}.",
+                "translation": "This is part 4 of a mock story in English.",
+                "description": "A happy scene."
+            },
+            {
+                "part_number": 5,
+                "content": f"This is part 5 of a mock story in {language}.",
+                "translation": "This is part 5 of a mock story in English.",
+                "description": "A conclusive scene."
+            }
+        ]
+    }
 
 
-async def generate_and_start_story(user_id: str, language: str, level: str) -> dict:
-    story_data = generate_stories(language, level)
-    
-    # Delete all stories in active_stories collection for this user
-    storydb.active_stories.delete_many({"user_id": user_id})
+def generate_stories(language: str, level: str) -> dict:
+    prompt = story_prompt(language, level)
     
-    story_doc = {
+    return invoke_json(
+        model, "story", prompt, GeneratedStory, lambda: mock_story(language), last_good_key=(language, level)
+    )
+
+
+#streams the raw text of a generate_stories answer chunk by chunk
+def stream_stories(language: str, level: str):
+    yield from stream_json(
+        model, "story", story_prompt(language, level), GeneratedStory,
+        lambda: mock_story(language), last_good_key=(language, level)
+    )
+
+
+#first call of a progressive story: title and part 1 only
+def generate_story_opening(language: str, level: str) -> dict:
+    prompt = f"""Generate the opening of a 5-part story in {language} for {level} level language learners.
+    Each part should be 2-3 sentences long and simple enough to be illustrated.
+    Write only the title and part 1 now.
+    Return only a JSON object with this exact structure:
+    {{
+        "title": "story title in {language}",
+        "title_english": "story title in English",
+        "part": {{
+            "part_number": 1,
+            "content": "story part in {language}",
+            "translation": "english translation",
+            "description": "scene description for AI illustration"
+        }}
+    }}"""
+
+    return invoke_json(
+        model, "story_opening", prompt, StoryOpening, lambda: mock_story_opening(language),
+        last_good_key=(language, level)
+    )
+
+
+def mock_story_opening(language: str) -> dict:
+    story = mock_story(language)
+    return {
+        "title": story["title"],
+        "title_english": story["title_english"],
+        "part": story["parts"][0]
+    }
+
+
+#streams parts after the ones already written, with those as context
+def stream_story_continuation(language: str, level: str, title: str, parts: list):
+    story_so_far = "\n".join(f"Part {part['part_number']}: {part['content']}" for part in parts)
+    first = len(parts) + 1
+    prompt = f"""Continue this {language} story for {level} level language learners.
+    Title: {title}
+    Story so far:
+    {story_so_far}
+
+    Write parts {first} to 5 so that the story comes to a satisfying end.
+    Each part should be 2-3 sentences long and simple enough to be illustrated.
+    Return only a JSON object with this exact structure:
+    {{
+        "parts": [
+            {{
+                "part_number": {first},
+                "content": "story part in {language}",
+                "translation": "english translation",
+                "description": "scene description for AI illustration"
+            }},
+            ... (repeat up to part 5)
+        ]
+    }}"""
+    yield from stream_json(
+        model, "story_continuation", prompt, StoryContinuation,
+        lambda: {"parts": mock_story(language)["parts"][len(parts):]}
+    )
+
+
+def story_part(part: dict) -> dict:
+    return {
+        "part_number": part["part_number"],
+        "content": part["content"],
+        "translation": part["translation"],
+        "description": part["description"],
+        "user_narration": None
+    }
+
+
+def build_story_doc(user_id, language: str, level: str, story_data: dict, status: str = "active") -> dict:
+    return {
         "user_id": user_id,
         "language": language,
         "level": level,
+        "status": status,
         "title": story_data["title"],
         "title_english": story_data["title_english"],
         "created_at": datetime.utcnow(),
         "current_part": 1,
         "completed": False,
-        "parts": [
-            {
-                "part_number": part["part_number"],
-                "content": part["content"],
-                "translation": part["translation"],
-                "description": part["description"],
-                "user_narration": None
-            }
-            for part in story_data["parts"]
-        ]
+        "parts": [story_part(part) for part in story_data["parts"]]
     }
-    
-    result = storydb.active_stories.insert_one(story_doc)
+
+
+# stories are prefetched once the active one reaches one of these parts
+PREFETCH_AT_PARTS = (3, 4)
+
+
+class StoryPrefetcher:
+    """Generates a user's next story in the background while they narrate the current one."""
+
+    def __init__(self):
+        self._inflight = set()
+        self._tasks = set()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.prefetched = 0
+        self.failed = 0
+
+    async def maybe_prefetch(self, user_id, language: str, reached_part: int):
+        if reached_part not in PREFETCH_AT_PARTS or user_id in self._inflight:
+            return
+        if await stories_repo.has_pending(user_id):
+            return
+        self._inflight.add(user_id)
+        task = asyncio.get_running_loop().create_task(self._prefetch(user_id, language))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, user_id, language: str):
+        background_priority()
+        try:
+            # level from the points the user has now, which is what /storystart will use
+            user = await users_repo.get_by_id(user_id, {"languages": 1})
+            level = determine_user_level(user["languages"][language])
+            story_data = await run_genai(generate_stories, language, level)
+            if "(Mock)" in story_data["title"]:
+                self.failed += 1
+                return
+            await stories_repo.save_pending(
+                user_id, build_story_doc(user_id, language, level, story_data, status="pending")
+            )
+            self.prefetched += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Story prefetch error: {e}")
+        finally:
+            self._inflight.discard(user_id)
+
+    async def take(self, user_id, language: str, level: str):
+        story_doc = await stories_repo.promote_pending(user_id, language, level)
+        if story_doc:
+            self.hits += 1
+            return story_doc
+        self.misses += 1
+        # whatever is left was generated for another language or level
+        result = await stories_repo.discard_pending(user_id)
+        self.discarded += result.deleted_count
+        return None
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        taken = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / taken if taken else 0.0,
+            "miss_rate": self.misses / taken if taken else 0.0,
+            "prefetched": self.prefetched,
+            "discarded": self.discarded,
+            "failed": self.failed,
+            "inflight": len(self._inflight),
+        }
+
+
+story_prefetcher = StoryPrefetcher()
+
+
+class ProgressiveStories:
+    """Writes parts 2-5 of progressively generated stories into their documents."""
+
+    def __init__(self):
+        self._tasks = set()
+        # the writer of each user's current story; a user has one active story at a time
+        self._writers = {}
+        self.completed = 0
+        self.failed = 0
+        self.superseded = 0
+        self.part_waits = 0
+        self.part_wait_timeouts = 0
+        self.abandoned = 0
+
+    def complete_in_background(self, user_id, story_id, language: str, level: str, title: str, first_part: dict):
+        self.cancel_for(user_id)
+        task = asyncio.get_running_loop().create_task(
+            self._complete(story_id, language, level, title, first_part)
+        )
+        self._tasks.add(task)
+        self._writers[user_id] = task
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda done: self._forget(user_id, done))
+
+    def _forget(self, user_id, task):
+        if self._writers.get(user_id) is task:
+            del self._writers[user_id]
+
+    def cancel_for(self, user_id):
+        """Stop writing the user's previous story: it has been replaced, so its parts are not needed."""
+        task = self._writers.pop(user_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+            self.superseded += 1
+
+    @staticmethod
+    def lease() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=STORY_COMPLETION_LEASE)
+
+    async def fill_with_mock(self, story_id, language: str, written: int):
+        """Finish a story with mock parts after its first `written` parts."""
+        rest = [story_part(part) for part in mock_story(language)["parts"][written:]]
+        await stories_repo.fill_parts(story_id, rest)
+
+    async def _renew_lease(self, story_id):
+        while True:
+            await asyncio.sleep(STORY_LEASE_HEARTBEAT)
+            try:
+                await stories_repo.extend_lease(story_id, self.lease())
+            except Exception as e:
+                print(f"Story lease renewal failed: {e}")
+
+    async def _complete(self, story_id, language: str, level: str, title: str, first_part: dict):
+        parts = [first_part]
+        # a slow stream can go longer than the lease between two parts
+        heartbeat = asyncio.get_running_loop().create_task(self._renew_lease(story_id))
+        try:
+            # one streamed call for the rest; each part is saved as soon as it parses
+            parser = IncrementalJSONFields(stream_arrays=("parts",))
+            context = [dict(first_part)]
+            async for chunk in stream_genai(stream_story_continuation, language, level, title, context):
+                for event in parser.feed(chunk):
+                    if event[0] == "item" and len(parts) < 5:
+                        part = story_part({**event[3], "part_number": len(parts) + 1})
+                        await stories_repo.append_part(story_id, part, self.lease())
+                        parts.append(part)
+            if len(parts) < 5:
+                raise ValueError(f"continuation stopped after part {len(parts)}")
+            self.completed += 1
+        except asyncio.CancelledError:
+            # shutting down, or replaced by the user's next story: leave a complete story rather
+            # than one /storynarrate waits on for good (a replaced story is gone and this is a no-op)
+            LLM_FALLBACKS.labels("story_continuation", "mock").inc()
+            await self.fill_with_mock(story_id, language, len(parts))
+            raise
+        except Exception as e:
+            print(f"GenAI Error (Story Continuation): {e} - Filling with Mock Data")
+            LLM_FALLBACKS.labels("story_continuation", "mock").inc()
+            self.failed += 1
+            await self.fill_with_mock(story_id, language, len(parts))
+        finally:
+            heartbeat.cancel()
+
+    async def wait_for_part(self, user_id, story: dict, index: int):
+        """Return the active story once parts[index] exists, or None after STORY_PART_WAIT seconds."""
+        if len(story["parts"]) > index:
+            return story
+        self.part_waits += 1
+        deadline = time.monotonic() + STORY_PART_WAIT
+        while time.monotonic() < deadline:
+            if story.get("completing_until") is None or story["completing_until"] < datetime.utcnow():
+                # nobody is writing this story any more (its worker died mid-generation)
+                self.abandoned += 1
+                LLM_FALLBACKS.labels("story_continuation", "mock").inc()
+                await self.fill_with_mock(story["_id"], story["language"], len(story["parts"]))
+                story = await stories_repo.get_for_user(user_id)
+                return story if story and len(story["parts"]) > index else None
+            await asyncio.sleep(STORY_PART_POLL)
+            story = await stories_repo.get_for_user(user_id)
+            if not story:
+                break
+            if len(story["parts"]) > index:
+                return story
+        self.part_wait_timeouts += 1
+        return None
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "generating": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "superseded": self.superseded,
+            "part_waits": self.part_waits,
+            "part_wait_timeouts": self.part_wait_timeouts,
+            "abandoned": self.abandoned,
+        }
+
+
+progressive_stories = ProgressiveStories()
+
+
+async def generate_and_start_story(user_id: str, language: str, level: str) -> dict:
+    # Delete all active stories for this user (a prefetched pending story is kept)
+    progressive_stories.cancel_for(user_id)
+    await stories_repo.delete_for_user(user_id)
+
+    story_doc = await story_prefetcher.take(user_id, language, level)
+    if story_doc is not None:
+        story_id = story_doc["_id"]
+    elif STORY_PROGRESSIVE:
+        opening = await run_genai_shared(generate_story_opening, language, level)
+        story_data = {**opening, "parts": [opening["part"]]}
+        story_doc = {**build_story_doc(user_id, language, level, story_data), "completing_until": ProgressiveStories.lease()}
+        result = await stories_repo.create(story_doc)
+        story_id = result.inserted_id
+        progressive_stories.complete_in_background(
+            user_id, story_id, language, level, story_doc["title"], story_doc["parts"][0]
+        )
+    else:
+        story_data = await run_genai_shared(generate_stories, language, level)
+        story_doc = build_story_doc(user_id, language, level, story_data)
+        result = await stories_repo.create(story_doc)
+        story_id = result.inserted_id
+
     return {
-        "story_id": str(result.inserted_id),
+        "story_id": str(story_id),
         "current_part": story_doc["parts"][0],
         "total_parts": 5
     }
 
+async def stream_and_start_story(user_id, language: str, level: str):
+    """Like generate_and_start_story, but yields (event, data) as the story is generated.
+
+    Emits a "field" event for title and title_english, a "part" event per
+    story part as soon as it is complete, and "done" with the story_id once
+    the story has been saved.
+    """
+    progressive_stories.cancel_for(user_id)
+    await stories_repo.delete_for_user(user_id)
+
+    story_doc = await story_prefetcher.take(user_id, language, level)
+    if story_doc is not None:
+        for name in ("title", "title_english"):
+            yield "field", {"name": name, "value": story_doc[name]}
+        for part in story_doc["parts"]:
+            yield "part", part
+        yield "done", {"story_id": str(story_doc["_id"]), "total_parts": 5}
+        return
+
+    parser = IncrementalJSONFields(stream_arrays=("parts",))
+    async for chunk in stream_genai(stream_stories, language, level):
+        for event in parser.feed(chunk):
+            if event[0] == "field":
+                yield "field", {"name": event[1], "value": event[2]}
+            else:
+                yield "part", story_part(event[3])
+
+    story_data = parser.result
+    if not parser.done or len(story_data.get("parts", [])) != 5:
+        raise ValueError("Story stream ended before the story was complete")
+    story_doc = build_story_doc(user_id, language, level, story_data)
+    result = await stories_repo.create(story_doc)
+    yield "done", {"story_id": str(result.inserted_id), "total_parts": 5}
+
 def evaluate_user_narration(original_text: str, user_narration: str, language: str) -> dict:
     prompt = f"""Compare the following original text in {language} with user's narration:
     Original: {original_text}
@@ -143,29 +482,22 @@ def evaluate_user_narration(original_text: str, user_narration: str, language: s
         "improvement_areas": ["area1", "area2", "area3"],
         "positive_points": ["point1", "point2", "point3"]
     }}"""
-    
 
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Feedback): {e} - Returning Mock Data")
-        return {
-            "accuracy_score": "85",
-            "pronunciation_feedback": "Good pronunciation (Mock)",
-            "grammar_feedback": "Check your verb agreement (Mock)",
-            "vocabulary_feedback": "Good use of words (Mock)",
-            "improvement_areas": ["Speaking speed", "Intonation"],
-            "positive_points": ["Confidence", "Clarity"]
-        }
+    return invoke_json(model, "narration_feedback", prompt, NarrationEvaluation, mock_narration_feedback)
+
+
+def mock_narration_feedback() -> dict:
+    return {
+        "accuracy_score": "85",
+        "pronunciation_feedback": "Good pronunciation (Mock)",
+        "grammar_feedback": "Check your verb agreement (Mock)",
+        "vocabulary_feedback": "Good use of words (Mock)",
+        "improvement_areas": ["Speaking speed", "Intonation"],
+        "positive_points": ["Confidence", "Clarity"]
+    }
 
 async def save_part_narration(user_id: str, transcription: str) -> dict:
-    active_story = storydb.active_stories.find_one({"user_id": user_id})
+    active_story = await stories_repo.get_for_user(user_id)
     
     if not active_story:
         raise ValueError("No active story found")
@@ -174,20 +506,32 @@ async def save_part_narration(user_id: str, transcription: str) -> dict:
     
     # Handle the case when all parts are completed
     if current_part > 5:
-        final_feedback = generate_final_feedback(active_story)
-        storydb.active_stories.delete_many({"user_id": user_id})
-        return {
-            "status": "completed",
-            "final_feedback": final_feedback
-        }
+        return await finish_story(user_id, active_story)
 
     original_part = active_story["parts"][current_part - 1]
-    
-    feedback = evaluate_user_narration(
-        original_part["content"],
-        transcription,
-        active_story["language"]
-    )
+    story_id = active_story["_id"]
+    language = active_story["language"]
+
+    feedback = local_feedback(await narration_scorer.score(original_part["content"], transcription, language))
+    if NARRATION_FEEDBACK_LLM == "inline":
+        evaluation = run_genai_shared(evaluate_user_narration, original_part["content"], transcription, language)
+    else:
+        evaluation = _no_llm_feedback()
+    if current_part < 5 and len(active_story["parts"]) <= current_part:
+        # progressive story: the next part may still be generating, wait while evaluating
+        llm_feedback, active_story = await asyncio.gather(
+            evaluation, progressive_stories.wait_for_part(user_id, active_story, current_part)
+        )
+        if active_story is None:
+            # nothing was recorded, so the client can simply resend this narration
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The next part of the story is still being written, please try again"
+            )
+    else:
+        llm_feedback = await evaluation
+    if llm_feedback is not None:
+        feedback = with_local_score(llm_feedback, feedback)
     
     narration_data = {
         "transcription": transcription,
@@ -203,22 +547,165 @@ async def save_part_narration(user_id: str, transcription: str) -> dict:
         }
     }
     
-    storydb.active_stories.update_one({"user_id": user_id}, update_data)
+    await stories_repo.update_for_user(user_id, update_data)
+    await story_prefetcher.maybe_prefetch(user_id, active_story["language"], next_part)
+    # after part 5 the story is closed right away, so there is nothing to attach feedback to
+    feedback_pending = NARRATION_FEEDBACK_LLM == "background" and next_part <= 5
+    if feedback_pending:
+        narration_feedback.attach_in_background(
+            story_id, current_part - 1, original_part["content"], transcription, language, feedback
+        )
     
     # If we've just completed part 5, return completed status
     if next_part > 5:
-        final_feedback = generate_final_feedback(active_story)
-        storydb.active_stories.delete_many({"user_id": user_id})
-        return {
-            "status": "completed",
-            "final_feedback": final_feedback
-        }
+        active_story["parts"][current_part - 1]["user_narration"] = narration_data
+        return await finish_story(user_id, active_story)
     
     # Return the next part if story is still in progress
     return {
         "status": "in_progress",
         "next_part": active_story["parts"][next_part - 1],
-        "current_feedback": feedback
+        "current_feedback": feedback,
+        "feedback_pending": feedback_pending
+    }
+
+
+async def _no_llm_feedback():
+    return None
+
+
+def with_local_score(llm_feedback: dict, local: dict) -> dict:
+    """Gemini's qualitative feedback with the deterministic local score and alignment."""
+    if "(Mock)" in str(llm_feedback):
+        # the call failed and returned placeholder text; the local feedback is better
+        return local
+    return {**llm_feedback, "accuracy_score": local["accuracy_score"], "alignment": local["alignment"]}
+
+
+class NarrationFeedback:
+    """Gemini's qualitative feedback on a narrated part, written onto the part in the background.
+
+    The client only ever sees it through the final feedback, so finish_story
+    waits for the story's outstanding attaches (settle) before aggregating.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+        self._by_story = {}
+        self.attached = 0
+        self.failed = 0
+        self.settle_timeouts = 0
+
+    def attach_in_background(self, story_id, index: int, original: str, transcription: str, language: str, local: dict):
+        task = asyncio.get_running_loop().create_task(
+            self._attach(story_id, index, original, transcription, language, local)
+        )
+        self._tasks.add(task)
+        self._by_story.setdefault(story_id, set()).add(task)
+        task.add_done_callback(lambda done: self._forget(story_id, done))
+
+    def _forget(self, story_id, task):
+        self._tasks.discard(task)
+        story_tasks = self._by_story.get(story_id)
+        if story_tasks is not None:
+            story_tasks.discard(task)
+            if not story_tasks:
+                del self._by_story[story_id]
+
+    async def settle(self, story_id, timeout: float):
+        """Wait up to timeout for the feedback still being attached to a story."""
+        tasks = set(self._by_story.get(story_id, ()))
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            self.settle_timeouts += 1
+
+    async def _attach(self, story_id, index: int, original: str, transcription: str, language: str, local: dict):
+        background_priority()
+        try:
+            llm_feedback = await run_genai(evaluate_user_narration, original, transcription, language)
+            feedback = with_local_score(llm_feedback, local)
+            if feedback is not local:
+                await stories_repo.set_part_feedback(story_id, index, feedback)
+                self.attached += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Narration feedback error: {e}")
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "mode": NARRATION_FEEDBACK_LLM,
+            "running": len(self._tasks),
+            "attached": self.attached,
+            "failed": self.failed,
+            "settle_timeouts": self.settle_timeouts,
+        }
+
+
+narration_feedback = NarrationFeedback()
+
+
+class FinalFeedbackSummaries:
+    """Optional Gemini summary of a finished story, written in the background."""
+
+    def __init__(self):
+        self._tasks = set()
+        self.generated = 0
+        self.failed = 0
+
+    async def schedule(self, user_id, story: dict):
+        await story_feedback_repo.save(user_id, {"title": story["title"], "status": "pending", "summary": None})
+        task = asyncio.get_running_loop().create_task(self._summarise(user_id, story))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarise(self, user_id, story: dict):
+        background_priority()
+        try:
+            summary = await run_genai(generate_final_feedback, story)
+            await story_feedback_repo.save(user_id, {"title": story["title"], "status": "ready", "summary": summary})
+            self.generated += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"Final feedback summary error: {e}")
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": FINAL_FEEDBACK_LLM,
+            "running": len(self._tasks),
+            "generated": self.generated,
+            "failed": self.failed,
+        }
+
+
+final_feedback_summaries = FinalFeedbackSummaries()
+
+
+async def finish_story(user_id, story: dict) -> dict:
+    if NARRATION_FEEDBACK_LLM == "background":
+        # feedback attached since the story was read is only in the database
+        await narration_feedback.settle(story["_id"], NARRATION_FEEDBACK_WAIT)
+        story = await stories_repo.get_for_user(user_id) or story
+    # built from the per-part feedback already stored, no extra LLM round trip
+    final_feedback = aggregate_final_feedback(story)
+    await stories_repo.delete_for_user(user_id)
+    if FINAL_FEEDBACK_LLM:
+        await final_feedback_summaries.schedule(user_id, story)
+    return {
+        "status": "completed",
+        "final_feedback": final_feedback,
+        "summary_pending": FINAL_FEEDBACK_LLM
     }
 
 
@@ -235,22 +722,13 @@ def generate_final_feedback(story: dict) -> dict:
         "main_improvement_areas": ["area1", "area2"],
         "learning_recommendations": ["recommendation1", "recommendation2"]
     }}"""
-    
 
-    
-    try:
-        response = model.generate_content(prompt)
-        print(response.text)
-        cleaned_text = response.text.strip()
-        cleaned_text = cleaned_text.replace('```json\n', '').replace('\n```', '')
-        cleaned_text = cleaned_text.replace('```json', '').replace('```', '')
-        cleaned_text = ''.join(line.strip() for line in cleaned_text.splitlines())
-        return json.loads(cleaned_text)
-    except Exception as e:
-        print(f"GenAI Error (Final Feedback): {e} - Returning Mock Data")
-        return {
+    return invoke_json(
+        model, "final_feedback", prompt, FinalFeedback,
+        lambda: {
             "overall_score": "90",
             "key_strengths": ["Perseverance", "Vocabulary"],
             "main_improvement_areas": ["Complex grammar"],
             "learning_recommendations": ["Practice daily", "Read more"]
         }
+    )
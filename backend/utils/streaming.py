@@ -0,0 +1,116 @@
+import json
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONFields:
+    """Pulls top-level fields out of a JSON object while its text is still streaming in.
+
+    feed() returns the events that became parseable with the new chunk:
+    ("field", name, value) for a complete top-level value and, for names in
+    stream_arrays, ("item", name, index, value) per array element, so a
+    client can render parts[0] while parts[4] is still being generated.
+    Anything before the opening brace (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self, stream_arrays=()):
+        self.stream_arrays = set(stream_arrays)
+        self.result = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._items = None
+
+    def _skip(self, chars: str):
+        while self._pos < len(self._buf) and self._buf[self._pos] in chars:
+            self._pos += 1
+        return self._buf[self._pos] if self._pos < len(self._buf) else None
+
+    def _decode(self):
+        """Decode the value at the cursor, or return (None, False) if it is not complete yet."""
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except ValueError:
+            return None, False
+        # a number at the very end of the buffer may still be growing
+        if end == len(self._buf) and not isinstance(value, (str, dict, list)):
+            return None, False
+        self._pos = end
+        return value, True
+
+    def feed(self, chunk: str) -> list:
+        self._buf += chunk
+        events = []
+        while not self.done:
+            if self._state == "start":
+                start = self._buf.find("{", self._pos)
+                if start < 0:
+                    self._pos = len(self._buf)
+                    break
+                self._pos = start + 1
+                self._state = "key"
+
+            elif self._state == "key":
+                char = self._skip(_WHITESPACE + ",")
+                if char is None:
+                    break
+                if char == "}":
+                    self._pos += 1
+                    self.done = True
+                    break
+                key, complete = self._decode()
+                if not complete:
+                    break
+                self._key = key
+                self._state = "colon"
+
+            elif self._state == "colon":
+                char = self._skip(_WHITESPACE)
+                if char is None:
+                    break
+                self._pos += 1
+                self._state = "value"
+
+            elif self._state == "value":
+                char = self._skip(_WHITESPACE)
+                if char is None:
+                    break
+                if char == "[" and self._key in self.stream_arrays:
+                    self._pos += 1
+                    self._items = []
+                    self._state = "items"
+                    continue
+                value, complete = self._decode()
+                if not complete:
+                    break
+                self.result[self._key] = value
+                events.append(("field", self._key, value))
+                self._state = "key"
+
+            elif self._state == "items":
+                char = self._skip(_WHITESPACE + ",")
+                if char is None:
+                    break
+                if char == "]":
+                    self._pos += 1
+                    self.result[self._key] = self._items
+                    self._state = "key"
+                    continue
+                value, complete = self._decode()
+                if not complete:
+                    break
+                events.append(("item", self._key, len(self._items), value))
+                self._items.append(value)
+
+        # drop consumed text so repeated decode attempts stay cheap
+        if self._pos > 4096:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        return events
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
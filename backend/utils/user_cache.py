@@ -0,0 +1,85 @@
+import copy
+import os
+import threading
+
+from cachetools import TTLCache
+from fastapi import HTTPException, status
+
+from database import users_repo
+from utils.score_buffer import score_buffer
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+# other workers' writes are only seen once an entry expires, so keep this short
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+
+# everything the game endpoints need; never the password hash
+PROFILE_PROJECTION = {"_id": 1, "username": 1, "languages": 1}
+
+
+class UserProfileCache:
+    """In-process LRU+TTL cache of projected user profiles, written through on login and dropped once buffered scores land."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # bumped on every invalidation, so a read that raced one is not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, username: str):
+        with self._lock:
+            profile = self._cache.get(username)
+            if profile is not None:
+                self.hits += 1
+                return copy.deepcopy(profile)
+            self.misses += 1
+            generation = self._generation
+        profile = await users_repo.get_by_username(username, PROFILE_PROJECTION)
+        if profile is not None:
+            self.put(username, profile, generation)
+        return profile
+
+    def put(self, username: str, profile: dict, generation: int = None):
+        profile = {key: copy.deepcopy(profile[key]) for key in PROFILE_PROJECTION if key in profile}
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._cache[username] = profile
+
+    def invalidate(self, username: str):
+        with self._lock:
+            self._generation += 1
+            self._cache.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+user_profiles = UserProfileCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+# written scores are re-read rather than added to the cached value, which may
+# already have been loaded with them while the write was in flight
+score_buffer.on_flushed = user_profiles.invalidate
+
+
+async def get_user_profile(username: str) -> dict:
+    profile = await user_profiles.get(username)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    # include increments still waiting in the write-behind buffer
+    pending = score_buffer.pending_for(username)
+    if pending and "languages" in profile:
+        for language, delta in pending.items():
+            profile["languages"][language] = profile["languages"].get(language, 0) + delta
+    return profile